@@ -1,14 +1,18 @@
-import fnmatch
 import os
 import json
 import re
 import shutil
+import time
+from collections import deque
 from idn_config import Config
 from idn_directoryinfo import DirectoryChecker
 import core
-from idn_utils import readFile
+from idn_utils import readFile, Timer
 import wx
 from idn_erlang_utils import IsInclude, IsModule
+from idn_cache_index import ErlangCacheIndex
+from idn_cache_loader import CacheLoader
+from idn_cache_graph import IncludeGraph
 
 FILE = "file"
 NAME = "name"
@@ -29,120 +33,189 @@ VALUE = "value"
 MACROS = "macros"
 COMMENT = "comment"
 EXPORTED_TYPES = "exported_types"
+IS_GLOBAL_INCLUDE = "is_global_include"
+
+SWEEP_CACHE_MISSING = 0
+SWEEP_SOURCE_MISSING = 1
+SWEEP_STALE = 2
+
+
+STRINGS = {}
+
+def Intern(s):
+    """
+    Works for unicode strings from json too, unlike builtin intern.
+    """
+    return STRINGS.setdefault(s, s)
+
+def InternList(l):
+    """
+    Interns strings of (nested) list. Lists are kept mutable, completer copies and modifies them.
+    """
+    result = []
+    for s in l:
+        if isinstance(s, list):
+            s = InternList(s)
+        elif isinstance(s, basestring):
+            s = Intern(s)
+        result.append(s)
+    return result
+
+class Function(object):
+    __slots__ = ("module", "name", "arity", "params", "line", "types", "result",
+                 "docref", "exported", "bif", "comment", "file")
 
-
-class Function:
     def __init__(self, moduleData, module, name, arity, line, params, types, result, docref, exported, bif, comment):
-        self.moduleData = moduleData
         self.module = module
-        self.name = name
+        self.name = Intern(name)
         self.arity = arity
-        self.params = params
+        self.params = InternList(params)
         self.line = line
-        self.types = types
-        self.result = result
+        self.types = InternList(types)
+        self.result = InternList(result) if isinstance(result, list) else result
         self.docref = docref
         self.exported = exported
         self.bif = bif
         self.comment = comment
         self.file = moduleData.file
 
-class Record:
+class Record(object):
+    __slots__ = ("module", "name", "fields", "types", "line", "file")
+
     def __init__(self, moduleData, module, name, fields, types, line):
-        self.moduleData = moduleData
         self.module = module
-        self.name = name
-        self.fields = fields
-        self.types = types
+        self.name = Intern(name)
+        self.fields = InternList(fields)
+        self.types = InternList(types)
         self.line = line
         self.file = moduleData.file
 
-        self.fieldTypes = {}
-        for i in range(len(self.fields)):
-            self.fieldTypes[self.fields[i]] = self.types[i]
-
     def FieldsData(self):
-        return self.fieldTypes.items()
+        return zip(self.fields, self.types)
+
+class Macros(object):
+    __slots__ = ("module", "name", "value", "line", "file")
 
-class Macros:
     def __init__(self, moduleData, module, name, value, line):
-        self.moduleData = moduleData
         self.module = module
-        self.name = name
+        self.name = Intern(name)
         self.value = value
         self.line = line
         self.file = moduleData.file
 
-class ExportedType:
+class ExportedType(object):
+    __slots__ = ("module", "name", "types", "line", "file")
+
     def __init__(self, moduleData, module, name, types, line):
-        self.moduleData = moduleData
         self.module = module
-        self.name = name
+        self.name = Intern(name)
         self.types = types
         self.line = line
-        if moduleData:
-            self.file = moduleData.file
+        self.file = moduleData.file if moduleData else None
 
-class ModuleData:
+class ModuleData(object):
+    """
+    Only name, file and includes are read at load time. Functions, records, macroses and exported types
+    are built from raw json sections on first access, raw section is dropped after that.
+    """
     def __init__(self, module, data, srcFile, app):
         self.srcFile = srcFile
-        self.file = data[FILE]
-        self.module = module
-        self.app = app
-
-        self.data = data
+        self.file = Intern(data[FILE])
+        self.module = Intern(module)
+        self.app = Intern(app)
+
+        self.isGlobalInclude = bool(data.get(IS_GLOBAL_INCLUDE, False))
+        self.includes = set([(Intern(i[0]), Intern(i[1])) for i in data[INCLUDES]])
+
+        self.rawSections = {FUNS: data[FUNS], RECORDS_DATA: data[RECORDS_DATA],
+                            MACROS: data[MACROS], EXPORTED_TYPES: data[EXPORTED_TYPES]}
+        self.sections = {}
+
+    def _Section(self, section):
+        if section in self.sections:
+            return self.sections[section]
+        if not self.sections:
+            ErlangCache.materializedModules += 1
+        raw = self.rawSections.pop(section)
+        if section == FUNS:
+            result = self._BuildFunctions(raw)
+        elif section == RECORDS_DATA:
+            result = self._BuildRecords(raw)
+        elif section == MACROS:
+            result = self._BuildMacroses(raw)
+        else:
+            result = self._BuildExportedTypes(raw)
+        self.sections[section] = result
+        return result
 
-        self.functions = []
-        for funData in data[FUNS]:
+    def _BuildFunctions(self, raw):
+        functions = []
+        for funData in raw:
             isBif = funData[BIF] if BIF in funData else False
             comment = funData[COMMENT] if COMMENT in funData else ""
             docref = funData[DOCREF] if DOCREF in funData else None
-            fun = Function(self, module, funData[NAME], funData[ARITY],
+            fun = Function(self, self.module, funData[NAME], funData[ARITY],
                 funData[LINE], funData[PARAMS],  funData[TYPES], funData[RESULT],
                 docref, funData[EXPORTED], isBif, comment)
-
-            self.functions.append(fun)
-
-        self.records = []
-        for record in data[RECORDS_DATA]:
-            recordData = data[RECORDS_DATA][record]
-            self.records.append(Record(self, module, record, recordData[FIELDS], recordData[TYPES], recordData[LINE]))
-
-        self.macroses = []
-        for macros in data[MACROS]:
-            macData = data[MACROS][macros]
-            self.macroses.append(Macros(self, module, macros, macData[VALUE], macData[LINE]))
-
-        self.includes = set([(i[0], i[1]) for i in data[INCLUDES]])
-
-        self.exportedTypes = []
-        for expDype in data[EXPORTED_TYPES]:
-            expData = data[EXPORTED_TYPES][expDype]
-            self.exportedTypes.append(ExportedType(self, module, expDype, expData[TYPES], expData[LINE]))
+            functions.append(fun)
+        return functions
+
+    def _BuildRecords(self, raw):
+        records = []
+        for record in raw:
+            recordData = raw[record]
+            records.append(Record(self, self.module, record, recordData[FIELDS], recordData[TYPES], recordData[LINE]))
+        return records
+
+    def _BuildMacroses(self, raw):
+        macroses = []
+        for macros in raw:
+            macData = raw[macros]
+            macroses.append(Macros(self, self.module, macros, macData[VALUE], macData[LINE]))
+        return macroses
+
+    def _BuildExportedTypes(self, raw):
+        exportedTypes = []
+        for expDype in raw:
+            expData = raw[expDype]
+            exportedTypes.append(ExportedType(self, self.module, expDype, expData[TYPES], expData[LINE]))
+        return exportedTypes
+
+    @property
+    def functions(self):
+        return self._Section(FUNS)
+
+    @property
+    def records(self):
+        return self._Section(RECORDS_DATA)
+
+    @property
+    def macroses(self):
+        return self._Section(MACROS)
+
+    @property
+    def exportedTypes(self):
+        return self._Section(EXPORTED_TYPES)
+
+    def IsMaterialized(self):
+        return len(self.sections) > 0
+
+    def RecordNames(self):
+        if RECORDS_DATA in self.sections:
+            return [rec.name for rec in self.sections[RECORDS_DATA]]
+        return self.rawSections[RECORDS_DATA].keys()
 
     def Key(self):
         return (self.app, self.module)
 
     def AllIncludes(self):
-        includes = list(self.includes)[:]
-        for include in self.includes:
-            if include in ErlangCache.includes and self.Key() != include:
-                includes += ErlangCache.includes[include].AllIncludes()
-        return set(includes)
+        return ErlangCache.IncludeClosure(self)
 
     def AllRecords(self):
-        records = self.records[:]
-        for include in self.includes:
-            if include in ErlangCache.includes and self.Key() != include:
-                records += ErlangCache.includes[include].AllRecords()
-        return set(records)
+        return set(ErlangCache.RecordsIndex(self).values())
 
     def AllMacroses(self):
-        macroses = self.macroses[:]
-        for include in self.includes:
-            if include in ErlangCache.includes and self.Key() != include:
-                macroses += ErlangCache.includes[include].AllMacroses()
-        return set(macroses)
+        return set(ErlangCache.MacrosIndex(self).values())
 
     def Functions(self, exported = True):
         funs = [fun for fun in self.functions if (exported and fun.exported == exported) or not exported]
@@ -155,7 +228,78 @@ class ModuleData:
         return core.Project.GetApp(self.file)
 
     def IsGlobalInclude(self):
-        return "is_global_include" in self.data and self.data["is_global_include"]
+        return self.isGlobalInclude
+
+class LazyModuleData:
+    def __init__(self, index, entry, srcFile):
+        self.index = index
+        self.entry = entry
+        self.srcFile = srcFile
+        self.file = entry.file
+        self.module = entry.name
+        self.app = entry.app
+        self.includes = set([(i[0], i[1]) for i in entry.includes])
+
+    def Key(self):
+        return (self.app, self.module)
+
+    def IsGlobalInclude(self):
+        return self.entry.isGlobalInclude
+
+    def RecordNames(self):
+        return self.entry.records
+
+    def Materialize(self):
+        data = self.index.ReadData(self.entry.path)
+        if data is None or not os.path.isfile(data[FILE]):
+            return None
+        return ModuleData(self.module, data, self.srcFile, self.app)
+
+class LazyModuleDict(dict):
+    """
+    Holds ModuleData for loaded modules and LazyModuleData for modules known only from index.
+    Lazy entries are decoded on first access, so values and items decode everything; walks over
+    all entries use RawItems and decode only what they need.
+    """
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, LazyModuleData):
+            mdata = value.Materialize()
+            if not mdata:
+                ErlangCache.DropLazy(key, value)
+                raise KeyError(key)
+            dict.__setitem__(self, key, mdata)
+            return mdata
+        return value
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def values(self):
+        result = []
+        for key in self.keys():
+            value = self.get(key)
+            if value:
+                result.append(value)
+        return result
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def items(self):
+        return [(key, value) for (key, value) in [(key, self.get(key)) for key in self.keys()] if value]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def RawItems(self):
+        return dict.items(self)
+
+    def IsMaterialized(self, key):
+        return not isinstance(dict.__getitem__(self, key), LazyModuleData)
 
 class ErlangCache:
 
@@ -181,9 +325,30 @@ class ErlangCache:
         ExportedType(None, None, "no_return", "none()", 0),
     }
 
-    toLoad = []
-    modules = {}
-    includes = {}
+    PUBLISH_BATCH_SIZE = 50
+    PUBLISH_TIME_BUDGET = 0.03
+    LOAD_TASK = "Loading erlang cache"
+    MISSING_CACHE_TTL = 30
+    SWEEP_INTERVAL = 1
+    SWEEP_BATCH_SIZE = 100
+
+    loading = False
+    modules = LazyModuleDict()
+    includes = LazyModuleDict()
+    indexes = {}
+    materializedModules = 0
+    generation = 0
+    cacheFiles = {}
+    missingCacheFiles = {}
+    sweepQueue = deque()
+    sweepResults = deque()
+    sweepItems = set()
+    includeGraph = IncludeGraph()
+    recordsIndex = {}
+    macrosIndex = {}
+    functionsIndex = {}
+    allRecordsIndex = None
+    bifsIndex = None
     project = None
     erlangDir = ""
 
@@ -203,54 +368,208 @@ class ErlangCache:
 
         cls.checkers = {}
 
+        cls.loader = CacheLoader(cls.ReadCacheFile)
         cls.loadTimer = wx.Timer(core.MainFrame, wx.ID_ANY)
         cls.loadTimer.Start(100)
         core.MainFrame.Bind(wx.EVT_TIMER, cls.OnProgressTimer, cls.loadTimer)
 
         cls.fileCheckTimer = wx.Timer(core.MainFrame, wx.ID_ANY)
-        cls.fileCheckTimer.Start(20000)
+        cls.fileCheckTimer.Start(1000)
         core.MainFrame.Bind(wx.EVT_TIMER, cls.OnFileCheckTimer, cls.fileCheckTimer)
 
+        cls.sweepTimer = Timer(cls.SWEEP_INTERVAL, cls.SweepStep)
+        cls.sweepTimer.Start()
+
     @classmethod
     def Stop(cls):
         cls.loadTimer.Stop()
         cls.fileCheckTimer.Stop()
+        cls.sweepTimer.Stop()
+        cls.loader.Stop()
+        cls.FlushIndexes()
+        core.Log("erlang cache: {} modules materialized".format(cls.MaterializedModulesCount()))
+
+    @classmethod
+    def MaterializedModulesCount(cls):
+        return cls.materializedModules
 
     @classmethod
     def OnProgressTimer(cls, event):
-        if len(cls.toLoad) > 0:
-            for i in range(60):
-                try:
-                    f = cls.toLoad.pop()
-                    cls.LoadFile_(f)
-                except IndexError, e:
-                    pass
+        if cls.loader.HasDone():
+            cls.PublishLoaded(cls.PUBLISH_TIME_BUDGET)
+        if cls.loader.IsActive():
+            (finished, total, eta) = cls.loader.Progress()
+            cls.project.SetTaskProgress(cls.LOAD_TASK, finished, total, eta)
+            cls.loading = True
+        elif cls.loading:
+            cls.loading = False
+            cls.project.SetTaskProgress(cls.LOAD_TASK, None)
+            cls.FlushIndexes()
+
+    @classmethod
+    def PublishLoaded(cls, timeBudget = None):
+        start = time.time()
+        while cls.loader.HasDone():
+            for (f, result) in cls.loader.PopDone(cls.PUBLISH_BATCH_SIZE):
+                cls.AddModuleData(f, result)
+            if timeBudget and time.time() - start > timeBudget:
+                break
 
     @classmethod
     def OnFileCheckTimer(cls, event):
-        for data in cls.modules.values() + cls.includes.values():
-            if not os.path.exists(data.srcFile):
-                cls.UnloadFile(data.srcFile)
+        while cls.sweepResults:
+            (item, state) = cls.sweepResults.popleft()
+            (key, cacheFile, sourceFile, sourceMtime) = item
+            data = cls.RawData(key)
+            if not data or data.srcFile != cacheFile:
+                cls.sweepItems.discard(cacheFile)
+            elif state == SWEEP_CACHE_MISSING:
+                if isinstance(data, LazyModuleData):
+                    cls.DropLazy(key, data)
+                else:
+                    cls.UnloadKey(key)
+                    index = cls.IndexForFile(cacheFile)
+                    if index:
+                        index.Remove(index.RelPath(cacheFile))
+                    cls.UnregisterCacheFile(cacheFile)
+            elif state == SWEEP_SOURCE_MISSING:
+                cls.UnloadFile(cacheFile)
+            elif state == SWEEP_STALE:
+                if sourceFile.startswith(cls.project.projectDir) and cls.project.GetShell():
+                    cls.project.GetShell().GenerateFileCache(sourceFile)
+                cls.sweepQueue.append(item)
+
+    @classmethod
+    def AddToSweep(cls, data):
+        if data.srcFile in cls.sweepItems: return
+        cls.sweepItems.add(data.srcFile)
+        cls.sweepQueue.append([cls.IndexKey(data), data.srcFile, data.file, None])
+
+    @classmethod
+    def SweepStep(cls):
+        """
+        Runs on sweep thread and only stats files, problems are handled by OnFileCheckTimer on GUI thread.
+        Item keeps last seen source mtime, so changed source is reported as stale only once.
+        """
+        for i in range(cls.SWEEP_BATCH_SIZE):
+            try:
+                item = cls.sweepQueue.popleft()
+            except IndexError:
+                break
+            (key, cacheFile, sourceFile, knownMtime) = item
+            if cacheFile not in cls.sweepItems: continue
+            try:
+                cacheMtime = os.path.getmtime(cacheFile)
+            except OSError:
+                cls.sweepResults.append((item, SWEEP_CACHE_MISSING))
+                continue
+            try:
+                sourceMtime = os.path.getmtime(sourceFile)
+            except OSError:
+                cls.sweepResults.append((item, SWEEP_SOURCE_MISSING))
+                continue
+            if sourceMtime > cacheMtime and sourceMtime != knownMtime:
+                item[3] = sourceMtime
+                cls.sweepResults.append((item, SWEEP_STALE))
+            else:
+                cls.sweepQueue.append(item)
 
     @classmethod
     def AddToLoad(cls, f):
-        cls.toLoad.append(f)
+        cls.RegisterCacheFile(f)
+        cls.loader.Add(f)
 
     @classmethod
     def LoadCacheFromDir(cls, d):
         d = os.path.join(cls.CacheDir(), d)
+        index = cls.GetIndex(d)
+        files = []
         for f in os.listdir(d):
             f = os.path.join(d, f)
             if os.path.isdir(f):
                 for f1 in os.listdir(f):
-                    cls.AddToLoad(os.path.join(f, f1))
+                    files.append(os.path.join(f, f1))
+            else:
+                files.append(f)
+        found = set()
+        for f in files:
+            if not f.endswith(".cache"): continue
+            path = index.RelPath(f)
+            found.add(path)
+            cls.RegisterCacheFile(f)
+            try:
+                mtime = os.path.getmtime(f)
+            except OSError:
+                continue
+            if index.IsActual(path, mtime):
+                cls.AddLazy(index, index.Entry(path), f)
             else:
                 cls.AddToLoad(f)
+        for path in index.Entries():
+            if path not in found:
+                index.Remove(path)
+
+    @classmethod
+    def GetIndex(cls, d):
+        key = os.path.normcase(os.path.normpath(d))
+        if key not in cls.indexes:
+            index = ErlangCacheIndex(d)
+            index.Open()
+            cls.indexes[key] = index
+        return cls.indexes[key]
+
+    @classmethod
+    def IndexForFile(cls, f):
+        key = os.path.normcase(os.path.normpath(os.path.dirname(os.path.dirname(f))))
+        return cls.indexes.get(key)
+
+    @classmethod
+    def FlushIndexes(cls):
+        for index in cls.indexes.values():
+            index.Flush()
+
+    @classmethod
+    def AddLazy(cls, index, entry, f):
+        lazy = LazyModuleData(index, entry, f)
+        if entry.name.endswith(".hrl"):
+            data = cls.includes
+            key = (entry.app, entry.name)
+        else:
+            data = cls.modules
+            key = entry.name
+        if key in data and dict.__getitem__(data, key).srcFile != f:
+            return
+        if key in data and data.IsMaterialized(key):
+            return
+        dict.__setitem__(data, key, lazy)
+        cls.InvalidateIndexes(key, lazy.includes)
+        cls.AddToSweep(lazy)
+
+    @classmethod
+    def DropLazy(cls, key, lazy):
+        if key in cls.modules and dict.__getitem__(cls.modules, key) is lazy:
+            dict.__delitem__(cls.modules, key)
+        elif key in cls.includes and dict.__getitem__(cls.includes, key) is lazy:
+            dict.__delitem__(cls.includes, key)
+        cls.InvalidateIndexes(key)
+        cls.sweepItems.discard(lazy.srcFile)
+        lazy.index.Remove(lazy.entry.path)
+        cls.UnregisterCacheFile(lazy.srcFile)
+        if os.path.isfile(lazy.srcFile):
+            os.remove(lazy.srcFile)
 
     @classmethod
     def CleanDir(cls, d):
         try:
             d = os.path.join(cls.CacheDir(), d)
+            key = os.path.normcase(os.path.normpath(d))
+            if key in cls.indexes:
+                cls.indexes[key].Close()
+                del cls.indexes[key]
+            for name, paths in cls.cacheFiles.items():
+                for path in list(paths):
+                    if os.path.normcase(path).startswith(key):
+                        cls.UnregisterCacheFile(path)
             shutil.rmtree(d, True)
             os.mkdir(d)
         except Exception, e:
@@ -258,15 +577,22 @@ class ErlangCache:
 
     @classmethod
     def LoadFile_(cls, f):
+        return cls.AddModuleData(f, cls.ReadCacheFile(f))
+
+    @classmethod
+    def ReadCacheFile(cls, f):
+        """
+        Parses cache file, safe to call from loader threads.
+        Returns (mtime, data), (mtime, None) if source file doesn't exist anymore or None on error.
+        """
         try:
-            if not f.endswith(".cache") or not os.path.isfile(f): return
+            if not f.endswith(".cache") or not os.path.isfile(f): return None
 
+            mtime = os.path.getmtime(f)
             data = json.loads(readFile(f))
             if not os.path.isfile(data[FILE]):
                 os.remove(f)
-                return None
-            name = os.path.basename(f)[:-6]
-            app = os.path.basename(os.path.dirname(f))
+                return (mtime, None)
             if 'nt' == os.name:
                 import win32api
                 try:
@@ -274,15 +600,39 @@ class ErlangCache:
                     data[FILE] = data[FILE][0].upper() + data[FILE][1:]
                 except Exception, e:
                     core.Log("error ", e, "on get long path name for ", data[FILE])
+            return (mtime, data)
+        except  Exception, e:
+            core.Log("load cache file error", e)
+        return None
+
+    @classmethod
+    def AddModuleData(cls, f, result):
+        if not result: return None
+        (mtime, data) = result
+        index = cls.IndexForFile(f)
+        if not data:
+            if index:
+                index.Remove(index.RelPath(f))
+            cls.UnregisterCacheFile(f)
+            return None
+        try:
+            name = os.path.basename(f)[:-6]
+            app = os.path.basename(os.path.dirname(f))
             # if (name in cls.modules and
             #     not cls.moduleData[name].file.lower().startswith(cls.erlangDir) and
             #     srcFile.lower().startswith(cls.erlangDir)):
             #     return
+            if index:
+                index.Put(index.RelPath(f), name, app, mtime, data[FILE], data[INCLUDES],
+                          bool(data.get(IS_GLOBAL_INCLUDE, False)), data[RECORDS_DATA].keys(), data)
             mdata = ModuleData(name, data, f, app)
             if name.endswith(".hrl"):
                 cls.includes[(app, name)] = mdata
+                cls.InvalidateIndexes((app, name), mdata.includes)
             else:
                 cls.modules[name] = mdata
+                cls.InvalidateIndexes(name, mdata.includes)
+            cls.AddToSweep(mdata)
             return mdata
         except  Exception, e:
             core.Log("load cache file error", e)
@@ -292,40 +642,213 @@ class ErlangCache:
     def TryLoad(cls, module):
         if cls.IsModuleLoaded(module):
             return True
-        for m in cls.FindCacheFiles(module + ".cache"):
+        fileName = module + ".cache"
+        taken = cls.loader.Take(fileName)
+        cls.PublishLoaded()
+        for f in taken:
+            cls.LoadFile_(f)
+        if cls.IsModuleLoaded(module):
+            return True
+        for m in cls.FindCacheFiles(fileName):
             cls.LoadFile_(m)
         return cls.IsModuleLoaded(module)
 
     @classmethod
     def FindCacheFiles(cls, fileName):
-        matches = []
-        for d in [cls.project.ProjectName(), os.path.join("runtimes", cls.project.GetErlangRuntime())]:
+        """
+        Looks up cache files in registry. Unknown names are probed in app dirs once,
+        misses are remembered for MISSING_CACHE_TTL seconds.
+        """
+        if fileName in cls.cacheFiles:
+            matches = []
+            for f in list(cls.cacheFiles[fileName]):
+                if os.path.isfile(f):
+                    matches.append(f)
+                else:
+                    cls.UnregisterCacheFile(f)
+            if matches:
+                return matches
+        missTime = cls.missingCacheFiles.get(fileName)
+        if missTime is not None and time.time() - missTime < cls.MISSING_CACHE_TTL:
+            return []
+        matches = cls.ProbeCacheFiles(fileName)
+        if matches:
+            for f in matches:
+                cls.RegisterCacheFile(f)
+        else:
+            cls.missingCacheFiles[fileName] = time.time()
+        return matches
 
-            for root, dirnames, filenames in os.walk(d):
-                for filename in fnmatch.filter(filenames, fileName):
-                    matches.append(os.path.join(root, filename))
+    @classmethod
+    def ProbeCacheFiles(cls, fileName):
+        matches = []
+        for d in [os.path.join(cls.CacheDir(), cls.project.ProjectName()), cls.ERLANG_LIBS_CACHE_DIR]:
+            if not os.path.isdir(d): continue
+            for app in [""] + os.listdir(d):
+                f = os.path.join(d, app, fileName)
+                if os.path.isfile(f):
+                    matches.append(f)
         return matches
 
+    @classmethod
+    def RegisterCacheFile(cls, f):
+        f = os.path.normpath(f)
+        name = os.path.basename(f)
+        cls.cacheFiles.setdefault(name, set()).add(f)
+        if name in cls.missingCacheFiles:
+            del cls.missingCacheFiles[name]
+
+    @classmethod
+    def UnregisterCacheFile(cls, f):
+        f = os.path.normpath(f)
+        name = os.path.basename(f)
+        paths = cls.cacheFiles.get(name)
+        if paths is None: return
+        paths.discard(f)
+        if not paths:
+            del cls.cacheFiles[name]
+
     @classmethod
     def IsModuleLoaded(cls, module):
-        return module in cls.AllModules()
+        """
+        Lazy module is decoded here, so it is dropped and reported as not loaded if it can't be decoded.
+        """
+        return cls.modules.get(module) is not None
 
     @classmethod
     def UnloadFile(cls, f):
         if not os.path.isfile(f): return
         if not f.endswith(".cache"): return
         name = os.path.basename(f)[:-6]
-        app = os.path.dirname(f)
+        app = os.path.basename(os.path.dirname(f))
         cls.Unload(name, app)
+        index = cls.IndexForFile(f)
+        if index:
+            index.Remove(index.RelPath(f))
+        cls.UnregisterCacheFile(f)
         os.remove(f)
 
     @classmethod
     def Unload(cls, name ,app):
         key = (app, name)
         if name in cls.modules:
-            del cls.modules[name]
+            cls.UnloadKey(name)
         elif key in cls.includes:
-            del cls.includes[key]
+            cls.UnloadKey(key)
+
+    @classmethod
+    def UnloadKey(cls, key):
+        data = cls.modules if not isinstance(key, tuple) else cls.includes
+        if key not in data: return
+        cls.sweepItems.discard(dict.__getitem__(data, key).srcFile)
+        del data[key]
+        cls.InvalidateIndexes(key)
+
+    @classmethod
+    def RawData(cls, key):
+        data = cls.modules if not isinstance(key, tuple) else cls.includes
+        return dict.get(data, key)
+
+    @classmethod
+    def SourceDeleted(cls, path, app):
+        """
+        Handles deleted source file event: unloads its data and removes cache file.
+        """
+        name = os.path.basename(path)
+        if IsModule(name):
+            name = name[:-4]
+        key = (app, name) if IsInclude(name) else name
+        data = cls.RawData(key)
+        if data and os.path.normcase(data.file) == os.path.normcase(path):
+            cls.UnloadFile(data.srcFile)
+        cls.Unload(name, app)
+
+    @classmethod
+    def InvalidateIndexes(cls, key, includes = None):
+        """
+        Key is module name for modules and (app, name) for includes, includes is None when key was unloaded.
+        Include change drops records and macroses only of modules that include it.
+        """
+        cls.generation += 1
+        if includes is None:
+            affected = cls.includeGraph.RemoveNode(key)
+        else:
+            affected = cls.includeGraph.SetEdges(key, includes)
+        if isinstance(key, tuple):
+            cls.allRecordsIndex = None
+        else:
+            if key in cls.functionsIndex:
+                del cls.functionsIndex[key]
+            if key == "erlang":
+                cls.bifsIndex = None
+        for node in affected:
+            for index in [cls.recordsIndex, cls.macrosIndex]:
+                if node in index:
+                    del index[node]
+
+    @classmethod
+    def IndexKey(cls, mdata):
+        return mdata.Key() if mdata.module.endswith(".hrl") else mdata.module
+
+    @classmethod
+    def IncludeClosure(cls, mdata):
+        return cls.includeGraph.Closure(cls.IndexKey(mdata))
+
+    @classmethod
+    def RecordsIndex(cls, mdata):
+        key = cls.IndexKey(mdata)
+        if key not in cls.recordsIndex:
+            records = {}
+            for include in cls.IncludeClosure(mdata):
+                incData = cls.includes.get(include)
+                if incData and include != mdata.Key():
+                    for rec in incData.records:
+                        records.setdefault(rec.name, rec)
+            for rec in mdata.records:
+                records[rec.name] = rec
+            cls.recordsIndex[key] = records
+        return cls.recordsIndex[key]
+
+    @classmethod
+    def MacrosIndex(cls, mdata):
+        """
+        Macroses are indexed both by full name and by name without params, e.g. "M(X)" and "M".
+        """
+        key = cls.IndexKey(mdata)
+        if key not in cls.macrosIndex:
+            macroses = {}
+            for include in cls.IncludeClosure(mdata):
+                incData = cls.includes.get(include)
+                if incData and include != mdata.Key():
+                    for mac in incData.macroses:
+                        macroses.setdefault(mac.name, mac)
+            for mac in mdata.macroses:
+                macroses[mac.name] = mac
+            for name, mac in macroses.items():
+                shortName = name.split("(")[0]
+                if shortName != name:
+                    macroses.setdefault(shortName, mac)
+            cls.macrosIndex[key] = macroses
+        return cls.macrosIndex[key]
+
+    @classmethod
+    def FunctionsIndex(cls, module):
+        """
+        Maps (name, arity) to function, (name, None) holds first function with such name.
+        """
+        if module not in cls.functionsIndex:
+            funs = {}
+            for fun in cls.modules[module].functions:
+                funs.setdefault((fun.name, fun.arity), fun)
+                funs.setdefault((fun.name, None), fun)
+            cls.functionsIndex[module] = funs
+        return cls.functionsIndex[module]
+
+    @classmethod
+    def FindFunction(cls, funs, name, arity):
+        fun = funs.get((name, arity))
+        if fun: return fun
+        return funs.get((name, None))
 
     @classmethod
     def UnloadModule(cls, name, app):
@@ -349,9 +872,10 @@ class ErlangCache:
         app = core.Project.GetApp(includePath)
         include = (app, os.path.basename(includePath))
         cls.TryLoad(os.path.basename(includePath))
-        for module in cls.modules.values():
-            if not module.file.startswith(cls.project.projectDir): continue
-            if include in module.AllIncludes():
+        for name in cls.includeGraph.Dependents(include):
+            if isinstance(name, tuple) or not name in cls.modules: continue
+            module = dict.__getitem__(cls.modules, name)
+            if module.file.startswith(cls.project.projectDir):
                 result.append(module.file)
         return result
 
@@ -364,24 +888,34 @@ class ErlangCache:
     @classmethod
     def RecordData(cls, module, record):
         if not cls.TryLoad(module): return None
-        for rec in cls.modules[module].AllRecords():
-            if rec.name == record:
-                return rec
-        return None
+        return cls.RecordsIndex(cls.modules[module]).get(record)
 
     @classmethod
-    def AllRecords(cls):
-        result = []
-        for include in cls.includes.values():
-            result += include.AllRecords()
-        return result
+    def AllRecordsIndex(cls):
+        """
+        Maps record name to include that defines it. Built from record names, includes are decoded
+        only when their record is requested.
+        """
+        if cls.allRecordsIndex is None:
+            records = {}
+            for (key, include) in cls.includes.RawItems():
+                for name in include.RecordNames():
+                    records.setdefault(name, key)
+            cls.allRecordsIndex = records
+        return cls.allRecordsIndex
+
+    @classmethod
+    def AllRecords(cls, prefix = ""):
+        records = [cls.AllRecordsData(name) for name in cls.AllRecordsIndex().keys() if name.startswith(prefix)]
+        return [rec for rec in records if rec]
 
     @classmethod
     def AllRecordsData(cls, record):
-        for include in cls.includes.values():
-            for rec in include.AllRecords():
-                if rec.name == record:
-                    return rec
+        include = cls.includes.get(cls.AllRecordsIndex().get(record))
+        if not include: return None
+        for rec in include.records:
+            if rec.name == record:
+                return rec
         return None
 
     @classmethod
@@ -398,16 +932,7 @@ class ErlangCache:
     @classmethod
     def ModuleFunction(cls, module, funName, arity):
         if not cls.TryLoad(module): return None
-        funs = []
-        for fun in cls.modules[module].functions:
-            if fun.name == funName:
-                funs.append(fun)
-        for fun in funs:
-            if fun.arity == arity:
-                return fun
-        if funs:
-            return funs[0]
-        return None
+        return cls.FindFunction(cls.FunctionsIndex(module), funName, arity)
 
     @classmethod
     def ModuleExportedData(cls, module, type):
@@ -431,23 +956,25 @@ class ErlangCache:
         return cls.modules[module].AllRecords()
 
     @classmethod
-    def Bifs(cls):
+    def BifsIndex(cls):
         module = "erlang"
-        if not cls.TryLoad(module): return []
-        return [fun for fun in cls.modules[module].Functions() if isinstance(fun, Function) and fun.bif == True]
+        if not cls.TryLoad(module): return ([], {})
+        if cls.bifsIndex is None:
+            bifs = [fun for fun in cls.modules[module].Functions() if isinstance(fun, Function) and fun.bif == True]
+            funs = {}
+            for fun in bifs:
+                funs.setdefault((fun.name, fun.arity), fun)
+                funs.setdefault((fun.name, None), fun)
+            cls.bifsIndex = (bifs, funs)
+        return cls.bifsIndex
+
+    @classmethod
+    def Bifs(cls):
+        return list(cls.BifsIndex()[0])
 
     @classmethod
     def Bif(cls, name, arity):
-        funs = []
-        for fun in cls.Bifs():
-            if fun.name == name:
-                funs.append(fun)
-        for fun in funs:
-            if fun.arity == arity:
-                return fun
-        if funs:
-            return funs[0]
-        return None
+        return cls.FindFunction(cls.BifsIndex()[1], name, arity)
 
     @classmethod
     def Macroses(cls, module):
@@ -457,10 +984,7 @@ class ErlangCache:
     @classmethod
     def MacrosData(cls, module, macros):
         if not cls.TryLoad(module): return None
-        for mac in cls.modules[module].AllMacroses():
-            if mac.name == macros or mac.name.startswith(macros + "("):
-                return mac
-        return None
+        return cls.MacrosIndex(cls.modules[module]).get(macros)
 
     @classmethod
     def ApplicationIncludes(cls, module):
@@ -479,7 +1003,7 @@ class ErlangCache:
     def GlobalIncludes(cls):
         result = []
         for inc in cls.includes.keys():
-            if cls.includes[inc].IsGlobalInclude():
+            if dict.__getitem__(cls.includes, inc).IsGlobalInclude():
                 result.append(inc[0] + "/include/" + inc[1] + "\").")
         return result
 
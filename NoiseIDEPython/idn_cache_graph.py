@@ -0,0 +1,86 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+class IncludeGraph:
+    """
+    Include dependency graph of erlang cache.
+    Nodes are module names and (app, name) keys of includes, edges point from node to included (app, name).
+    Transitive closures are memoized and dropped only for nodes that can reach changed node.
+    """
+    def __init__(self):
+        self.edges = {}
+        self.reverse = {}
+        self.closures = {}
+
+    def SetEdges(self, node, includes):
+        """
+        Replaces edges of node and returns set of nodes whose closures were dropped.
+        """
+        affected = self.Invalidate(node)
+        self._RemoveEdges(node)
+        includes = set(includes)
+        self.edges[node] = includes
+        for include in includes:
+            self.reverse.setdefault(include, set()).add(node)
+        return affected
+
+    def RemoveNode(self, node):
+        affected = self.Invalidate(node)
+        self._RemoveEdges(node)
+        return affected
+
+    def _RemoveEdges(self, node):
+        if node not in self.edges: return
+        for include in self.edges[node]:
+            dependents = self.reverse.get(include)
+            if dependents is None: continue
+            dependents.discard(node)
+            if not dependents:
+                del self.reverse[include]
+        del self.edges[node]
+
+    def Closure(self, node):
+        """
+        All includes reachable from node. Node itself is never expanded again, so self includes are safe.
+        """
+        if node in self.closures:
+            return self.closures[node]
+        closure = set()
+        stack = list(self.edges.get(node, ()))
+        while stack:
+            include = stack.pop()
+            if include in closure: continue
+            closure.add(include)
+            if include == node: continue
+            cached = self.closures.get(include)
+            if cached is not None:
+                closure.update(cached)
+            else:
+                stack.extend(self.edges.get(include, ()))
+        self.closures[node] = closure
+        return closure
+
+    def Dependents(self, node):
+        """
+        All nodes that include node directly or transitively.
+        """
+        result = set()
+        stack = list(self.reverse.get(node, ()))
+        while stack:
+            dependent = stack.pop()
+            if dependent in result: continue
+            result.add(dependent)
+            stack.extend(self.reverse.get(dependent, ()))
+        return result
+
+    def Invalidate(self, node):
+        affected = self.Dependents(node)
+        affected.add(node)
+        for n in affected:
+            if n in self.closures:
+                del self.closures[n]
+        return affected
+
+    def Clear(self):
+        self.edges = {}
+        self.reverse = {}
+        self.closures = {}
@@ -0,0 +1,173 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import os
+import mmap
+import marshal
+import struct
+import core
+
+class IndexEntry:
+    def __init__(self, path, name, app, mtime, offset, length, file, includes, isGlobalInclude, records):
+        self.path = path
+        self.name = name
+        self.app = app
+        self.mtime = mtime
+        self.offset = offset
+        self.length = length
+        self.file = file
+        self.includes = includes
+        self.isGlobalInclude = isGlobalInclude
+        self.records = records
+
+    def ToTuple(self, offset, length):
+        return (self.name, self.app, self.mtime, offset, length,
+                self.file, self.includes, self.isGlobalInclude, self.records)
+
+class ErlangCacheIndex:
+    """
+    Packed symbol index for one cache dir (runtime or project).
+    Layout: header (magic, version, table offset), marshalled module blobs, marshalled table.
+    Table maps cache file path (relative to cache dir) to entry metadata, blobs are
+    decoded only when module is requested. Entry keeps record names, so records of all includes
+    can be listed without decoding blobs.
+    """
+    FILE_NAME = "symbols.index"
+    MAGIC = "NIDX"
+    VERSION = 2
+    HEADER = struct.Struct("<4sIQ")
+
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        self.path = os.path.join(cacheDir, self.FILE_NAME)
+        self.file = None
+        self.map = None
+        self.entries = {}
+        self.pending = {}
+        self.removed = set()
+
+    def Open(self):
+        self.Close()
+        self.entries = {}
+        if not os.path.isfile(self.path) or os.path.getsize(self.path) <= self.HEADER.size:
+            return
+        try:
+            self.file = open(self.path, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+            (magic, version, tableOffset) = self.HEADER.unpack(self.map[:self.HEADER.size])
+            if magic != self.MAGIC or version != self.VERSION:
+                self.Close()
+                return
+            table = marshal.loads(self.map[tableOffset:])
+            for path, data in table.iteritems():
+                self.entries[path] = IndexEntry(path, *data)
+        except Exception, e:
+            core.Log("open cache index error", self.path, e)
+            self.Close()
+            self.entries = {}
+
+    def Close(self):
+        if self.map:
+            self.map.close()
+            self.map = None
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def RelPath(self, cacheFile):
+        return os.path.relpath(cacheFile, self.cacheDir)
+
+    def Entries(self):
+        result = dict(self.entries)
+        for path in self.removed:
+            if path in result:
+                del result[path]
+        for path, (entry, _data) in self.pending.items():
+            result[path] = entry
+        return result
+
+    def Entry(self, path):
+        if path in self.pending:
+            return self.pending[path][0]
+        if path in self.removed:
+            return None
+        return self.entries.get(path)
+
+    def IsActual(self, path, mtime):
+        entry = self.Entry(path)
+        return entry is not None and entry.mtime == mtime
+
+    def ReadData(self, path):
+        if path in self.pending:
+            return self.pending[path][1]
+        entry = self.Entry(path)
+        if not entry or not self.map:
+            return None
+        return marshal.loads(self.map[entry.offset:entry.offset + entry.length])
+
+    def Put(self, path, name, app, mtime, file, includes, isGlobalInclude, records, data):
+        entry = IndexEntry(path, name, app, mtime, None, None, file, includes, isGlobalInclude, records)
+        self.pending[path] = (entry, data)
+        self.removed.discard(path)
+
+    def Remove(self, path):
+        if path in self.pending:
+            del self.pending[path]
+        if path in self.entries:
+            self.removed.add(path)
+
+    def IsDirty(self):
+        return len(self.pending) > 0 or len(self.removed) > 0
+
+    def Flush(self):
+        """
+        Rewrites index file with pending changes. Old index is kept as backup until new one is in place,
+        if writing fails it is restored and changes stay queued for next flush.
+        """
+        if not self.IsDirty():
+            return
+        if not os.path.isdir(self.cacheDir):
+            return
+        tmpPath = self.path + ".tmp"
+        backupPath = self.path + ".bak"
+        try:
+            table = {}
+            with open(tmpPath, "wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC, self.VERSION, 0))
+                offset = self.HEADER.size
+                for path, entry in self.entries.iteritems():
+                    if path in self.removed or path in self.pending or not self.map:
+                        continue
+                    blob = self.map[entry.offset:entry.offset + entry.length]
+                    f.write(blob)
+                    table[path] = entry.ToTuple(offset, len(blob))
+                    offset += len(blob)
+                for path, (entry, data) in self.pending.iteritems():
+                    blob = marshal.dumps(data)
+                    f.write(blob)
+                    table[path] = entry.ToTuple(offset, len(blob))
+                    offset += len(blob)
+                f.write(marshal.dumps(table))
+                f.seek(0)
+                f.write(self.HEADER.pack(self.MAGIC, self.VERSION, offset))
+            self.Close()
+            if os.path.isfile(backupPath):
+                os.remove(backupPath)
+            if os.path.isfile(self.path):
+                os.rename(self.path, backupPath)
+            try:
+                os.rename(tmpPath, self.path)
+            except Exception:
+                if os.path.isfile(backupPath):
+                    os.rename(backupPath, self.path)
+                raise
+        except Exception, e:
+            core.Log("write cache index error", self.path, e)
+            if os.path.isfile(tmpPath):
+                os.remove(tmpPath)
+            self.Open()
+            return
+        if os.path.isfile(backupPath):
+            os.remove(backupPath)
+        self.pending = {}
+        self.removed = set()
+        self.Open()
@@ -0,0 +1,117 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import os
+import time
+import Queue
+from threading import Thread, Lock, Event
+import core
+
+class CacheLoader:
+    """
+    Parses cache files on worker threads. Parsed data is collected in done list and
+    should be published to ErlangCache from GUI thread with PopDone.
+    """
+    WORKERS_COUNT = 2
+
+    def __init__(self, parseFun):
+        self.parseFun = parseFun
+        self.lock = Lock()
+        self.queue = Queue.Queue()
+        self.queued = {}
+        self.inProgress = {}
+        self.done = []
+        self.total = 0
+        self.finished = 0
+        self.startTime = None
+        self.stopped = False
+        self.workers = []
+        for i in range(self.WORKERS_COUNT):
+            worker = Thread(target = self._Work)
+            worker.setDaemon(True)
+            worker.start()
+            self.workers.append(worker)
+
+    def Add(self, path):
+        with self.lock:
+            name = os.path.basename(path)
+            if path in self.queued or path in self.inProgress:
+                return
+            if self.total == self.finished:
+                self.total = 0
+                self.finished = 0
+                self.startTime = time.time()
+            self.queued[path] = name
+            self.total += 1
+        self.queue.put(path)
+
+    def Take(self, fileName):
+        """
+        Removes queued files with given name from queue and returns them, so caller can load them right away.
+        Waits for files with such name that are being parsed by workers at the moment.
+        """
+        taken = []
+        waitFor = []
+        with self.lock:
+            for path, name in self.queued.items():
+                if name == fileName:
+                    del self.queued[path]
+                    self.finished += 1
+                    taken.append(path)
+            for path, event in self.inProgress.items():
+                if os.path.basename(path) == fileName:
+                    waitFor.append(event)
+        for event in waitFor:
+            event.wait(5)
+        return taken
+
+    def PopDone(self, count):
+        with self.lock:
+            result = self.done[:count]
+            self.done = self.done[count:]
+        return result
+
+    def HasDone(self):
+        return len(self.done) > 0
+
+    def IsActive(self):
+        return self.finished < self.total or len(self.done) > 0
+
+    def Progress(self):
+        with self.lock:
+            total = self.total
+            finished = self.finished
+            startTime = self.startTime
+        eta = None
+        if startTime and finished > 0 and finished < total:
+            elapsed = time.time() - startTime
+            eta = elapsed / finished * (total - finished)
+        return (finished, total, eta)
+
+    def Stop(self):
+        self.stopped = True
+        with self.lock:
+            self.queued = {}
+        for worker in self.workers:
+            self.queue.put(None)
+
+    def _Work(self):
+        while not self.stopped:
+            path = self.queue.get()
+            if path is None:
+                break
+            with self.lock:
+                if path not in self.queued:
+                    continue
+                del self.queued[path]
+                event = Event()
+                self.inProgress[path] = event
+            try:
+                result = self.parseFun(path)
+            except Exception, e:
+                core.Log("cache loader error", path, e)
+                result = None
+            with self.lock:
+                self.done.append((path, result))
+                del self.inProgress[path]
+                self.finished += 1
+            event.set()
@@ -9,6 +9,7 @@ import core
 class Completer(wx.Frame):
     SIZE = (760, 270)
     LIST_SIZE = (340, 150)
+    LIST_STYLE = wx.LB_SORT | wx.LB_SINGLE | wx.WANTS_CHARS
 
     def __init__(self, stc):
         style = wx.BORDER_NONE | wx.STAY_ON_TOP | wx.FRAME_NO_TASKBAR
@@ -24,7 +25,7 @@ class Completer(wx.Frame):
         self.showingHelp = False
         self.prefix = ""
 
-        self.list = wx.ListBox(self, size = self.LIST_SIZE, style = wx.LB_SORT | wx.LB_SINGLE | wx.WANTS_CHARS)
+        self.list = wx.ListBox(self, size = self.LIST_SIZE, style = self.LIST_STYLE)
         self.list.SetBackgroundColour(ColorSchema.codeEditor["completer_list_back"])
         self.list.SetForegroundColour(ColorSchema.codeEditor["completer_list_fore"])
 
@@ -0,0 +1,76 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import re
+from bisect import bisect_left
+from heapq import nsmallest
+
+HIGH_CHAR = u"\uffff"
+
+def CompletionName(item):
+    if isinstance(item, basestring):
+        return item
+    if isinstance(item, tuple):
+        return item[0]
+    return item.name
+
+class CompletionIndex:
+    """
+    Sorted array of completion names with parallel arrays of ranks and items.
+    Prefix matches are found with bisect, subsequence (fuzzy) matches are searched only among names
+    with the same first char, in one regexp pass over their names joined by line ends.
+    Rank is (locality, name length, name), lower is better; ranks array keeps position of name in rank order.
+    """
+    def __init__(self, items, localityFun = None):
+        entries = []
+        seen = set()
+        for item in items:
+            key = item if isinstance(item, basestring) else id(item)
+            if key in seen: continue
+            seen.add(key)
+            name = CompletionName(item)
+            if not name: continue
+            locality = localityFun(item) if localityFun else 0
+            entries.append((name, (locality, len(name), name), item))
+        entries.sort(key = lambda e: e[0])
+        self.keys = [e[0] for e in entries]
+        self.items = [e[2] for e in entries]
+        order = sorted(xrange(len(entries)), key = lambda i: entries[i][1])
+        self.ranks = [0] * len(entries)
+        for (position, i) in enumerate(order):
+            self.ranks[i] = position
+        self.byRank = [self.items[i] for i in order]
+        self.blocks = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def Range(self, prefix):
+        return (bisect_left(self.keys, prefix), bisect_left(self.keys, prefix + HIGH_CHAR))
+
+    def Block(self, char):
+        """
+        Names starting with char joined by line ends and map of line start offset to name index.
+        """
+        if char not in self.blocks:
+            (lo, hi) = self.Range(char)
+            indexes = {}
+            offset = 0
+            for i in xrange(lo, hi):
+                indexes[offset] = i
+                offset += len(self.keys[i]) + 1
+            self.blocks[char] = ("\n".join(self.keys[lo:hi]), indexes)
+        return self.blocks[char]
+
+    def Query(self, prefix, limit):
+        if not prefix:
+            return self.byRank[:limit]
+        (lo, hi) = self.Range(prefix)
+        rank = self.ranks.__getitem__
+        result = nsmallest(limit, xrange(lo, hi), key = rank)
+        if len(result) < limit and len(prefix) > 1:
+            pattern = re.compile("^" + re.escape(prefix[0]) +
+                "".join(["[^{0}\n]*{0}".format(re.escape(c)) for c in prefix[1:]]), re.MULTILINE)
+            (block, indexes) = self.Block(prefix[0])
+            fuzzy = [i for i in [indexes[m.start()] for m in pattern.finditer(block)] if i < lo or i >= hi]
+            result += nsmallest(limit - len(result), fuzzy, key = rank)
+        return [self.items[i] for i in result]
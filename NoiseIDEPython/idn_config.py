@@ -19,9 +19,15 @@ class Config:
     TOOLTIP_DELAY = "tooltip_delay"
     REFRESH_INTERVAL = "refresh_interval"
     SHOW_MULTI_COMPLETE = "show_multi_complete"
+    LARGE_FILE_LINES = "large_file_lines"
+    PLAIN_STYLE_SIZE = "plain_style_size"
+    STYLE_SLICE_TIME = "style_slice_time"
 
     DEFAULT_TOOLTIP_DELAY = 500
     DEFAULT_REFRESH_INTERVAL = 2
+    DEFAULT_LARGE_FILE_LINES = 20000
+    DEFAULT_PLAIN_STYLE_SIZE = 8 * 1024 * 1024
+    DEFAULT_STYLE_SLICE_TIME = 20
 
     data = {}
 
@@ -83,6 +89,18 @@ class Config:
     def ShowMultiComplete(cls):
         return cls.data[cls.SHOW_MULTI_COMPLETE] if cls.SHOW_MULTI_COMPLETE in cls.data else False
 
+    @classmethod
+    def LargeFileLines(cls):
+        return cls.data[cls.LARGE_FILE_LINES] if cls.LARGE_FILE_LINES in cls.data else cls.DEFAULT_LARGE_FILE_LINES
+
+    @classmethod
+    def PlainStyleSize(cls):
+        return cls.data[cls.PLAIN_STYLE_SIZE] if cls.PLAIN_STYLE_SIZE in cls.data else cls.DEFAULT_PLAIN_STYLE_SIZE
+
+    @classmethod
+    def StyleSliceTime(cls):
+        return cls.data[cls.STYLE_SLICE_TIME] if cls.STYLE_SLICE_TIME in cls.data else cls.DEFAULT_STYLE_SLICE_TIME
+
     @classmethod
     def AvailableRuntimes(cls):
         result = {}
@@ -167,6 +167,8 @@ class CustomSTC(StyledTextCtrl, EditorFoldMixin, EditorLineMarginMixin):
 
         if hasattr(self, "lexer"):
             self.Bind(stc.EVT_STC_STYLENEEDED, self.OnStyleNeeded)
+            self.Bind(wx.EVT_IDLE, self.OnIdleStyling)
+            self.Bind(stc.EVT_STC_MODIFIED, self.OnLinesModified)
         self.Bind(stc.EVT_STC_UPDATEUI, self.HighlightBrackets)
         self.Bind(stc.EVT_STC_CHARADDED, self.OnCharAdded)
         self.Bind(wx.EVT_KEY_DOWN, self.OnKeyDown)
@@ -315,6 +317,37 @@ class CustomSTC(StyledTextCtrl, EditorFoldMixin, EditorLineMarginMixin):
         self.saved = True
         self.lastHighlightedWord = ""
         self.SetSelection(0, 0)
+        if hasattr(self, "lexer") and self.lexer:
+            self.SetupStylingMode()
+
+    def SetupStylingMode(self):
+        """
+        Files bigger than plain style size are not highlighted, files with more than large file lines
+        are lexed on worker thread and styled viewport first.
+        """
+        mode = self.lexer.MODE_NORMAL
+        if self.GetLength() > Config.PlainStyleSize():
+            mode = self.lexer.MODE_PLAIN
+        elif self.GetLineCount() > Config.LargeFileLines():
+            mode = self.lexer.MODE_LARGE
+        self.lexer.SetMode(mode, lambda: wx.CallAfter(self.OnBackgroundLexed))
+
+    def OnBackgroundLexed(self):
+        if self.closed or not self.lexer: return
+        self.lexer.InstallLexedLines()
+        wx.WakeUpIdle()
+
+    def OnLinesModified(self, event):
+        event.Skip()
+        if self.lexer:
+            self.lexer.LinesAdded(self.LineFromPosition(event.GetPosition()), event.GetLinesAdded())
+
+    def OnIdleStyling(self, event):
+        event.Skip()
+        if self.lexer and self.lexer.HasPendingStyling():
+            self.lexer.StyleSlice(Config.StyleSliceTime() / 1000.0)
+            if self.lexer.HasPendingStyling():
+                event.RequestMore()
 
     def OnInit(self):
         pass
@@ -329,6 +362,8 @@ class CustomSTC(StyledTextCtrl, EditorFoldMixin, EditorLineMarginMixin):
         self.HighlightSelectedWord()
 
     def OnDocumentChanged(self, event):
+        if hasattr(self, "lexer") and self.lexer:
+            self.lexer.DocumentChanged()
         self.Changed()
         event.Skip()
 
@@ -114,6 +114,19 @@ class DirectoryChecker:
         self.files = info[1].keys()
         return info
 
+    def FileMtimes(self):
+        return dict(self.dirSnapshot[1])
+
+    def SkipModified(self, paths):
+        """
+        Takes current mtimes of files changed by IDE itself, so next check does not report them as modified.
+        """
+        files = self.dirSnapshot[1]
+        for path in paths:
+            path = os.path.normpath(path)
+            if path in files:
+                files[path] = os.stat(path)[ST_MTIME]
+
     def SetInterval(self, interval):
         self.Stop()
         self.interval = interval
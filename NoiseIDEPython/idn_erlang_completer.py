@@ -7,15 +7,28 @@ from idn_cache import ErlangCache, Function, Record, ExportedType, Macros
 from idn_colorschema import ColorSchema
 from idn_erlang_constats import TYPE_MODULE, TYPE_HRL
 from idn_token import ErlangTokenizer, ErlangTokenType
+from idn_highlight import ErlangHighlightType
 from idn_utils import readFile
 from idn_completer import Completer
+from idn_completion_index import CompletionIndex
+from idn_erlang_context import Vars, FunArity, PrefixModule, IsInExports
+
+LOCALITY_MODULE = 0
+LOCALITY_INCLUDE = 1
+LOCALITY_PROJECT = 2
+LOCALITY_OTP = 3
 
 class ErlangCompleter(Completer):
+    LIST_STYLE = wx.LB_SINGLE | wx.WANTS_CHARS
+    MAX_ITEMS = 100
+
     def __init__(self, stc):
         Completer.__init__(self, stc)
         self.tokenizer = ErlangTokenizer()
         self.module = self.stc.ModuleName()
         self.moduleType = self.stc.ModuleType()
+        self.includeFiles = set()
+        self.indexCache = {}
 
     def UpdateRecordField(self, record, prefix):
         self.prefix = prefix.strip()
@@ -53,9 +66,8 @@ class ErlangCompleter(Completer):
                         if self.prefix:
                             data += ErlangCache.AllModules()
                     else:
-                        data += ErlangCache.ModuleFunctions(self.module, False)
-                        data += ErlangCache.Bifs()
-                        data += ErlangCache.AllModules()
+                        data = self.CachedIndex(("functions", self.module),
+                            lambda: ErlangCache.ModuleFunctions(self.module, False) + ErlangCache.Bifs() + ErlangCache.AllModules())
                 else:
                     if self.moduleType == TYPE_HRL:
                         if self.stc.lexer.IsInTypeBlock():
@@ -63,8 +75,8 @@ class ErlangCompleter(Completer):
                             if self.prefix:
                                 data += ErlangCache.AllModules()
                         else:
-                            data += ErlangCache.Bifs()
-                            data += ErlangCache.AllModules()
+                            data = self.CachedIndex(("bifs",),
+                                lambda: ErlangCache.Bifs() + ErlangCache.AllModules())
             elif (len(tokens) > 1 and
                   ((fIsAtom and tokens[1].value == ":") or fValue == ":")):
                 i = 1 if fValue == ":" else 2
@@ -112,14 +124,53 @@ class ErlangCompleter(Completer):
                 data = ErlangCache.GlobalIncludes()
         self._PrepareData(data, isReference)
 
+    def CachedIndex(self, key, itemsFun):
+        """
+        Big completion lists are indexed once per erlang cache generation.
+        """
+        if key in self.indexCache and self.indexCache[key][0] == ErlangCache.generation:
+            return self.indexCache[key][1]
+        self.includeFiles = self.IncludeFiles()
+        index = CompletionIndex(itemsFun(), self.Locality)
+        self.indexCache[key] = (ErlangCache.generation, index)
+        return index
+
+    def IncludeFiles(self):
+        data = ErlangCache.RawData(self.module)
+        if not data: return set()
+        files = set()
+        for key in ErlangCache.IncludeClosure(data):
+            include = ErlangCache.RawData(key)
+            if include:
+                files.add(include.file)
+        return files
+
+    def Locality(self, item):
+        if isinstance(item, tuple):
+            return LOCALITY_MODULE
+        if isinstance(item, basestring):
+            data = ErlangCache.RawData(item)
+            if not data: return LOCALITY_MODULE
+            file = data.file
+        else:
+            if item.module == self.module: return LOCALITY_MODULE
+            file = item.file
+            if file in self.includeFiles: return LOCALITY_INCLUDE
+        if file and ErlangCache.project and file.startswith(ErlangCache.project.projectDir):
+            return LOCALITY_PROJECT
+        return LOCALITY_OTP
+
     def _PrepareData(self, data, isReference = False):
         self.list.Clear()
         self.lastData = []
-        for d in set(data):
+        if not isinstance(data, CompletionIndex):
+            self.includeFiles = self.IncludeFiles()
+            data = CompletionIndex(data, self.Locality)
+        inExports = IsInExports(self.stc)
+        for d in data.Query(self.prefix, self.MAX_ITEMS):
             helpText = None
             if isinstance(d, Function):
-                (_f, s, e, _l) = self.stc.lexer.GetAllExports()
-                if (isReference or (self.stc.CurrentPos >= s and self.stc.CurrentPos <= e)):
+                if isReference or inExports:
                     text = "{}/{}".format(d.name, d.arity)
                     helpText = self._FunctionHelp(d)
                 else:
@@ -158,8 +209,7 @@ class ErlangCompleter(Completer):
             if not isinstance(helpText, list):
                 helpText = [helpText]
             for i in range(len(text)):
-                if text[i].startswith(self.prefix):
-                    self.list.Append(text[i], helpText[i])
+                self.list.Append(text[i], helpText[i])
 
     def _RecordHelp(self, record):
         fields = record.FieldsData()
@@ -210,16 +260,16 @@ class ErlangCompleter(Completer):
         return help
 
     def GetVars(self):
-        funData = self.stc.lexer.GetCurrentFunction()
-        if funData:
-            text = funData[3][:self.stc.GetCurrentPos()]
-            tokens = self.tokenizer.GetTokens(text)
-            return list({token.value for token in tokens
-                         if token.type == ErlangTokenType.VAR and token.value != self.prefix})
-        return []
+        return Vars(self.stc, self.prefix)
 
     def AutoComplete(self, text):
-        toInsert = text[len(self.prefix):]
+        if text.startswith(self.prefix):
+            toInsert = text[len(self.prefix):]
+        else:
+            pos = self.stc.CurrentPos
+            self.stc.SetSelection(pos - len(self.prefix), pos)
+            self.stc.ReplaceSelection("")
+            toInsert = text
         nextChar = self.stc.GetCharAt(self.stc.CurrentPos)
         if nextChar == "(" and "(" in toInsert:
             toInsert = toInsert[:toInsert.find(nextChar)]
@@ -228,21 +278,7 @@ class ErlangCompleter(Completer):
 
     def GetFunctionNavAndHelp(self, fun, prefix, pos):
         arity = self.GetFunArity(pos)
-        module = ""
-        if prefix and prefix[-1] == ":" and prefix[-2] != ")":
-            i = -2
-            while abs(i) <= len(prefix) and (prefix[i].isalpha() or prefix[i].isdigit() or prefix[i] == "_"):
-                module += prefix[i]
-                i -= 1
-            module = module[::-1]
-            if abs(i) <= len(prefix) and prefix[i] == "?":
-                macrosData = ErlangCache.MacrosData(self.module, module)
-                if macrosData:
-                    module = macrosData.value
-            if not module[0].islower():
-                module = self.module
-        else:
-            module = self.module
+        module = PrefixModule(prefix, self.module, self.MacrosValue)
         data = ErlangCache.ModuleFunction(module, fun, arity)
         if not data:
             data = ErlangCache.ModuleExportedData(module, fun)
@@ -262,75 +298,27 @@ class ErlangCompleter(Completer):
                 help = self._ExportedTypeHelp(data)
         else:
             help = self._FunctionHelp(data)
-        f = data.moduleData.file if data.moduleData else None
+        f = data.file
         return ((f, data.line), help)
 
     def GetFunArity(self, pos):
-        open = ['[', '(', '{', 'fun', 'case', 'if', 'try', 'begin', 'receive']
-        close = {
-            '[' : ']',
-            '(' : ')',
-            '{' : '}',
-            'fun' : 'end',
-            'case' : 'end',
-            'if' : 'end',
-            'try' : 'end',
-            'begin' : 'end',
-            'receive' : 'end'
-        }
-        lvl = 0
-        if self.stc.GetCharAt(pos) == "/":
-            pos += 1
-            arity = "0"
-            while self.stc.GetCharAt(pos).isdigit():
-                arity += self.stc.GetCharAt(pos)
-                pos += 1
-            return int(arity)
-
-        arity = 0
-        if self.stc.GetCharAt(pos) != "(":
-            if self.stc.GetCharAt(pos + 1) == "(":
-                pos += 1
-            else:
-                return arity
-        sF = pos + 1 if pos + 1 < self.stc.GetLength() else self.stc.GetLength() - 1
-        sT = pos + 6 if pos + 6 < self.stc.GetLength() else self.stc.GetLength() - 1
-        postfix = self.stc.GetText()[sF : sT].strip()
-        if self.stc.GetCharAt(pos) == "(" and postfix and postfix[0] == ")":
-            return 0
-        else:
-            arity = 1
-        text = self.stc.GetText()[pos:pos + 1000]
-        gtokens = self.tokenizer.GetTokens(text)
-        tokens = []
-        try:
-            for token in gtokens:
-                if token.value == " ": continue
-                tokens.append(token.value)
-        except:
-            pass
-        for token in tokens:
-            if token in open:
-                lvl += 1
-            elif token == "," and lvl == 1:
-                arity += 1
-            elif token in close.values():
-                lvl -= 1
-            if lvl == 0:
-                break
-        return arity
+        return FunArity(self.stc, pos, self.tokenizer)
+
+    def MacrosValue(self, macros):
+        macrosData = ErlangCache.MacrosData(self.module, macros)
+        return macrosData.value if macrosData else None
 
     def GetRecordNavAndHelp(self, record):
         if record[0] == "#": record = record[1:]
         recordData = ErlangCache.RecordData(self.module, record)
         if not recordData: return
-        return ((recordData.moduleData.file, recordData.line), self._RecordHelp(recordData))
+        return ((recordData.file, recordData.line), self._RecordHelp(recordData))
 
     def GetMacrosNavAndHelp(self, macros):
         if macros[0] == "?": macros = macros[1:]
         macrosData = ErlangCache.MacrosData(self.module, macros)
         if not macrosData: return
-        return ((macrosData.moduleData.file, macrosData.line), self._MacrosHelp(macrosData))
+        return ((macrosData.file, macrosData.line), self._MacrosHelp(macrosData))
 
 
 class ErlangSimpleCompleter(wx.Frame):
@@ -430,7 +418,7 @@ class ErlangSimpleCompleter(wx.Frame):
                 data = ErlangCache.AllRecordFields(record)
             elif fType == ErlangTokenType.RECORD or fValue == "#":
                 self.prefix = "" if fValue == "#" else fValue[1:]
-                data = ErlangCache.AllRecords()
+                data = ErlangCache.AllRecords(self.prefix)
         self._PrepareData(data)
 
     def _PrepareData(self, data):
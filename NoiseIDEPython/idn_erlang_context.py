@@ -0,0 +1,144 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+from idn_token import ErlangTokenizer
+from idn_highlight import ErlangHighlightType
+
+NAVIGATION_STYLES = {ErlangHighlightType.ATOM, ErlangHighlightType.FUNCTION, ErlangHighlightType.FUNDEC,
+                     ErlangHighlightType.MACROS, ErlangHighlightType.MODULE, ErlangHighlightType.RECORD,
+                     ErlangHighlightType.MODULEATTR, ErlangHighlightType.STRING}
+
+OPEN = ['[', '(', '{', 'fun', 'case', 'if', 'try', 'begin', 'receive']
+CLOSE = [']', ')', '}', 'end']
+
+class NavigationContext:
+    """
+    Styled word under position with parts of its line around it.
+    """
+    def __init__(self, style, start, end, value, lineStart, lineEnd, prefix, postfix, lineText):
+        self.style = style
+        self.start = start
+        self.end = end
+        self.value = value
+        self.lineStart = lineStart
+        self.lineEnd = lineEnd
+        self.prefix = prefix
+        self.postfix = postfix
+        self.lineText = lineText
+
+def ErlangWordAtPosition(stc, pos):
+    style = stc.GetStyleAt(pos)
+    start = pos
+    end = pos
+    while stc.GetStyleAt(start - 1) == style:
+        start -= 1
+    while stc.GetStyleAt(end + 1) == style:
+        end += 1
+    if start == end and not stc.GetTextRange(start, start+1).isalpha():
+        return False
+    end += 1
+    return (start, end, stc.GetTextRange(start, end))
+
+def NavigationContextAt(stc, pos, styles = NAVIGATION_STYLES):
+    style = stc.GetStyleAt(pos)
+    if style not in styles:
+        return None
+    result = ErlangWordAtPosition(stc, pos)
+    if not result: return None
+    (start, end, value) = result
+    line = stc.LineFromPosition(pos)
+    lineStart = stc.PositionFromLine(line)
+    lineEnd = stc.GetLineEndPosition(line)
+    return NavigationContext(style, start, end, value, lineStart, lineEnd, stc.GetTextRange(lineStart, start),
+                             stc.GetTextRange(end, lineEnd), stc.GetLine(line).strip())
+
+def PrefixModule(prefix, module, macrosValue = None):
+    """
+    Module of remote call from text before function name, current module for local calls.
+    Macros used as module is resolved by macrosValue(name).
+    """
+    if not prefix or prefix[-1] != ":" or prefix[-2:-1] == ")":
+        return module
+    name = ""
+    i = -2
+    while abs(i) <= len(prefix) and (prefix[i].isalpha() or prefix[i].isdigit() or prefix[i] == "_"):
+        name += prefix[i]
+        i -= 1
+    name = name[::-1]
+    if abs(i) <= len(prefix) and prefix[i] == "?" and macrosValue:
+        name = macrosValue(name) or name
+    if not name or not name[0].islower():
+        return module
+    return name
+
+def IncludePath(context):
+    """
+    (path, isIncludeLib) of include attribute navigated from its name or its string, (None, False) otherwise.
+    """
+    attribute = context.value.lstrip("-")
+    if context.style == ErlangHighlightType.MODULEATTR and attribute in ["include", "include_lib"]:
+        return (context.postfix[2:len(context.postfix)-3], attribute == "include_lib")
+    elif context.style == ErlangHighlightType.STRING and context.lineText.startswith("-include"):
+        isIncludeLib = context.lineText.startswith("-include_lib")
+        s = 14 if isIncludeLib else 10
+        return (context.lineText[s:len(context.lineText)-3], isIncludeLib)
+    return (None, False)
+
+def ExportedFunctionLine(stc, name):
+    (exports, _s, _end, _last) = stc.lexer.GetAllExports()
+    if name + "/" not in exports:
+        return None
+    return 1 + stc.LineFromPosition(stc.GetText().find(name + "/"))
+
+def IsInExports(stc):
+    (_f, start, end, _l) = stc.lexer.GetAllExports()
+    return start is not None and start <= stc.GetCurrentPos() <= end
+
+def Vars(stc, exclude = None):
+    """
+    Variables of current function before caret.
+    """
+    funData = stc.lexer.GetCurrentFunction()
+    if funData:
+        tokens = stc.lexer.TokensInRange(funData[1], stc.GetCurrentPos())
+        return list({token.value for token in tokens
+                     if token.type == ErlangHighlightType.VAR and token.value != exclude})
+    return []
+
+def FunArity(stc, pos, tokenizer = None):
+    """
+    Arity of function call or reference whose name ends at pos.
+    """
+    if stc.GetCharAt(pos) == "/":
+        pos += 1
+        arity = "0"
+        while stc.GetCharAt(pos).isdigit():
+            arity += stc.GetCharAt(pos)
+            pos += 1
+        return int(arity)
+
+    arity = 0
+    if stc.GetCharAt(pos) != "(":
+        if stc.GetCharAt(pos + 1) == "(":
+            pos += 1
+        else:
+            return arity
+    sF = pos + 1 if pos + 1 < stc.GetLength() else stc.GetLength() - 1
+    sT = pos + 6 if pos + 6 < stc.GetLength() else stc.GetLength() - 1
+    postfix = stc.GetText()[sF : sT].strip()
+    if stc.GetCharAt(pos) == "(" and postfix and postfix[0] == ")":
+        return 0
+    else:
+        arity = 1
+    text = stc.GetText()[pos:pos + 1000]
+    tokens = [token.value for token in (tokenizer or ErlangTokenizer()).GetTokens(text) if token.value != " "]
+    lvl = 0
+    for token in tokens:
+        if token in OPEN:
+            lvl += 1
+        elif token == "," and lvl == 1:
+            arity += 1
+        elif token in CLOSE:
+            lvl -= 1
+        if lvl == 0:
+            break
+    return arity
@@ -1,154 +1,457 @@
 import re
-from wx.stc import STC_FOLDLEVELHEADERFLAG, STC_FOLDLEVELBASE
-from idn_highlight import ErlangHighlighter, ErlangHighlightType, IgorHighlighter, IgorHighlightType
+import time
+from threading import Thread
+from bisect import bisect_left, bisect_right, insort
+from idn_highlight import ErlangHighlighter, ErlangHighlightType, IgorHighlighter, IgorHighlightType, LineTokenCache
 from idn_lexer import BaseLexer
+from idn_token import Token
 
 __author__ = 'Yaroslav'
 
+STRING_CONTINUATION_RE = re.compile(r'(?:[^"\\\r\n]|\\.)*("?)')
+CLOSED_STRING_RE = re.compile(r'^"(?:[^"\\]|\\.)*"$')
+
 class ErlangLexer(BaseLexer):
+    """
+    Styles text incrementally. Line data is kept in line indexed list that is shifted on lines added or
+    removed by modifications. Every line keeps hash of its text, state at line start and end
+    (open string, open form) and its tokens. Unchanged line with unchanged start state reuses its tokens,
+    styling goes past requested range only while line end states differ from stored ones.
+    Function clauses, module attributes, specs and full stops are kept in sorted line lists,
+    so function and attribute spans are found with bisect.
+    """
+    TYPE_ATTRIBUTES = {"-spec", "-callback", "-type", "-opaque", "-record"}
+    DEFAULT_STYLE = ErlangHighlightType.DEFAULT
+    SLICE_LINES = 100
+
     def __init__(self, stc):
         BaseLexer.__init__(self, stc)
         self.highlighter = ErlangHighlighter()
-        self.linesData = {}
+        self.tokenCache = LineTokenCache(self.highlighter)
+        self.linesData = []
+        self.funLines = []
+        self.attributeLines = []
+        self.specLines = []
+        self.stopLines = []
+        self.idleLine = 0
+        self.changedLine = -1
+        self.lexJob = 0
+        self.lexing = False
+        self.lexedLines = None
+        self.onLexed = None
 
-    def StyleText(self, startPos, endPos):
+    def SetMode(self, mode, onLexed = None):
+        """
+        In large mode whole text is lexed on worker thread, style events style only viewport
+        and the rest is styled by StyleSlice calls in idle time.
+        """
+        self.mode = mode
+        self.idleLine = 0
+        if mode == self.MODE_LARGE:
+            self.StartBackgroundLexing(onLexed)
+
+    def StartBackgroundLexing(self, onLexed):
+        """
+        Lexes snapshot of text on worker thread. Job is restarted on edits, so outdated job stops early
+        and its lines are never installed.
+        """
+        self.lexJob += 1
+        job = self.lexJob
+        self.onLexed = onLexed
+        lines = self.stc.GetText().split("\n")
+        def lex():
+            highlighter = ErlangHighlighter()
+            result = []
+            state = LineData.EMPTY_STATE
+            for i, text in enumerate(lines):
+                if job != self.lexJob:
+                    return
+                if i < len(lines) - 1:
+                    text += "\n"
+                lineData = self._LineData(text, hash(text), state, highlighter)
+                result.append(lineData)
+                state = lineData.endState
+            if job != self.lexJob:
+                return
+            self.lexedLines = (job, result)
+            self.lexing = False
+            if onLexed:
+                onLexed()
+        self.lexing = True
+        worker = Thread(target = lex)
+        worker.setDaemon(True)
+        worker.start()
+
+    def InstallLexedLines(self):
+        """
+        Takes lines lexed by worker, lines lexed on GUI thread meanwhile are kept.
+        Lines whose text differs from lexed snapshot are left for styling.
+        """
+        if not self.lexedLines: return
+        (job, lines) = self.lexedLines
+        self.lexedLines = None
+        if job != self.lexJob: return
+        lineCount = self.stc.GetLineCount()
+        for line, lineData in enumerate(lines[:lineCount]):
+            oldData = self._DataAt(line)
+            if oldData and oldData.textHash == lineData.textHash:
+                continue
+            if lineData.textHash != hash(self.stc.GetLine(line)):
+                continue
+            self._SetLineData(line, lineData)
+
+    def HasPendingStyling(self):
+        return self.mode == self.MODE_LARGE and not self.lexing and self.idleLine < self.stc.GetLineCount()
+
+    def StyleNeeded(self, endPos):
+        if self.mode != self.MODE_LARGE:
+            BaseLexer.StyleNeeded(self, endPos)
+            return
+        startPos = self.stc.GetEndStyled()
+        startLine = self.stc.LineFromPosition(startPos)
+        endLine = self.stc.LineFromPosition(endPos)
+        self.idleLine = min(self.idleLine, startLine)
+        if endLine - startLine > 2 * self.stc.LinesOnScreen():
+            startLine = max(startLine, self.stc.DocLineFromVisible(self.stc.GetFirstVisibleLine()))
+        lastLine = self.StyleText(self.stc.PositionFromLine(startLine), endPos, endLine)
+        self.FoldLines(startLine - 1, lastLine)
+
+    def StyleSlice(self, budget):
+        """
+        Styles lines that were skipped by viewport styling or were not styled yet, until budget (seconds) is spent.
+        """
+        deadline = time.time() + budget
+        lineCount = self.stc.GetLineCount()
+        line = self.idleLine
+        prevData = self._DataAt(line - 1)
+        state = prevData.endState if prevData else LineData.EMPTY_STATE
+        while line < lineCount and time.time() < deadline:
+            lineData = self._DataAt(line)
+            if (lineData and lineData.styled and lineData.startState == state and
+                lineData.textHash == hash(self.stc.GetLine(line))):
+                state = lineData.endState
+                line += 1
+                continue
+            maxLine = min(lineCount - 1, line + self.SLICE_LINES)
+            lastLine = self.StyleText(self.stc.PositionFromLine(line), self.stc.PositionFromLine(maxLine), maxLine)
+            self.FoldLines(line - 1, lastLine)
+            state = self.linesData[lastLine].endState
+            line = lastLine + 1
+        self.idleLine = line
+
+    def StyleText(self, startPos, endPos, maxLine = None):
         startLine = self.stc.LineFromPosition(startPos)
         startLineBeginPos = self.stc.PositionFromLine(startLine)
         endLine = self.stc.LineFromPosition(endPos)
-        endLineEndPos = self.stc.GetLineEndPosition(endLine)
+        lineCount = self.stc.GetLineCount()
+        self._Truncate(lineCount)
         self.stc.StartStyling(startLineBeginPos, 0x1f)
         lastEnd = startLineBeginPos
         defaultStyle = ErlangHighlightType.DEFAULT
-        while startLine <= endLine:
-            prevData = self.linesData[startLine] if startLine in self.linesData else None
-
-            if prevData and prevData.functionEnd:
-                line = startLine
-                while line > 0:
-                    if self.linesData[line].functionName != None and self.linesData[line].functionEnd == prevData.functionEnd:
-                        self.linesData[line].functionEnd = None
-                        break
-                    line -= 1
-
-            lineData = LineData()
-            self.linesData[startLine] = lineData
-            lineStart = self.stc.PositionFromLine(startLine)
-            text = self.stc.GetLine(startLine)
-            tokens = self.highlighter.GetHighlightingTokens(text)
-            for token in tokens:
+        prevData = self._DataAt(startLine - 1)
+        state = prevData.endState if prevData else LineData.EMPTY_STATE
+        line = startLine
+        while line < lineCount:
+            oldData = self._DataAt(line)
+            # lines without data were never styled, they are left for later style requests
+            if line > endLine and (oldData is None or oldData.startState == state):
+                break
+            if maxLine is not None and line > maxLine:
+                break
+            lineData = self._LexLine(line, state)
+            lineData.styled = True
+            lineStart = self.stc.PositionFromLine(line)
+            for token in lineData.tokens:
                 start = lineStart + token.start
                 if start > lastEnd:
                     self.stc.SetStyling(start - lastEnd, defaultStyle)
-                self.stc.SetStyling(len(token.value), token.type)
-                lastEnd  = lineStart + token.end
-                if token.type == ErlangHighlightType.FUNDEC:
-                    lineData.functionName = token.value
-                    lineData.functionStart = token.start + lineStart
-                    line = startLine - 1
-                    while line > 0:
-                        if self.linesData[line].functionName == token.value:
-                            self.linesData[line].functionEnd = self.stc.GetLineEndPosition(startLine - 1)
-                            break
-                        line -= 1
-                elif token.type == ErlangHighlightType.FUNCTION:
-                    if tokens[0].value == "-spec":
-                        lineData.specName = token.value
-                        lineData.specStart = tokens[0].start + lineStart
-                elif token.type == ErlangHighlightType.FULLSTOP:
-                    lineData.functionEnd = token.end + lineStart
-                    line = startLine
-                    while line > 0:
-                        if self.linesData[line].functionName != None and self.linesData[line].functionEnd == None:
-                            self.linesData[line].functionEnd = token.end + lineStart
-                            break
-                        elif self.linesData[line].specName != None and self.linesData[line].specEnd == None:
-                            self.linesData[line].specEnd = token.end + lineStart
-                            break
-                        line -= 1
-
-            startLine += 1
+                self.stc.SetStyling(token.end - token.start, token.type)
+                lastEnd = lineStart + token.end
+            state = lineData.endState
+            endLine = max(endLine, line)
+            line += 1
 
+        # line end is styled too, so styling in slices leaves no gaps
+        if endLine + 1 < lineCount:
+            endLineEndPos = self.stc.PositionFromLine(endLine + 1)
+        else:
+            endLineEndPos = self.stc.GetLength()
         if lastEnd < endLineEndPos:
             self.stc.SetStyling(endLineEndPos - lastEnd, defaultStyle)
+        return endLine
+
+    def _LexLine(self, line, state):
+        oldData = self._DataAt(line)
+        text = self.stc.GetLine(line)
+        textHash = hash(text)
+        if oldData and oldData.textHash == textHash and oldData.startState == state:
+            return oldData
+        lineData = self._LineData(text, textHash, state)
+        self._SetLineData(line, lineData)
+        return lineData
+
+    def UpdateStructure(self):
+        """
+        Lexes lines changed after last styling without styling them, so structure queries see current text.
+        Done once per document revision and stops after last changed line as soon as line end state matches
+        stored start state of next line. In large mode only lines up to caret neighbourhood are updated,
+        the rest is left to background lexing and idle styling.
+        """
+        def update():
+            lineCount = self.stc.GetLineCount()
+            self._Truncate(lineCount)
+            lastLine = lineCount
+            if self.mode == self.MODE_LARGE:
+                lastLine = min(lineCount, self.stc.GetCurrentLine() + self.SLICE_LINES)
+            line = self.stc.LineFromPosition(self.stc.GetEndStyled())
+            prevData = self._DataAt(line - 1)
+            state = prevData.endState if prevData else LineData.EMPTY_STATE
+            while line < lastLine:
+                state = self._LexLine(line, state).endState
+                line += 1
+                nextData = self._DataAt(line)
+                if line > self.changedLine and nextData and nextData.startState == state:
+                    break
+            if line > self.changedLine:
+                self.changedLine = -1
+            return True
+        self.Cached("structure", update)
+
+    def _LineData(self, text, textHash, startState, highlighter = None):
+        (inString, inForm) = startState
+        lineData = LineData(textHash, startState)
+        tokens = []
+        pos = 0
+        if inString:
+            m = STRING_CONTINUATION_RE.match(text)
+            pos = m.end()
+            if pos > 0:
+                tokens.append(Token(ErlangHighlightType.STRING, text[:pos], 0, pos))
+            inString = m.group(1) != '"'
+        if not inString:
+            if highlighter:
+                lineTokens = highlighter.GetHighlightingTokens(text, pos)
+            elif pos == 0:
+                lineTokens = self.tokenCache.Tokens(text)
+            else:
+                lineTokens = self.highlighter.GetHighlightingTokens(text, pos)
+            tokens += lineTokens
+            if lineTokens:
+                last = lineTokens[-1]
+                inString = last.type == ErlangHighlightType.STRING and not CLOSED_STRING_RE.match(last.value)
+        if tokens and tokens[0].type == ErlangHighlightType.MODULEATTR:
+            lineData.attribute = tokens[0].value
+        for token in tokens:
+            if token.type == ErlangHighlightType.FUNDEC:
+                lineData.functionName = token.value
+                lineData.functionColumn = token.start
+            elif token.type == ErlangHighlightType.FUNCTION:
+                if tokens[0].value == "-spec" and lineData.specName is None:
+                    lineData.specName = token.value
+                    lineData.specColumn = tokens[0].start
+            elif token.type == ErlangHighlightType.FULLSTOP:
+                lineData.fullstopColumn = token.start + token.value.index(".") + 1
+            if token.type != ErlangHighlightType.COMMENT:
+                inForm = True
+        if lineData.fullstopColumn is not None:
+            inForm = False
+        lineData.tokens = tokens
+        lineData.endState = (inString, inForm)
+        return lineData
 
-    def DoFold(self, startPos, endPos):
-        startLine = self.stc.LineFromPosition(startPos) - 1
+    def DocumentChanged(self):
+        BaseLexer.DocumentChanged(self)
+        self.tokenCache.Invalidate(self.stc.GetLineCount())
+
+    def LineTokens(self, line):
+        """
+        Tokens of line, taken from styling data when line is styled and unchanged.
+        """
+        text = self.stc.GetLine(line)
+        lineData = self._DataAt(line)
+        if lineData and lineData.textHash == hash(text):
+            self.tokenCache.hits += 1
+            return lineData.tokens
+        return self.tokenCache.Tokens(text)
+
+    def TokensInRange(self, startPos, endPos):
+        """
+        Tokens between positions, last line is tokenized only up to endPos.
+        """
+        startLine = self.stc.LineFromPosition(startPos)
         endLine = self.stc.LineFromPosition(endPos)
-        prevFoldLevel = 0
-        if startLine > 0:
-            prevFoldLevel = self.stc.GetFoldLevel(startLine - 1)
-        nextLineFoldLevel = prevFoldLevel
-        if prevFoldLevel ^ STC_FOLDLEVELHEADERFLAG == STC_FOLDLEVELBASE:
-            nextLineFoldLevel = STC_FOLDLEVELBASE + 1
-        elif prevFoldLevel == STC_FOLDLEVELBASE + 2:
-            nextLineFoldLevel = 0
-        while startLine <= endLine:
-            currentLineFoldLevel = nextLineFoldLevel
-            text = self.stc.GetLine(startLine)
-            tokens = self.highlighter.GetHighlightingTokens(text)
-            for token in tokens:
-                if (token.type in {ErlangHighlightType.FUNDEC, ErlangHighlightType.RECORDDEF}
-                    or token.value == "-spec"):
-                    currentLineFoldLevel = STC_FOLDLEVELBASE
-                    nextLineFoldLevel = STC_FOLDLEVELBASE  + 1
-                elif token.type == ErlangHighlightType.FULLSTOP:
-                    if currentLineFoldLevel ==  STC_FOLDLEVELBASE  + 1:
-                        currentLineFoldLevel = STC_FOLDLEVELBASE  + 2
-                    elif currentLineFoldLevel == STC_FOLDLEVELBASE:
-                        currentLineFoldLevel = 0
-                        if prevFoldLevel == STC_FOLDLEVELHEADERFLAG | STC_FOLDLEVELBASE:
-                            self.stc.SetFoldLevel(startLine - 1, 0)
-                    nextLineFoldLevel = 0
-            if currentLineFoldLevel == STC_FOLDLEVELBASE:
-                currentLineFoldLevel |= STC_FOLDLEVELHEADERFLAG
-            if (currentLineFoldLevel == STC_FOLDLEVELHEADERFLAG | STC_FOLDLEVELBASE and
-                currentLineFoldLevel == prevFoldLevel):
-                self.stc.SetFoldLevel(startLine - 1, 0)
-            prevFoldLevel = currentLineFoldLevel
-            self.stc.SetFoldLevel(startLine, currentLineFoldLevel)
-            startLine += 1
+        result = []
+        for line in xrange(startLine, endLine + 1):
+            lineStart = self.stc.PositionFromLine(line)
+            if line == endLine:
+                tokens = self.tokenCache.Tokens(self.stc.GetTextRange(lineStart, endPos))
+            else:
+                tokens = self.LineTokens(line)
+            if line == startLine:
+                startColumn = startPos - lineStart
+                tokens = [token for token in tokens if token.start >= startColumn]
+            result += tokens
+        return result
+
+    def _SetLineData(self, line, lineData):
+        oldData = self._DataAt(line)
+        if oldData:
+            self._RemoveLineFromSpans(line, oldData)
+        if line >= len(self.linesData):
+            self.linesData.extend([None] * (line + 1 - len(self.linesData)))
+        self.linesData[line] = lineData
+        if lineData.functionName is not None:
+            insort(self.funLines, line)
+        if lineData.attribute is not None:
+            insort(self.attributeLines, line)
+        if lineData.specName is not None:
+            insort(self.specLines, line)
+        if lineData.fullstopColumn is not None:
+            insort(self.stopLines, line)
+
+    def _RemoveLineFromSpans(self, line, lineData):
+        for lines, value in [(self.funLines, lineData.functionName),
+                             (self.attributeLines, lineData.attribute),
+                             (self.specLines, lineData.specName),
+                             (self.stopLines, lineData.fullstopColumn)]:
+            if value is None: continue
+            i = bisect_left(lines, line)
+            if i < len(lines) and lines[i] == line:
+                del lines[i]
+
+    def _DataAt(self, line):
+        if 0 <= line < len(self.linesData):
+            return self.linesData[line]
+        return None
+
+    def _Truncate(self, lineCount):
+        for line in xrange(lineCount, len(self.linesData)):
+            if self.linesData[line]:
+                self._RemoveLineFromSpans(line, self.linesData[line])
+        del self.linesData[lineCount:]
+
+    def LinesAdded(self, line, count):
+        """
+        Called on every text modification. Shifts data of lines after modified line, count is negative
+        when lines were removed or 0 when text changed within line. Modified line itself is relexed because
+        its hash no longer matches. Last changed line is kept for UpdateStructure.
+        Background lexing of old text is restarted.
+        """
+        if self.lexing or self.lexedLines:
+            self.lexedLines = None
+            self.StartBackgroundLexing(self.onLexed)
+        if self.changedLine > line:
+            self.changedLine = max(line, self.changedLine + count)
+        self.changedLine = max(self.changedLine, line + max(count, 0))
+        if not count:
+            return
+        if count < 0:
+            for removed in xrange(line + 1, min(len(self.linesData), line + 1 - count)):
+                if self.linesData[removed]:
+                    self._RemoveLineFromSpans(removed, self.linesData[removed])
+            del self.linesData[line + 1:line + 1 - count]
+        elif line + 1 < len(self.linesData):
+            self.linesData[line + 1:line + 1] = [None] * count
+        for lines in [self.funLines, self.attributeLines, self.specLines, self.stopLines]:
+            for i in xrange(bisect_right(lines, line), len(lines)):
+                lines[i] += count
+        self.idleLine = min(self.idleLine, line)
+
+    def _FirstStopFrom(self, line):
+        i = bisect_left(self.stopLines, line)
+        return self.stopLines[i] if i < len(self.stopLines) else None
+
+    def FunctionSpan(self, line):
+        """
+        Returns (name, start, end) of function clause declared at or before line, end is None for unfinished clause.
+        Clause ends with first full stop after declaration or right before next clause declaration.
+        """
+        i = bisect_right(self.funLines, line) - 1
+        if i < 0: return None
+        funLine = self.funLines[i]
+        data = self.linesData[funLine]
+        start = self.stc.PositionFromLine(funLine) + data.functionColumn
+        nextFunLine = self.funLines[i + 1] if i + 1 < len(self.funLines) else None
+        return (data.functionName, start, self._FormEnd(funLine, nextFunLine))
+
+    def _FormEnd(self, line, nextFormLine):
+        """
+        End of form started at line: first full stop or end of line before next form, None if form is unfinished.
+        """
+        stopLine = self._FirstStopFrom(line)
+        if stopLine is not None and (nextFormLine is None or stopLine < nextFormLine):
+            return self.stc.PositionFromLine(stopLine) + self.linesData[stopLine].fullstopColumn
+        elif nextFormLine is not None:
+            return self.stc.GetLineEndPosition(nextFormLine - 1)
+        return None
+
+    def _NextFormLine(self, line):
+        lines = []
+        for formLines in [self.funLines, self.attributeLines]:
+            i = bisect_right(formLines, line)
+            if i < len(formLines):
+                lines.append(formLines[i])
+        return min(lines) if lines else None
+
+    def AttributeSpan(self, line):
+        """
+        Returns (attribute, start, end) of module attribute started at or before line and not followed by
+        function clause before line. End is None for unfinished attribute.
+        """
+        i = bisect_right(self.attributeLines, line) - 1
+        if i < 0: return None
+        attributeLine = self.attributeLines[i]
+        j = bisect_right(self.funLines, line) - 1
+        if j >= 0 and self.funLines[j] > attributeLine: return None
+        start = self.stc.PositionFromLine(attributeLine)
+        end = self._FormEnd(attributeLine, self._NextFormLine(attributeLine))
+        return (self.linesData[attributeLine].attribute, start, end)
+
+    def Attributes(self, attribute):
+        """
+        Spans of all attributes with given name in document order.
+        """
+        self.UpdateStructure()
+        result = []
+        for line in self.attributeLines:
+            if self.linesData[line].attribute == attribute:
+                start = self.stc.PositionFromLine(line)
+                result.append((line, start, self._FormEnd(line, self._NextFormLine(line))))
+        return result
+
+    def IsFoldStart(self, token):
+        return token.type in {ErlangHighlightType.FUNDEC, ErlangHighlightType.RECORDDEF} or token.value == "-spec"
+
+    def IsFoldEnd(self, token):
+        return token.type == ErlangHighlightType.FULLSTOP
 
     def IsInFunction(self):
-        line = self.stc.GetCurrentLine()
-        caretPos = self.stc.GetCurrentPos()
-        while line > 0:
-            data = self.linesData[line]
-            if data.functionEnd and caretPos > data.functionEnd: return False
-            if data.functionName: return not data.functionEnd or data.functionEnd >= caretPos
-            line -= 1
-        return False
+        span = self.FunctionSpan(self.stc.GetCurrentLine())
+        if not span: return False
+        (_name, _start, end) = span
+        return not end or end >= self.stc.GetCurrentPos()
 
     def GetCurrentFunction(self):
-        line = self.stc.GetCurrentLine()
         caretPos = self.stc.GetCurrentPos()
-        while line > 0:
-            data = self.linesData[line]
-            if data.functionEnd and caretPos > data.functionEnd:
-                break
-            if data.functionName:
-                end =  data.functionEnd
-                if not end:
-                    end = caretPos
-                if end >= caretPos:
-                    return (data.functionName,
-                            data.functionStart,
-                            end,
-                            self.stc.GetTextRange(data.functionStart, end))
-                else:
-                    break
-            line -= 1
-        return None
+        span = self.FunctionSpan(self.stc.GetCurrentLine())
+        if not span: return None
+        (name, start, end) = span
+        if not end:
+            end = caretPos
+        if end < caretPos: return None
+        return (name, start, end, self.stc.GetTextRange(start, end))
 
     def IsInSpec(self):
         line = self.stc.GetCurrentLine()
-        caretPos = self.stc.GetCurrentPos()
-        while line > 0:
-            data = self.linesData[line]
-            if data.functionEnd or data.functionStart or data.functionName:
-                return False
-            if data.specEnd: return data.specEnd > caretPos
-            line -= 1
-        return False
+        i = bisect_right(self.specLines, line) - 1
+        if i < 0: return False
+        specLine = self.specLines[i]
+        j = bisect_right(self.funLines, line) - 1
+        if j >= 0 and self.funLines[j] >= specLine: return False
+        stopLine = self._FirstStopFrom(specLine)
+        if stopLine is None: return False
+        specEnd = self.stc.PositionFromLine(stopLine) + self.linesData[stopLine].fullstopColumn
+        return specEnd > self.stc.GetCurrentPos()
 
 
     def RecordFieldUnderCursor(self):
@@ -163,12 +466,11 @@ class ErlangLexer(BaseLexer):
         caretPos = self.stc.GetCurrentPos()
         if self.IsInFunction():
             funData = self.GetCurrentFunction()
-            text = funData[3]
-            text = text[:caretPos - funData[1]]
+            startPos = funData[1]
         else:
             line = self.stc.GetCurrentLine()
-            text = self.stc.GetTextRange(self.stc.PositionFromLine(line - 10), caretPos)
-        tokens = self.highlighter.GetHighlightingTokens(text)
+            startPos = self.stc.PositionFromLine(max(0, line - 10))
+        tokens = self.TokensInRange(startPos, caretPos)
         tokens.reverse()
         tokens  = [token for token in tokens if token.type not in [ErlangHighlightType.COMMENT]]
         result = False
@@ -217,63 +519,81 @@ class ErlangLexer(BaseLexer):
         return (result, record, prefix)
 
     def IsInTypeBlock(self):
-        r = re.compile(r"(?:^-spec|^-callback|^-type|^-record)(.*?)(?:^[a-z].*?|^-[a-z]+|\.)", re.MULTILINE | re.DOTALL)
-        text = self.stc.GetText()
+        self.UpdateStructure()
         caretPos = self.stc.GetCurrentPos()
-        pos = 0
-        while True:
-            match = r.search(text, pos)
-            if not match: return False
-            if caretPos > match.start() and caretPos < match.end():
-                return True
-            pos = match.end()
-        return False
+        span = self.AttributeSpan(self.stc.LineFromPosition(caretPos))
+        if not span: return False
+        (attribute, start, end) = span
+        return attribute in self.TYPE_ATTRIBUTES and caretPos > start and (end is None or caretPos < end)
+
+    def ModuleAttributeEnd(self):
+        modules = self.Attributes("-module")
+        return modules[0][2] or 0 if modules else 0
 
     def GetAllExports(self):
-        r = re.compile("^-export\(\[\s*(.*?)\s*\]\)\.", re.MULTILINE | re.DOTALL)
-        text = self.stc.GetText()
-        pos = 0
-        result = None
+        """
+        Returns (exports, start, end, lastInsertPosition), start is None if module has no export attribute.
+        Cached per document revision, never modifies document.
+        """
+        return self.Cached("exports", self._FindExports)
+
+    def _FindExports(self):
+        exports = []
+        end = 0
         lastInsertPosition = None
         start = None
-        while True:
-            match = r.search(text, pos)
-            if not match:
-                if result is None:
-                    mre = re.compile("^-module\(.*?\)\.", re.MULTILINE | re.DOTALL)
-                    match = mre.search(text, 0)
-                    if match:
-                        end = match.end()
-                    else:
-                        end = 0
-                    self.stc.InsertText(end, "\n-export([\n]).")
-                    return self.GetAllExports()
-                else:
-                    break
-            if not start:
-                start = match.start(1)
-            pos = match.end(0)
-            lastInsertPosition = match.end(1)
-            if result is None:
-                result = ""
-            result += match.group(1)
-        if result is None:
-            result = ""
-        return (result.strip(), start, pos, lastInsertPosition)
-
-
-class LineData:
-    def __init__(self):
+        for (line, _attributeStart, attributeEnd) in self.Attributes("-export"):
+            if attributeEnd is None: continue
+            brackets = [self.stc.PositionFromLine(l) + token.start
+                        for l in xrange(line, self.stc.LineFromPosition(attributeEnd - 1) + 1)
+                        for token in self.LineTokens(l)
+                        if token.type == ErlangHighlightType.BRACKET and token.value in "[]"]
+            if len(brackets) < 2: continue
+            (listStart, listEnd) = (brackets[0] + 1, brackets[-1])
+            text = self.stc.GetTextRange(listStart, listEnd)
+            if text.strip():
+                exportsStart = listStart + len(text) - len(text.lstrip())
+                listEnd -= len(text) - len(text.rstrip())
+            else:
+                exportsStart = listEnd
+            if start is None:
+                start = exportsStart
+            end = attributeEnd
+            lastInsertPosition = listEnd
+            exports.append(text.strip())
+        return (",".join(exports), start, end, lastInsertPosition)
+
+    def EnsureExportAttribute(self):
+        exports = self.GetAllExports()
+        if exports[1] is not None:
+            return exports
+        self.stc.InsertText(self.ModuleAttributeEnd(), "\n-export([\n]).")
+        self.DocumentChanged()
+        return self.GetAllExports()
+
+
+class LineData(object):
+    __slots__ = ("textHash", "startState", "endState", "tokens", "functionName", "functionColumn",
+                 "specName", "specColumn", "fullstopColumn", "attribute", "styled")
+
+    EMPTY_STATE = (False, False)
+
+    def __init__(self, textHash = None, startState = EMPTY_STATE):
+        self.textHash = textHash
+        self.startState = startState
+        self.endState = startState
+        self.tokens = []
         self.functionName = None
-        self.functionStart = None
-        self.functionEnd = None
+        self.functionColumn = None
         self.specName = None
-        self.specStart = None
-        self.specEnd = None
+        self.specColumn = None
+        self.fullstopColumn = None
+        self.attribute = None
+        self.styled = False
 
     def __str__(self):
-        return "Fun: {} ({}, {}). Spec: {} ({}, {})".format(self.functionName, self.functionStart, self.functionEnd,
-                                                           self.specName, self.specStart, self.specEnd)
+        return "Fun: {} ({}). Spec: {} ({}). Full stop: {}. State: {} -> {}".format(self.functionName,
+            self.functionColumn, self.specName, self.specColumn, self.fullstopColumn, self.startState, self.endState)
 
 class RecordStart:
     def __init__(self, record, start):
@@ -281,9 +601,16 @@ class RecordStart:
         self.start = start
 
 class IgorLexer(BaseLexer):
+    DEFAULT_STYLE = IgorHighlightType.DEFAULT
+
     def __init__(self, stc):
         BaseLexer.__init__(self, stc)
         self.highlighter = IgorHighlighter()
+        self.tokenCache = LineTokenCache(self.highlighter)
+
+    def DocumentChanged(self):
+        BaseLexer.DocumentChanged(self)
+        self.tokenCache.Invalidate(self.stc.GetLineCount())
 
     def StyleText(self, startPos, endPos):
         startLine = self.stc.LineFromPosition(startPos)
@@ -295,9 +622,7 @@ class IgorLexer(BaseLexer):
         defaultStyle = IgorHighlightType.DEFAULT
         while startLine <= endLine:
             lineStart = self.stc.PositionFromLine(startLine)
-            text = self.stc.GetLine(startLine)
-            tokens = self.highlighter.GetHighlightingTokens(text)
-            for token in tokens:
+            for token in self.LineTokens(startLine):
                 start = lineStart + token.start
                 if start > lastEnd:
                     self.stc.SetStyling(start - lastEnd, defaultStyle)
@@ -306,39 +631,13 @@ class IgorLexer(BaseLexer):
             startLine += 1
         if lastEnd < endLineEndPos:
             self.stc.SetStyling(endLineEndPos - lastEnd, defaultStyle)
+        return endLine
 
-    def DoFold(self, startPos, endPos):
-        startLine = self.stc.LineFromPosition(startPos) - 1
-        endLine = self.stc.LineFromPosition(endPos)
-        prevFoldLevel = 0
-        if startLine > 0:
-            prevFoldLevel = self.stc.GetFoldLevel(startLine - 1)
-        nextLineFoldLevel = prevFoldLevel
-        if prevFoldLevel ^ STC_FOLDLEVELHEADERFLAG == STC_FOLDLEVELBASE:
-            nextLineFoldLevel = STC_FOLDLEVELBASE + 1
-        elif prevFoldLevel == STC_FOLDLEVELBASE + 2:
-            nextLineFoldLevel = 0
-        while startLine <= endLine:
-            currentLineFoldLevel = nextLineFoldLevel
-            text = self.stc.GetLine(startLine)
-            tokens = self.highlighter.GetHighlightingTokens(text)
-            for token in tokens:
-                if (token.value in ["record", "enum", "service", "variant"]):
-                    currentLineFoldLevel = STC_FOLDLEVELBASE
-                    nextLineFoldLevel = STC_FOLDLEVELBASE  + 1
-                elif token.value == "}":
-                    if currentLineFoldLevel ==  STC_FOLDLEVELBASE  + 1:
-                        currentLineFoldLevel = STC_FOLDLEVELBASE  + 2
-                    elif currentLineFoldLevel == STC_FOLDLEVELBASE:
-                        currentLineFoldLevel = 0
-                        if prevFoldLevel == STC_FOLDLEVELHEADERFLAG | STC_FOLDLEVELBASE:
-                            self.stc.SetFoldLevel(startLine - 1, 0)
-                    nextLineFoldLevel = 0
-            if currentLineFoldLevel == STC_FOLDLEVELBASE:
-                currentLineFoldLevel |= STC_FOLDLEVELHEADERFLAG
-            if (currentLineFoldLevel == STC_FOLDLEVELHEADERFLAG | STC_FOLDLEVELBASE and
-                currentLineFoldLevel == prevFoldLevel):
-                self.stc.SetFoldLevel(startLine - 1, 0)
-            prevFoldLevel = currentLineFoldLevel
-            self.stc.SetFoldLevel(startLine, currentLineFoldLevel)
-            startLine += 1
+    def LineTokens(self, line):
+        return self.tokenCache.Tokens(self.stc.GetLine(line))
+
+    def IsFoldStart(self, token):
+        return token.value in ["record", "enum", "service", "variant"]
+
+    def IsFoldEnd(self, token):
+        return token.value == "}"
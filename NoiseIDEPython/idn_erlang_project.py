@@ -17,6 +17,8 @@ from idn_erlangstc import ErlangHighlightedSTCBase, ErlangSTCReadOnly
 from idn_errors_table import ErrorsTableGrid, XrefTableGrid, DialyzerTableGrid
 from idn_notebook import ErlangCompileOptionPanel
 from idn_project import Project
+from idn_search_index import SearchIndex
+from idn_reference_index import ReferenceIndex
 from idn_utils import readFile, writeFile, pystr, Menu, GetImage
 from idn_erlang_utils import IsBeam, IsInclude, IsYrl, IsModule, IsIgor, IsAppSrc
 import core
@@ -62,6 +64,10 @@ class ErlangProject(Project):
         IgorCache.Init(self)
 
         self.SetupDirs()
+        self.searchIndex = SearchIndex(os.path.join(ErlangCache.CacheDir(), self.ProjectName()))
+        self.searchIndex.Start(self.explorer.dirChecker.FileMtimes())
+        self.referenceIndex = ReferenceIndex()
+        self.referenceIndex.Start(self.explorer.dirChecker.files)
         ErlangCache.LoadCacheFromDir(self.ProjectName())
         ErlangCache.LoadCacheFromDir(os.path.join("runtimes", self.GetErlangRuntime()))
         self.AddTabs()
@@ -447,10 +453,11 @@ class ErlangProject(Project):
                 module = pystr(js["module"])
                 if module in self.xrefModules:
                     self.xrefModules.remove(module)
-                if not module in ErlangCache.modules: return
+                moduleData = ErlangCache.modules.get(module)
+                if not moduleData: return
                 undefined = [((u["where_m"], u["where_f"], u["where_a"]),
                               (u["what_m"], u["what_f"], u["what_a"])) for u in js["undefined"]]
-                self.AddXRefErrors(ErlangCache.modules[module].file, undefined)
+                self.AddXRefErrors(moduleData.file, undefined)
                 self.xrefProblemsCount += len(undefined)
                 if len(self.xrefModules) == 0:
                     self.xrefTable.PrepareResult()
@@ -555,10 +562,14 @@ class ErlangProject(Project):
         self.window.toolbar.DeleteTool(self.xrefCheckT.GetId())
         self.window.toolbar.DeleteTool(self.rebuildT.GetId())
         self.window.toolbar.DeleteToolByPos(self.window.toolbar.GetToolsCount() - 1)
+        self.searchIndex.Stop()
+        self.referenceIndex.Stop()
         ErlangCache.Stop()
         Project.Close(self)
 
     def OnProjectFilesModified(self, files):
+        self.searchIndex.Update(files)
+        self.referenceIndex.Update(files)
         toCompile = []
         for f in files:
             editor = self.window.TabMgr.FindPageByPath(f)
@@ -579,9 +590,18 @@ class ErlangProject(Project):
 
 
     def FileSaved(self, path):
+        self.searchIndex.Update([path])
+        self.referenceIndex.Update([path])
         self.Compile(path, True)
 
+    def FilesSaved(self, paths):
+        self.searchIndex.Update(paths)
+        self.referenceIndex.Update(paths)
+        self.Compile(paths)
+
     def OnProjectFilesDeleted(self, files):
+        self.searchIndex.Remove(files)
+        self.referenceIndex.Remove(files)
         for f in files:
             self.AddErrors(f, [])
             self.RemoveUnusedBeams()
@@ -604,13 +624,12 @@ class ErlangProject(Project):
                     editor.Changed()
 
     def OnProjectFilesCreated(self, files):
+        self.searchIndex.Update(files)
+        self.referenceIndex.Update(files)
         self.Compile(files)
 
     def ClearCacheForFile(self, path):
-        name = os.path.basename(path)
-        if IsModule(name):
-            name = name[:-4]
-        ErlangCache.UnloadModule(name, self.GetApp(path))
+        ErlangCache.SourceDeleted(path, self.GetApp(path))
 
     def GetEditorTypes(self):
         return {".config": ErlangHighlightedSTCBase,
@@ -1,5 +1,5 @@
 import re
-from idn_findreplace import FindInProjectDialog, Find
+from idn_findreplace import FindInProjectDialog, Find, ShowReferences, UnsavedTexts
 from idn_token import ErlangTokenType
 
 __author__ = 'Yaroslav'
@@ -14,13 +14,15 @@ from idn_customstc import CustomSTC, ConsoleSTC
 from idn_erlang_completer import ErlangCompleter
 from idn_erlang_constats import TYPE_MODULE, TYPE_UNKNOWN, TYPE_HRL
 from idn_erlang_lexer import ErlangLexer, IgorLexer
+from idn_reference_index import FUNCTION, RECORD, MACROS, MODULE, ATOM
 import core
-from idn_highlight import ErlangHighlightType, IgorHighlightType
+from idn_highlight import ErlangHighlighter, ErlangHighlightType, IgorHighlightType
 from idn_marker_panel import Marker
 from idn_outline import ErlangOutline
 from idn_utils import Menu, camelToLowerUnderscore
 from idn_config import Config
 from idn_erlang_utils import IsModule
+from idn_erlang_context import ErlangWordAtPosition, NavigationContextAt, IncludePath, ExportedFunctionLine
 
 
 class ErlangHighlightedSTCBase(CustomSTC):
@@ -163,18 +165,25 @@ class ErlangSTC(ErlangHighlightedSTCBase):
         style = self.GetStyleAt(self.popupPos)
         line = self.LineFromPosition(start)
         text = self.GetLineText(line)
+        # search result lines come from other files, they are not kept in editor token cache
+        highlighter = ErlangHighlighter()
         if asAtom:
+            compound = self.CompoundFindRefTypes()
+            if self.FindReferencesInIndex("Find reference of atom '{}'".format(value),
+                [(FUNCTION, value), (RECORD, value), (MODULE, value)],
+                lambda r: r.type in compound and r.type != ErlangHighlightType.RECORD): return
             Find(value, "Find reference of atom '{}'".format(value),
                  wholeWords = True,
                  matchCase = True,
                  fileExts = [".erl", ".hrl", ".src"],
-                 resultsFilter = lambda r: self.CheckResult(r, [value], self.CompoundFindRefTypes()))
+                 resultsFilter = lambda r: self.CheckResult(highlighter, r, [value], self.CompoundFindRefTypes()))
         elif style == ErlangHighlightType.ATOM:
+            if self.FindReferencesInIndex("Find reference of atom '{}'".format(value), [(ATOM, value)]): return
             Find(value, "Find reference of atom '{}'".format(value),
                  wholeWords = True,
                  matchCase = True,
                  fileExts = [".erl", ".hrl", ".src"],
-                 resultsFilter = lambda r: self.CheckResult(r, [value], [ErlangHighlightType.ATOM]))
+                 resultsFilter = lambda r: self.CheckResult(highlighter, r, [value], [ErlangHighlightType.ATOM]))
         elif style in [ErlangHighlightType.FUNCTION, ErlangHighlightType.FUNDEC]:
             module = self.ModuleName()
             if style == ErlangHighlightType.FUNCTION:
@@ -190,37 +199,58 @@ class ErlangSTC(ErlangHighlightedSTCBase):
                             macrosData = ErlangCache.MacrosData(self.ModuleName(), macros)
                             if macrosData:
                                 module = macrosData.value
+            if self.FindReferencesInIndex("Find reference of function '{}'".format(value), [(FUNCTION, value)],
+                lambda r: r.module == module): return
             moduleFile = "{}.erl".format(module)
             Find(r"\b{0}:{1}\(|\s{0}:{1}/|^{1}\(".format(module, value), "Find reference of function '{}'".format(value),
                  useRegexp = True,
                  fileExts = [".erl", ".hrl", moduleFile],
-                 resultsFilter = lambda r: self.FunctionCheckResult(r, value, moduleFile))
+                 resultsFilter = lambda r: self.FunctionCheckResult(highlighter, r, value, moduleFile))
         elif style == ErlangHighlightType.MODULE:
+            if self.FindReferencesInIndex("Find reference of module '{}'".format(value), [(MODULE, value)]): return
             Find(r"-module\({0}\)|-extends\({0}\)|\b{0}:".format(value), "Find reference of module '{}'".format(value),
                  useRegexp = True,
                  fileExts = [".erl", ".hrl"],
-                 resultsFilter = lambda r: self.CheckResult(r, [value], [ErlangHighlightType.MODULE]))
+                 resultsFilter = lambda r: self.CheckResult(highlighter, r, [value], [ErlangHighlightType.MODULE]))
         elif style in [ErlangHighlightType.RECORD, ErlangHighlightType.RECORDDEF]:
             if value.startswith("#"): value = value[1:]
+            if self.FindReferencesInIndex("Find reference of record '{}'".format(value), [(RECORD, value)]): return
             Find(r"-record\({0}\b|#{0}\b".format(value), "Find reference of record '{}'".format(value),
                  useRegexp = True,
                  fileExts = [".erl", ".hrl"],
-                 resultsFilter = lambda r: self.CheckResult(r, [value, "#" + value], [ErlangHighlightType.RECORD, ErlangHighlightType.RECORDDEF]))
+                 resultsFilter = lambda r: self.CheckResult(highlighter, r, [value, "#" + value], [ErlangHighlightType.RECORD, ErlangHighlightType.RECORDDEF]))
         elif style == ErlangHighlightType.MACROS:
             if value.startswith("?"): value = value[1:]
+            if self.FindReferencesInIndex("Find reference of macros '{}'".format(value), [(MACROS, value)]): return
             Find(r"-define\({0}\b|\?{0}\b".format(value), "Find reference of macros '{}'".format(value),
                  useRegexp = True,
                  fileExts = [".erl", ".hrl"],
-                 resultsFilter = lambda r: self.CheckResult(r, [value, "?" + value], [ErlangHighlightType.MACROS]))
-
-    def FunctionCheckResult(self, result, value, module):
-        tokens = self.lexer.highlighter.GetHighlightingTokens(result.lineText)
+                 resultsFilter = lambda r: self.CheckResult(highlighter, r, [value, "?" + value], [ErlangHighlightType.MACROS]))
+
+    def FindReferencesInIndex(self, title, keys, accept = None):
+        """
+        Shows references from project reference index, False if index is not ready and regexp search should be used.
+        """
+        index = core.Project.referenceIndex
+        if not index or not index.IsReady():
+            return False
+        texts = UnsavedTexts()
+        references = {}
+        for (kind, name) in keys:
+            for reference in index.References(kind, name, texts):
+                if accept and not accept(reference): continue
+                references.setdefault(reference.file, []).append(reference)
+        ShowReferences(title, references, index.FilesCount(), texts)
+        return True
+
+    def FunctionCheckResult(self, highlighter, result, value, module):
+        tokens = highlighter.GetHighlightingTokens(result.lineText)
         return any([token.value == value and
                     (token.type == ErlangHighlightType.FUNCTION or
                      (token.type == ErlangHighlightType.FUNDEC and os.path.basename(result.file) == module)) for token in tokens])
 
-    def CheckResult(self, result, values, styles):
-        tokens = self.lexer.highlighter.GetHighlightingTokens(result.lineText)
+    def CheckResult(self, highlighter, result, values, styles):
+        tokens = highlighter.GetHighlightingTokens(result.lineText)
         #print values, "tokens:{}".format([token.value for token in tokens])
         #print "result ", any([token.value in values and token.type in styles for token in tokens])
         return any([token.value in values and token.type in styles for token in tokens])
@@ -356,18 +386,7 @@ class ErlangSTC(ErlangHighlightedSTCBase):
         return data
 
     def GetErlangWordAtPosition(self, pos):
-        style = self.GetStyleAt(pos)
-        start = pos
-        end = pos
-        while self.GetStyleAt(start - 1) == style:
-            start -= 1
-        while self.GetStyleAt(end + 1) == style:
-            end += 1
-        if start == end and not self.GetTextRange(start, start+1).isalpha():
-            return False
-        end += 1
-        return (start, end, self.GetTextRange(start, end))
-
+        return ErlangWordAtPosition(self, pos)
 
     def GetContextData(self):
         pos = self.PositionFromPoint(self.ScreenToClient(wx.GetMousePosition()))
@@ -397,61 +416,37 @@ class ErlangSTC(ErlangHighlightedSTCBase):
         return None
 
     def CheckNavigation(self, pos):
-        style = self.GetStyleAt(pos)
-        if style not in [ErlangHighlightType.ATOM,
-                         ErlangHighlightType.FUNCTION,
-                         ErlangHighlightType.FUNDEC,
-                         ErlangHighlightType.MACROS,
-                         ErlangHighlightType.MODULE,
-                         ErlangHighlightType.RECORD,
-                         ErlangHighlightType.MODULEATTR,
-                         ErlangHighlightType.STRING]:
-            return False
-        result = self.GetErlangWordAtPosition(pos)
-        if not result: return
-        (start, end, value) = result
-
-        line = self.LineFromPosition(pos)
-        lineText = self.GetLine(line).strip()
-        lineStart = self.PositionFromLine(line)
-        lineEnd = self.GetLineEndPosition(line)
-        prefix = self.GetTextRange(lineStart, start)
-        postfix = self.GetTextRange(end, lineEnd)
+        context = NavigationContextAt(self, pos)
+        if not context: return False
+        (style, start, end, value) = (context.style, context.start, context.end, context.value)
         data = None
         if style == ErlangHighlightType.FUNDEC:
-            (exports, _s, _end, _last) = self.lexer.GetAllExports()
-            if value + "/" in exports:
-                self.navigateTo = (self.filePath, 1 + self.LineFromPosition(self.Text.find(value + "/")))
+            line = ExportedFunctionLine(self, value)
+            if line is not None:
+                self.navigateTo = (self.filePath, line)
         elif style == ErlangHighlightType.FUNCTION:
-            data = self.completer.GetFunctionNavAndHelp(value, prefix, end)
+            data = self.completer.GetFunctionNavAndHelp(value, context.prefix, end)
         elif style == ErlangHighlightType.RECORD:
             data = self.completer.GetRecordNavAndHelp(value)
         elif style == ErlangHighlightType.MACROS:
             data = self.completer.GetMacrosNavAndHelp(value)
         elif style in [ErlangHighlightType.ATOM, ErlangHighlightType.MODULE]:
-            if value in ErlangCache.AllModules():
-                self.navigateTo = (ErlangCache.modules[value].file, 0)
-
-        elif style == ErlangHighlightType.MODULEATTR or ErlangHighlightType.STRING:
-            path = None
-            isIncludeLib = False
-            if (style == ErlangHighlightType.MODULEATTR and value in ["include", "include_lib"]):
-                isIncludeLib = value == "include_lib"
-                path = postfix[2:len(postfix)-3]
-            elif style == ErlangHighlightType.STRING and lineText.startswith("-include"):
-                s = 14 if lineText.startswith("-include_lib") else 10
-                isIncludeLib = lineText.startswith("-include_lib")
-                path = lineText[s:len(lineText)-3]
+            moduleData = ErlangCache.modules.get(value)
+            if moduleData:
+                self.navigateTo = (moduleData.file, 0)
+        else:
+            (path, isIncludeLib) = IncludePath(context)
             if path:
                 if isIncludeLib:
                     app = path.split("/")[0]
                 else:
                     app = core.Project.GetApp(self.filePath)
                 include = (app, path.split("/")[-1])
-                if include in ErlangCache.includes:
-                    self.navigateTo = (ErlangCache.includes[include].file, 0)
-                    start = lineStart
-                    end = lineEnd
+                includeData = ErlangCache.includes.get(include)
+                if includeData:
+                    self.navigateTo = (includeData.file, 0)
+                    start = context.lineStart
+                    end = context.lineEnd
         if style in [ErlangHighlightType.FUNCTION, ErlangHighlightType.RECORD, ErlangHighlightType.MACROS]:
             if data:
                 self.navigateTo = data[0]
@@ -554,7 +549,7 @@ class ErlangSTC(ErlangHighlightedSTCBase):
         arity = self.completer.GetFunArity(funData[1] + len(fun))
 
         funStr = "{}/{}".format(fun, arity)
-        (exports, startPos, _endPos, insertPos) = self.lexer.GetAllExports()
+        (exports, startPos, _endPos, insertPos) = self.lexer.EnsureExportAttribute()
 
         if funStr in map(lambda e: e[0:e.find("/")], exports.split(",")):
             return
@@ -708,8 +703,9 @@ class ErlangConsoleSTC(ConsoleSTC):
                 fline = int(d["fline"])
                 if not os.path.isfile(filePath):
                     (module, _) = os.path.splitext(filePath)
-                    if module in ErlangCache.modules:
-                        filePath = ErlangCache.modules[module].file
+                    moduleData = ErlangCache.modules.get(module)
+                    if moduleData:
+                        filePath = moduleData.file
                     else:
                         continue
                 filePath = os.path.normpath(filePath)
@@ -5,10 +5,13 @@ __author__ = 'Yaroslav Nikityshev aka IDNoise'
 import os
 import wx
 import re
+from stat import ST_MTIME
 from wx import stc
 import wx.lib.agw.customtreectrl as CT
 import core
-from idn_utils import CreateButton, extension, writeFile, readFile, CreateBitmapButton, GetAllFilesInDir
+from idn_utils import CreateButton, extension, CreateBitmapButton, IterFilesInDir
+from idn_search import SearchEngine, SearchInText, SearchInMappedFile, SearchResult
+from idn_replace import ReplaceEngine, ComputeEdit, ReadText, WriteFiles, BACKUP_SUFFIX
 
 class FindInFilePanel(wx.Panel):
     def __init__(self, parent, editor):
@@ -313,46 +316,81 @@ def Find(textToFind = "", title = "Find results", wholeWords = False, matchCase
     if not searchDir or not os.path.isdir(searchDir):
         searchDir = core.Project.projectDir
 
-    core.MainFrame.SetCursor(wx.StockCursor(wx.CURSOR_WAIT))
-    try:
-        results = {}
-        regexp = PrepareRegexp(textToFind, wholeWords, matchCase, useRegexp)
-        filePaths = GetAllFilesInDir(searchDir, fileExts)
-        for filePath in filePaths:
-            result = SearchInFile(filePath, regexp)
-            if result:
-                if resultsFilter:
-                    for res in result[:]:
-                        if not resultsFilter(res):
-                            result.remove(res)
-                if result:
-                    results[filePath] = result
-        FillFindResultsTable(results, len(filePaths), regexp, openNewTab, title, searchDir, fileExts, resultsFilter)
-    finally:
-        core.MainFrame.SetCursor(wx.StockCursor(wx.CURSOR_DEFAULT))
-
+    regexp = PrepareRegexp(textToFind, wholeWords, matchCase, useRegexp)
+    openedTexts = OpenedTexts()
+    engine = SearchEngine(regexp, ProjectFilesToSearch(regexp, searchDir, fileExts, openedTexts), openedTexts)
+    resultsTable = GetFindResultsTree(openNewTab, title)
+    resultsTable.StartSearch(engine, regexp, searchDir, fileExts, resultsFilter)
+    core.ToolMgr.FocusOnWidget(resultsTable)
 
+def ProjectFilesToSearch(regexp, searchDir, fileExts, openedTexts):
+    """
+    Project files narrowed by search index when it can narrow this search, otherwise generator walking search dir.
+    Opened editors are always searched, their text may differ from indexed one.
+    """
+    index = core.Project.searchIndex
+    checker = core.Project.explorer.dirChecker
+    if (not index or not index.CanNarrow(regexp, fileExts) or
+        (checker.fileMask and not all([fm.endswith(tuple(checker.fileMask)) for fm in fileExts]))):
+        return IterFilesInDir(searchDir, fileExts)
+    prefix = os.path.join(searchDir, "")
+    filePaths = [fp for fp in core.Project.explorer.GetAllFiles(True)
+                 if fp.startswith(prefix) and (not fileExts or any([fp.endswith(fm) for fm in fileExts]))]
+    filePaths = index.Filter(regexp, filePaths)
+    known = set(filePaths)
+    for fp in openedTexts:
+        if (fp not in known and fp.startswith(prefix) and
+            (not fileExts or any([fp.endswith(fm) for fm in fileExts]))):
+            filePaths.append(fp)
+    return filePaths
+
+def OpenedTexts():
+    """
+    Texts of opened editors, taken on GUI thread, so search workers do not touch editors.
+    """
+    texts = {}
+    for page in core.TabMgr.Pages():
+        texts[page.filePath] = page.GetText()
+    return texts
+
+def UnsavedTexts():
+    """
+    Texts of opened editors that differ from saved files.
+    """
+    texts = {}
+    for page in core.TabMgr.Pages():
+        text = page.GetText()
+        if text != page.savedText:
+            texts[os.path.normpath(page.filePath)] = text
+    return texts
+
+def ShowReferences(title, references, filesCount, texts = None):
+    """
+    Shows references (file -> list of Reference from project reference index) in find results tree.
+    """
+    results = {}
+    for (filePath, refs) in references.items():
+        try:
+            if texts and filePath in texts:
+                text = texts[filePath]
+            else:
+                with open(filePath, "r") as f:
+                    text = f.read()
+        except Exception, e:
+            core.Log("show references error", filePath, e)
+            continue
+        lines = text.split("\n")
+        results[filePath] = [SearchResult(filePath, r.line, lines[r.line] if r.line < len(lines) else "", r.start, r.end)
+                             for r in sorted(refs, key = lambda r: (r.line, r.start))]
+    resultsTable = GetFindResultsTree(True, title)
+    resultsTable.SetResults(results, filesCount, None, core.Project.projectDir, [], None)
+    core.ToolMgr.FocusOnWidget(resultsTable)
 
 def SearchInFile(filePath, regexp):
     try:
-        result = []
-        lineNumber = 0
         if filePath in core.TabMgr.OpenedFiles():
-            fileText = core.TabMgr.FindPageByPath(filePath).GetText().split("\n")
-        else:
-            f = open(filePath, "r")
-            fileText = f.readlines()
-            f.close()
-        for lineText in fileText:
-            end = 0
-            while True:
-                m = regexp.search(lineText, end)
-                if not m: break
-                start = m.start()
-                end = m.end()
-                result.append(SearchResult(filePath, lineNumber, lineText, start, end))
-            lineNumber += 1
-        return result
+            return SearchInText(filePath, core.TabMgr.FindPageByPath(filePath).GetText(), regexp)
+        return SearchInMappedFile(filePath, regexp)
     except Exception, e:
         core.Log("find in project error", e)
 
@@ -367,7 +405,7 @@ def PrepareRegexp(textToFind, wholeWords = False, matchCase = False, useRegexp =
         flags |= re.IGNORECASE
     return re.compile(pattern, flags)
 
-def FillFindResultsTable(results, filesCount, regexp, openNewTab, title, searchDir, fileExts, resultsFilter):
+def GetFindResultsTree(openNewTab, title):
     resultsTable = None
     if not openNewTab:
         for page in reversed(core.ToolMgr.Pages()):
@@ -379,39 +417,163 @@ def FillFindResultsTable(results, filesCount, regexp, openNewTab, title, searchD
     if not resultsTable:
         resultsTable = FindResultsTree(core.ToolMgr)
         core.ToolMgr.AddPage(resultsTable, title, True)
-    resultsTable.SetResults(results, filesCount, regexp, searchDir, fileExts, resultsFilter)
-    core.ToolMgr.FocusOnWidget(resultsTable)
+    return resultsTable
 
 
-def ReplaceInProject(regexp, replacement, mask = None):
+def ReplaceInProject(regexp, replacement, mask = None, preview = True):
     filePaths = core.Project.explorer.GetAllFiles()
-    for filePath in sorted(filePaths):
-        if mask and extension(filePath) not in mask:
-            continue
-        ReplaceInFile(filePath, regexp, replacement)
+    if core.Project.searchIndex:
+        candidates = set(core.Project.searchIndex.Filter(regexp, filePaths)) | set(core.TabMgr.OpenedFiles())
+        filePaths = [fp for fp in filePaths if fp in candidates]
+    filePaths = [fp for fp in sorted(filePaths) if not mask or extension(fp) in mask]
+    engine = ReplaceEngine(regexp, replacement, filePaths, OpenedTexts())
+    edits = engine.Edits()
+    for (filePath, e) in engine.PopErrors():
+        core.Log("replace in project error: '", filePath, e)
+    if not edits:
+        return
+    if preview:
+        dlg = ReplacePreviewDialog(core.MainFrame, edits)
+        result = dlg.ShowModal()
+        edits = dlg.SelectedEdits()
+        dlg.Destroy()
+        if result != wx.ID_OK or not edits:
+            return
+    ApplyEdits(edits)
 
 def ReplaceInFile(filePath, regexp, replacement):
     try:
-        if filePath in core.TabMgr.OpenedFiles():
-            editor = core.TabMgr.FindPageByPath(filePath)
-            text = editor.GetText()
-            if regexp.search(text):
-                text = regexp.sub(replacement, text)
-                editor.SetText(text)
-                editor.Save()
+        editor = core.TabMgr.FindPageByPath(filePath)
+        if editor:
+            edit = ComputeEdit(filePath, editor.GetText(), regexp, replacement)
         else:
-            fileText = readFile(filePath)
-            if regexp.search(fileText):
-                fileText = regexp.sub(replacement, fileText)
-                writeFile(filePath, fileText)
+            edit = ComputeEdit(filePath, ReadText(filePath), regexp, replacement, os.stat(filePath).st_mtime)
+        if edit:
+            ApplyEdits([edit])
     except Exception, e:
         core.Log("replace in project error: '", filePath, e)
 
+def ApplyEdits(edits):
+    """
+    Writes all edits at once through temp files, nothing is written if any file fails. Opened editors
+    get their edit as one undo action and are marked saved. Project gets changed files in one batch
+    instead of save per file plus directory checker events.
+    """
+    editors = {}
+    for edit in edits:
+        editor = core.TabMgr.FindPageByPath(edit.file)
+        if not editor: continue
+        if editor.GetText() != edit.oldText:
+            wx.MessageBox("File {} was changed while replace was prepared. No files were changed.".format(edit.file),
+                "Replace in project")
+            return False
+        editors[edit.file] = editor
+    errors = WriteFiles(edits)
+    if errors:
+        (filePath, e) = errors[0]
+        core.Log("replace in project error: '", filePath, e)
+        if len(errors) > 1:
+            notRestored = ", ".join([path for (path, _e) in errors[1:]])
+            wx.MessageBox("Replace in {} failed: {}. Could not restore {}, originals are kept in {} files."
+                .format(filePath, e, notRestored, BACKUP_SUFFIX), "Replace in project")
+        else:
+            wx.MessageBox("Replace in {} failed: {}. No files were changed.".format(filePath, e), "Replace in project")
+        return False
+    for edit in edits:
+        if edit.file in editors:
+            ApplyEditToEditor(editors[edit.file], edit)
+    paths = [edit.file for edit in edits]
+    core.Project.explorer.dirChecker.SkipModified(paths)
+    core.Project.FilesSaved(paths)
+    return True
+
+def ApplyEditToEditor(editor, edit):
+    def length(text):
+        return len(text.encode("utf-8")) if isinstance(text, unicode) else len(text)
+    positions = []
+    position = 0
+    last = 0
+    for (start, end, value) in edit.spans:
+        position += length(edit.oldText[last:start])
+        startPosition = position
+        position += length(edit.oldText[start:end])
+        positions.append((startPosition, position, value))
+        last = end
+    editor.BeginUndoAction()
+    try:
+        for (start, end, value) in reversed(positions):
+            editor.SetTargetStart(start)
+            editor.SetTargetEnd(end)
+            editor.ReplaceTarget(value)
+    finally:
+        editor.EndUndoAction()
+    editor.savedText = editor.GetValue()
+    editor.modifyTime = os.stat(editor.filePath)[ST_MTIME]
+    editor.Changed(False)
+    editor.SetSavePoint()
+
+class ReplacePreviewDialog(wx.Dialog):
+    def __init__(self, parent, edits):
+        wx.Dialog.__init__(self, parent, title = "Replace preview", style = wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        self.edits = edits
+        labels = ["{0}: {1} replacements".format(edit.file.replace(core.Project.projectDir + os.sep, ""), len(edit))
+                  for edit in edits]
+        self.filesList = wx.CheckListBox(self, choices = labels, size = (700, 150))
+        for i in range(len(edits)):
+            self.filesList.Check(i)
+        self.filesList.Bind(wx.EVT_LISTBOX, self.OnSelectFile)
+
+        self.diffText = wx.TextCtrl(self, size = (700, 350), style = wx.TE_MULTILINE | wx.TE_READONLY | wx.TE_DONTWRAP)
+        self.diffText.SetFont(wx.Font(10, wx.FONTFAMILY_TELETYPE, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL))
+
+        s = wx.BoxSizer(wx.HORIZONTAL)
+        self.replaceButton = CreateButton(self, "Replace", self.OnReplace)
+        self.replaceButton.SetId(wx.ID_OK)
+        self.cancelButton = CreateButton(self, "Cancel", self.OnCancel)
+        self.cancelButton.SetId(wx.ID_CANCEL)
+        s.Add(self.replaceButton)
+        s.Add(self.cancelButton)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(wx.StaticText(self, label = "{0} replacements in {1} files:".format(sum(len(e) for e in edits),
+            len(edits))), flag = wx.ALL, border = 4)
+        sizer.Add(self.filesList, flag = wx.ALL | wx.EXPAND, border = 4)
+        sizer.Add(self.diffText, 1, flag = wx.ALL | wx.EXPAND, border = 4)
+        sizer.Add(s, flag = wx.ALL | wx.ALIGN_RIGHT, border = 4)
+        self.SetSizer(sizer)
+        self.Layout()
+        sizer.SetSizeHints(self)
+
+        self.filesList.SetSelection(0)
+        self.ShowDiff(0)
+
+    def OnSelectFile(self, event):
+        self.ShowDiff(event.GetSelection())
+
+    def ShowDiff(self, i):
+        self.diffText.SetValue("\n".join(self.edits[i].Diff()))
+
+    def SelectedEdits(self):
+        return [edit for (i, edit) in enumerate(self.edits) if self.filesList.IsChecked(i)]
+
+    def OnReplace(self, event):
+        self.EndModal(wx.ID_OK)
+
+    def OnCancel(self, event):
+        self.EndModal(wx.ID_CANCEL)
+
 class FindResultsTree(IDNCustomTreeCtrl):
+    STREAM_INTERVAL = 100
+
     def __init__(self, parent):
         IDNCustomTreeCtrl.__init__(self, parent)
-        self.results = []
+        self.results = {}
+        self.resultsCount = 0
         self.filesCount = 0
+        self.engine = None
+        self.searchTimer = wx.Timer(self, wx.ID_ANY)
+        self.Bind(wx.EVT_TIMER, self.OnSearchTimer, self.searchTimer)
+        self.Bind(wx.EVT_KEY_DOWN, self.OnKeyDown)
         self.searchDir = core.Project.projectDir
         self.fileExts = []
         self.resultsFilter = None
@@ -423,11 +585,73 @@ class FindResultsTree(IDNCustomTreeCtrl):
         self.Bind(wx.EVT_WINDOW_DESTROY, self.OnDestroy)
 
     def OnDestroy(self, event):
+        self.searchTimer.Stop()
+        if self.engine:
+            self.engine.Cancel()
         core.Project.explorer.ProjectFilesCreatedEvent -= self.OnProjectFilesCreated
         core.Project.explorer.ProjectFilesModifiedEvent -= self.OnProjectFilesModified
         core.Project.explorer.ProjectFilesDeletedEvent -= self.OnProjectFilesDeleted
 
+    def OnKeyDown(self, event):
+        if event.GetKeyCode() == wx.WXK_ESCAPE and self.engine:
+            self.CancelSearch()
+        else:
+            event.Skip()
+
+    def StartSearch(self, engine, regexp, searchDir, fileExts, resultsFilter):
+        """
+        Shows results of engine while it is running, tree is filled by timer from GUI thread.
+        Results filter is applied here, not on workers, because filters use lexers and editors.
+        """
+        self.CancelSearch()
+        self.SetResults({}, 0, regexp, searchDir, fileExts, resultsFilter)
+        self.engine = engine
+        self.SetItemText(self.GetRootItem(), "Searching...")
+        engine.Start()
+        self.searchTimer.Start(self.STREAM_INTERVAL)
+
+    def CancelSearch(self):
+        if not self.engine: return
+        self.engine.Cancel()
+        self.OnSearchTimer(None)
+
+    def OnSearchTimer(self, event):
+        engine = self.engine
+        if not engine: return
+        active = engine.IsActive()
+        self.AddResults(engine.PopDone())
+        for (filePath, e) in engine.PopErrors():
+            core.Log("find in project error", filePath, e)
+        (scanned, total, _matches) = engine.Progress()
+        rootNode = self.GetRootItem()
+        if active:
+            self.SetItemText(rootNode, "Searching... {0} results in {1} files, {2}/{3} files scanned"
+                .format(self.resultsCount, len(self.results), scanned, total))
+            return
+        self.searchTimer.Stop()
+        self.engine = None
+        self.filesCount = scanned
+        label = "{0} results in {1} files".format(self.resultsCount, scanned)
+        if engine.IsCancelled():
+            label += " (cancelled, {0} files found)".format(total)
+        self.SetItemText(rootNode, label)
+        self.SortChildren(rootNode)
+
+    def AddResults(self, done):
+        rootNode = self.GetRootItem()
+        for (filePath, result) in done:
+            if self.resultsFilter:
+                result = [r for r in result if self.resultsFilter(r)]
+            if not result:
+                continue
+            self.results[filePath] = result
+            self.AppendFileNode(rootNode, filePath, result)
+        if self.results and not self.IsExpanded(rootNode):
+            self.SetItemHasChildren(rootNode, True)
+            self.Expand(rootNode)
+
     def OnProjectFilesCreated(self, filePaths):
+        if self.engine: return
         for filePath in filePaths:
             if (self.regexp and filePath.startswith(self.searchDir) and
                 (self.fileExts and any([filePath.endswith(fm) for fm in self.fileExts]))):
@@ -439,6 +663,7 @@ class FindResultsTree(IDNCustomTreeCtrl):
                 self.UpdateResults()
 
     def OnProjectFilesModified(self, filePaths):
+        if self.engine: return
         for filePath in filePaths:
             if self.regexp and filePath in self.results:
                 result = SearchInFile(filePath, self.regexp)
@@ -446,6 +671,7 @@ class FindResultsTree(IDNCustomTreeCtrl):
                 wx.CallAfter(self.UpdateResults)
 
     def OnProjectFilesDeleted(self, filePaths):
+        if self.engine: return
         for filePath in filePaths:
             if self.regexp and filePath in self.results:
                 self.results[filePath] = None
@@ -463,7 +689,8 @@ class FindResultsTree(IDNCustomTreeCtrl):
                 self.Expand(node)
 
     def CleanUp(self):
-        self.results = []
+        self.CancelSearch()
+        self.results = {}
         self.DeleteAllItems()
 
     def SetResults(self, results, filesCount, regexp, searchDir, fileExts, resultsFilter):
@@ -474,34 +701,37 @@ class FindResultsTree(IDNCustomTreeCtrl):
         self.fileExts = fileExts
         self.resultsFilter = resultsFilter
         self.DeleteAllItems()
+        self.resultsCount = 0
         rootNode = self.AddRoot("0 results in {0} files".format(filesCount))
         self.SetPyData(rootNode, FindResultsTreeItemPyData())
         if not results:
             return
 
         self.SetItemHasChildren(rootNode, True)
-        resultsCount = 0
 
         for (filePath, res) in results.items():
             if not res or len(res) == 0:
                 continue
-            resultsCount += len(res)
-            fileLabel = filePath.replace(core.Project.projectDir + os.sep, "")
-            fileNode = self.AppendItem(rootNode, "{0}: {1} results".format(fileLabel, len(res)))
-
-            self.SetPyData(fileNode, FindResultsTreeItemPyData(filePath))
-            self.SetItemHasChildren(fileNode, True)
-            for result in res:
-                resultNode = self.AppendItem(fileNode,
-                    '{0:{fill}{align}14} {1}'.format('Line: ' + str(result.lineNumber + 1),
-                        result.lineText.replace("\n", "").strip(), fill=" ", align="<"))
-                self.SetPyData(resultNode,
-                    FindResultsTreeItemPyData(filePath, result.lineNumber, result.start, result.end))
-
-        self.SetItemText(rootNode, "{0} results in {1} files".format(resultsCount, filesCount))
+            self.AppendFileNode(rootNode, filePath, res)
+
+        self.SetItemText(rootNode, "{0} results in {1} files".format(self.resultsCount, filesCount))
         self.Expand(rootNode)
         self.SortChildren(rootNode)
 
+    def AppendFileNode(self, rootNode, filePath, res):
+        self.resultsCount += len(res)
+        fileLabel = filePath.replace(core.Project.projectDir + os.sep, "")
+        fileNode = self.AppendItem(rootNode, "{0}: {1} results".format(fileLabel, len(res)))
+
+        self.SetPyData(fileNode, FindResultsTreeItemPyData(filePath))
+        self.SetItemHasChildren(fileNode, True)
+        for result in res:
+            resultNode = self.AppendItem(fileNode,
+                '{0:{fill}{align}14} {1}'.format('Line: ' + str(result.lineNumber + 1),
+                    result.lineText.replace("\n", "").strip(), fill=" ", align="<"))
+            self.SetPyData(resultNode,
+                FindResultsTreeItemPyData(filePath, result.lineNumber, result.start, result.end))
+
     def OnActivateItem(self, event):
         data = self.GetPyData(event.GetItem())
         if not data.file: return
@@ -517,11 +747,3 @@ class FindResultsTreeItemPyData:
         self.lineNumber = lineNumber
         self.start = start
         self.end = end
-
-class SearchResult:
-    def __init__(self, file, lineNumber, lineText, start, end):
-        self.file = file
-        self.lineNumber = lineNumber
-        self.lineText = lineText
-        self.start = start
-        self.end = end
@@ -0,0 +1,180 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import re
+from bisect import bisect_right
+from idn_lexer import STC_FOLDLEVELBASE
+
+LINE_END_RE = re.compile(r"\r\n|\r|\n")
+
+def SplitLines(text):
+    """
+    Splits text like scintilla does: lines keep their line ends, last line is empty if text ends with line end.
+    """
+    lines = []
+    pos = 0
+    for m in LINE_END_RE.finditer(text):
+        lines.append(text[pos:m.end()])
+        pos = m.end()
+    lines.append(text[pos:])
+    return lines
+
+class HeadlessSTC(object):
+    """
+    Pure python document with the part of StyledTextCtrl api used by lexers and by editor context helpers
+    of completer and navigation (idn_erlang_context), so they can run without wx in batch jobs, profiling
+    and benchmarks. Completer list and erlang cache lookups still need wx. GetCharAt returns char like CustomSTC.
+    Positions are character offsets, line index is rebuilt on every modification.
+    Assigned lexer is notified about modifications the way CustomSTC does it.
+    """
+    WORD_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_"
+
+    def __init__(self, text = "", filePath = None):
+        self.filePath = filePath
+        self.lexer = None
+        self.text = ""
+        self.lines = [""]
+        self.starts = [0]
+        self.styles = bytearray()
+        self.foldLevels = [STC_FOLDLEVELBASE]
+        self.endStyled = 0
+        self.stylingPos = 0
+        self.currentPos = 0
+        self.firstVisibleLine = 0
+        self.linesOnScreen = 50
+        if text:
+            self.InsertText(0, text)
+
+    def _Modified(self, pos, linesAdded):
+        self.lines = SplitLines(self.text)
+        self.starts = []
+        start = 0
+        for line in self.lines:
+            self.starts.append(start)
+            start += len(line)
+        line = self.LineFromPosition(pos)
+        if linesAdded > 0:
+            self.foldLevels[line + 1:line + 1] = [STC_FOLDLEVELBASE] * linesAdded
+        elif linesAdded < 0:
+            del self.foldLevels[line + 1:line + 1 - linesAdded]
+        self.endStyled = min(self.endStyled, pos)
+        if self.lexer:
+            self.lexer.LinesAdded(line, linesAdded)
+            self.lexer.DocumentChanged()
+
+    def InsertText(self, pos, text):
+        if not text: return
+        self.text = self.text[:pos] + text + self.text[pos:]
+        self.styles[pos:pos] = bytearray(len(text))
+        if self.currentPos > pos:
+            self.currentPos += len(text)
+        self._Modified(pos, len(SplitLines(text)) - 1)
+
+    def DeleteRange(self, pos, length):
+        if length <= 0: return
+        removed = self.text[pos:pos + length]
+        self.text = self.text[:pos] + self.text[pos + length:]
+        del self.styles[pos:pos + length]
+        if self.currentPos > pos:
+            self.currentPos = max(pos, self.currentPos - length)
+        self._Modified(pos, 1 - len(SplitLines(removed)))
+
+    def AppendText(self, text):
+        self.InsertText(len(self.text), text)
+
+    def SetText(self, text):
+        self.DeleteRange(0, len(self.text))
+        self.InsertText(0, text)
+
+    def GetText(self):
+        return self.text
+
+    Text = property(GetText, SetText)
+
+    def GetTextRange(self, start, end):
+        return self.text[start:end]
+
+    def GetLength(self):
+        return len(self.text)
+
+    GetTextLength = GetLength
+
+    def GetCharAt(self, pos):
+        return self.text[pos] if 0 <= pos < len(self.text) else chr(0)
+
+    def GetLineCount(self):
+        return len(self.lines)
+
+    def GetLine(self, line):
+        return self.lines[line] if 0 <= line < len(self.lines) else ""
+
+    def LineFromPosition(self, pos):
+        return max(0, bisect_right(self.starts, pos) - 1)
+
+    def PositionFromLine(self, line):
+        return self.starts[line] if line < len(self.lines) else len(self.text)
+
+    def GetLineEndPosition(self, line):
+        return self.starts[line] + len(self.lines[line].rstrip("\r\n"))
+
+    def WordStartPosition(self, pos, onlyWordCharacters = True):
+        while pos > 0 and self.text[pos - 1] in self.WORD_CHARS:
+            pos -= 1
+        return pos
+
+    def WordEndPosition(self, pos, onlyWordCharacters = True):
+        while pos < len(self.text) and self.text[pos] in self.WORD_CHARS:
+            pos += 1
+        return pos
+
+    def GetCurrentPos(self):
+        return self.currentPos
+
+    def SetCurrentPos(self, pos):
+        self.currentPos = max(0, min(pos, len(self.text)))
+
+    GotoPos = SetCurrentPos
+    CurrentPos = property(GetCurrentPos, SetCurrentPos)
+
+    def GetCurrentLine(self):
+        return self.LineFromPosition(self.currentPos)
+
+    def GetFirstVisibleLine(self):
+        return self.firstVisibleLine
+
+    def LinesOnScreen(self):
+        return self.linesOnScreen
+
+    def DocLineFromVisible(self, line):
+        return line
+
+    def GetEndStyled(self):
+        return self.endStyled
+
+    def StartStyling(self, pos, mask):
+        self.stylingPos = pos
+        self.endStyled = pos
+
+    def SetStyling(self, length, style):
+        end = min(len(self.text), self.stylingPos + length)
+        self.styles[self.stylingPos:end] = bytearray([style]) * (end - self.stylingPos)
+        self.stylingPos = end
+        self.endStyled = end
+
+    def GetStyleAt(self, pos):
+        return self.styles[pos] if 0 <= pos < len(self.styles) else 0
+
+    def Colourise(self, start = 0, end = -1):
+        """
+        Asks lexer to style text up to end the way style needed notification does, -1 is end of text.
+        """
+        if end < 0:
+            end = len(self.text)
+        if self.lexer and self.endStyled < end:
+            self.lexer.StyleNeeded(end)
+
+    def GetFoldLevel(self, line):
+        return self.foldLevels[line] if 0 <= line < len(self.foldLevels) else STC_FOLDLEVELBASE
+
+    def SetFoldLevel(self, line, level):
+        if 0 <= line < len(self.foldLevels):
+            self.foldLevels[line] = level
@@ -1,5 +1,6 @@
 __author__ = 'Yaroslav Nikityshev aka IDNoise'
 
+from collections import OrderedDict
 from idn_token import Token, ErlangTokenType, ErlangTokenizer, IgorTokenizer, IgorTokenType
 
 class ErlangHighlightType:
@@ -55,72 +56,119 @@ class ErlangHighlighter:
     def __init__(self):
         self.tokenizer = ErlangTokenizer()
 
-    def GetHighlightingTokens(self, text):
+    def GetHighlightingTokens(self, text, pos = 0):
+        """
+        Works on (type, start, end) tuples from tokenizer, values are sliced from text only where rules need them.
+        """
         result = []
-        tokens = self.tokenizer.GetTokens(text)
+        tokens = self.tokenizer.Scan(text, pos)
         if not tokens: return result
-        firstToken = tokens[0]
-        for i in range(len(tokens)):
-            token = tokens[i]
-            if token.type == ErlangTokenType.SPACE:
+        count = len(tokens)
+        value = lambda j: text[tokens[j][1]:tokens[j][2]]
+        firstValue = value(0)
+        space = ErlangTokenType.SPACE
+        for i in xrange(count):
+            (type, start, end) = tokens[i]
+            if type == space:
                 continue
+            tokenValue = text[start:end]
             tokenType = ErlangHighlightType.DEFAULT
-            if token.type in self.RULES:
-                tokenType = self.RULES[token.type]
+            if type in self.RULES:
+                tokenType = self.RULES[type]
 
-            elif token.type == ErlangTokenType.VAR:
-                if i == 2 and firstToken.value == "-define":
+            elif type == ErlangTokenType.VAR:
+                if i == 2 and firstValue == "-define":
                     tokenType = ErlangHighlightType.MACROS
                 else:
                     tokenType = ErlangHighlightType.VAR
 
-            elif token.type == ErlangTokenType.MODULEATTR:
+            elif type == ErlangTokenType.MODULEATTR:
                 tokenType = ErlangHighlightType.MODULEATTR
 
-            elif token.type == ErlangTokenType.ATOM:
-                if token.value in self.KEYWORDS:
+            elif type == ErlangTokenType.ATOM:
+                if tokenValue in self.KEYWORDS:
                     tokenType = ErlangHighlightType.KEYWORD
 
-                elif i == 2 and firstToken.value in  ["-module", "-extends"]:
+                elif i == 2 and firstValue in  ["-module", "-extends"]:
                     tokenType = ErlangHighlightType.MODULE
-                elif i == 2 and firstToken.value == "-record":
+                elif i == 2 and firstValue == "-record":
                     tokenType = ErlangHighlightType.RECORDDEF
-                elif i == 2 and firstToken.value == "-define":
+                elif i == 2 and firstValue == "-define":
                     tokenType = ErlangHighlightType.MACROS
 
-                elif (i + 1 < len(tokens) and tokens[i + 1].value == ":" and
-                      token.value not in ["throw", "error", "exit"] and
-                      not (len(tokens) > i + 2 and tokens[i + 2].value == ":")):
+                elif (i + 1 < count and value(i + 1) == ":" and
+                      tokenValue not in ["throw", "error", "exit"] and
+                      not (count > i + 2 and value(i + 2) == ":")):
                     tokenType = ErlangHighlightType.MODULE
 
-                elif i + 1 < len(tokens) and tokens[i + 1].value == "(":
+                elif i + 1 < count and value(i + 1) == "(":
                     tokenType = ErlangHighlightType.FUNCTION
 
-                elif ((i - 2 >= 0 and tokens[i - 2].value == self.FUN
-                       and tokens[i - 1].type == ErlangTokenType.SPACE) or
-                      (i - 4 >= 0 and tokens[i - 4].value == self.FUN
-                       and tokens[i - 1].value == ":" and tokens[i - 2].type == ErlangTokenType.ATOM)):
+                elif ((i - 2 >= 0 and value(i - 2) == self.FUN
+                       and tokens[i - 1][0] == space) or
+                      (i - 4 >= 0 and value(i - 4) == self.FUN
+                       and value(i - 1) == ":" and tokens[i - 2][0] == ErlangTokenType.ATOM)):
                     tokenType = ErlangHighlightType.FUNCTION
 
-                elif (i + 2 < len(tokens) and tokens[i + 1].value == "/"):
+                elif (i + 2 < count and value(i + 1) == "/"):
                     tokenType = ErlangHighlightType.FUNCTION
 
                 else: tokenType = ErlangHighlightType.ATOM
-            token.type = tokenType
-            result.append(token)
+            result.append(Token(tokenType, tokenValue, start, end))
 
         return result
 
+class LineTokenCache:
+    """
+    Highlighting tokens of lines keyed by line text, shared by styling, folding and completion.
+    Cached token lists must not be modified by consumers. Entries are content keyed, so they never become wrong;
+    least recently used entries are evicted when cache grows much bigger than document.
+    """
+    EXTRA_ENTRIES = 1000
+
+    def __init__(self, highlighter):
+        self.highlighter = highlighter
+        self.entries = OrderedDict()
+        self.capacity = self.EXTRA_ENTRIES
+        self.hits = 0
+        self.misses = 0
+
+    def Tokens(self, text):
+        tokens = self.entries.pop(text, None)
+        if tokens is not None:
+            self.hits += 1
+            self.entries[text] = tokens
+            return tokens
+        self.misses += 1
+        tokens = self.highlighter.GetHighlightingTokens(text)
+        self.entries[text] = tokens
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(False)
+        return tokens
+
+    def Invalidate(self, linesCount):
+        self.capacity = 2 * linesCount + self.EXTRA_ENTRIES
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(False)
+
+    def Stats(self):
+        return (self.hits, self.misses, len(self.entries))
+
 class IgorHighlightType:
     DEFAULT, STRING, NUMBER, KEYWORD, BASE_TYPE, CUSTOM_TYPE, \
     SPECIAL_SYMBOL, COMMENT, ATTRIBUTE, ATTRIBUTE_TARGET, BRACKET, \
     FIELD, ENUM_FIELD, FUNCTION = range(1, 15)
 
 class IgorHighlighter:
-    keywords = ["import", "module", "record", "interface",
+    keywords = {"import", "module", "record", "interface",
                 "enum", "variant", "exception", "define",
                 "service", "returns", "throws", "s->c",
-                "c->s", "schema", "ethereal", "tag", "true", "false"]
+                "c->s", "schema", "ethereal", "tag", "true", "false"}
+
+    BASE_TYPES = {"bool", "sbyte", "byte", "short", "ushort", "int", "uint", "long", "ulong", "float", "double",
+                  "string", "binary", "atom", "dict", "list"}
+
+    FIELD_END = {"=", ";", ",", ")"}
 
     RULES = {
         IgorTokenType.STRING: IgorHighlightType.STRING,
@@ -133,40 +181,46 @@ class IgorHighlighter:
         self.tokenizer = IgorTokenizer()
 
     def GetHighlightingTokens(self, text):
+        """
+        Works on (type, start, end) tuples from tokenizer, values of line are sliced once.
+        """
         result = []
-        tokens = self.tokenizer.GetTokens(text)
+        tokens = self.tokenizer.Scan(text)
         if not tokens: return result
-        firstToken = tokens[0]
-        for i in range(len(tokens)):
-            token = tokens[:][i]
+        count = len(tokens)
+        values = [text[start:end] for (_type, start, end) in tokens]
+        (firstType, firstValue) = (tokens[0][0], values[0])
+        isEnumField = ((count == 2 and values[1] == ";") or
+                       (count == 4 and values[3] == ";" and values[1] == "=" and values[2].isdigit()))
+        for i in xrange(count):
+            (type, start, end) = tokens[i]
+            value = values[i]
             tokenType = IgorHighlightType.DEFAULT
 
-            if token.value in self.keywords:
+            if value in self.keywords:
                 tokenType = IgorHighlightType.KEYWORD
-            elif token.type in self.RULES:
-                tokenType = self.RULES[token.type]
-            elif token.value in ["?"]:
+            elif type in self.RULES:
+                tokenType = self.RULES[type]
+            elif value == "?":
                 tokenType = IgorHighlightType.SPECIAL_SYMBOL
-            elif firstToken.value == "[" and i == 1:
+            elif firstValue == "[" and i == 1:
                 tokenType = IgorHighlightType.ATTRIBUTE_TARGET
-            elif firstToken.value == "[" and token.type == IgorTokenType.LOWER and tokens[i - 1].value != "=":
+            elif firstValue == "[" and type == IgorTokenType.LOWER and values[i - 1] != "=":
                 tokenType = IgorHighlightType.ATTRIBUTE
-            elif token.type == IgorTokenType.UPPER:
-                if firstToken.type == IgorTokenType.SPECIAL and i == 1:
+            elif type == IgorTokenType.UPPER:
+                if firstType == IgorTokenType.SPECIAL and i == 1:
                     tokenType = IgorHighlightType.FUNCTION
                 else:
                     tokenType = IgorHighlightType.CUSTOM_TYPE
-            elif token.type == IgorTokenType.LOWER:
-                if len(tokens) == 2 and tokens[1].value == ";":
-                    tokenType = IgorHighlightType.ENUM_FIELD
-                elif len(tokens) == 4 and tokens[3].value == ";" and tokens[1].value == "=" and tokens[2].value.isdigit():
+            elif type == IgorTokenType.LOWER:
+                if isEnumField:
                     tokenType = IgorHighlightType.ENUM_FIELD
-                elif firstToken.value == "record" and tokens[i - 1].value == "[":
+                elif firstValue == "record" and values[i - 1] == "[":
                     tokenType = IgorHighlightType.ENUM_FIELD
-                elif token.value in ["bool", "sbyte", "byte", "short", "ushort", "int", "uint", "long", "ulong", "float", "double", "string", "binary", "atom", "dict", "list"]:
+                elif value in self.BASE_TYPES:
                     tokenType = IgorHighlightType.BASE_TYPE
-                elif len(tokens) > i + 1 and tokens[i + 1].value in ["=", ";", ",", ")"]:
+                elif i + 1 < count and values[i + 1] in self.FIELD_END:
                     tokenType = IgorHighlightType.FIELD
-            result.append(Token(tokenType, token.value, token.start, token.end))
+            result.append(Token(tokenType, value, start, end))
 
         return result
@@ -1,20 +1,124 @@
 __author__ = 'Yaroslav Nikityshev aka IDNoise'
 
+try:
+    from wx.stc import STC_FOLDLEVELHEADERFLAG, STC_FOLDLEVELBASE
+except ImportError:
+    # lexers also run headless, without wx (see idn_headless_stc)
+    STC_FOLDLEVELBASE = 0x400
+    STC_FOLDLEVELHEADERFLAG = 0x2000
 
 class BaseLexer:
+    MODE_NORMAL, MODE_LARGE, MODE_PLAIN = range(3)
+    DEFAULT_STYLE = 0
+
     def __init__(self, stc):
         self.stc = stc
+        self.revision = 0
+        self.revisionCache = {}
+        self.mode = self.MODE_NORMAL
+
+    def SetMode(self, mode, onLexed = None):
+        """
+        Large mode is supported only by lexers that can style in slices, others style large files as usual.
+        onLexed is called from worker thread when background lexing is done.
+        """
+        self.mode = self.MODE_PLAIN if mode == self.MODE_PLAIN else self.MODE_NORMAL
+
+    def HasPendingStyling(self):
+        return False
+
+    def LinesAdded(self, line, count):
+        pass
+
+    def StyleSlice(self, budget):
+        pass
+
+    def DocumentChanged(self):
+        self.revision += 1
+        self.revisionCache = {}
+
+    def Cached(self, key, fun):
+        """
+        Returns value computed by fun for current document revision.
+        """
+        if key not in self.revisionCache:
+            self.revisionCache[key] = fun()
+        return self.revisionCache[key]
 
     def StyleText(self, startPos, endPos):
+        """
+        Styles lines from startPos to endPos and returns last styled line.
+        """
         raise NotImplementedError
 
-    def DoFold(self, startPos, endPos):
+    def LineTokens(self, line):
         raise NotImplementedError
 
+    def IsFoldStart(self, token):
+        raise NotImplementedError
+
+    def IsFoldEnd(self, token):
+        raise NotImplementedError
+
+    def DoFold(self, startPos, endPos):
+        self.FoldLines(self.stc.LineFromPosition(startPos) - 1, self.stc.LineFromPosition(endPos))
+
     def StyleEvent(self, event):
         self.stc = event.GetEventObject()
+        self.StyleNeeded(event.GetPosition())
+
+    def StyleNeeded(self, endPos):
+        """
+        Styles and folds text from end of styled text to endPos, as requested by style needed notification.
+        """
         startPos = self.stc.GetEndStyled()
-        endPos = event.GetPosition()
-        self.StyleText(startPos, endPos)
-        self.DoFold(startPos, endPos)
+        if self.mode == self.MODE_PLAIN:
+            self.stc.StartStyling(startPos, 0x1f)
+            self.stc.SetStyling(endPos - startPos, self.DEFAULT_STYLE)
+            return
+        endLine = self.StyleText(startPos, endPos)
+        self.FoldLines(self.stc.LineFromPosition(startPos) - 1, endLine)
+
+    def FoldLines(self, startLine, endLine):
+        """
+        Computes fold levels from tokens that were just used for styling, so lines are not tokenized twice.
+        """
+        startLine = max(0, startLine)
+        prevFoldLevel = 0
+        if startLine > 0:
+            prevFoldLevel = self.stc.GetFoldLevel(startLine - 1)
+        nextLineFoldLevel = prevFoldLevel
+        if prevFoldLevel ^ STC_FOLDLEVELHEADERFLAG == STC_FOLDLEVELBASE:
+            nextLineFoldLevel = STC_FOLDLEVELBASE + 1
+        elif prevFoldLevel == STC_FOLDLEVELBASE + 2:
+            nextLineFoldLevel = 0
+        while startLine <= endLine:
+            currentLineFoldLevel = nextLineFoldLevel
+            for token in self.LineTokens(startLine):
+                if self.IsFoldStart(token):
+                    currentLineFoldLevel = STC_FOLDLEVELBASE
+                    nextLineFoldLevel = STC_FOLDLEVELBASE  + 1
+                elif self.IsFoldEnd(token):
+                    if currentLineFoldLevel ==  STC_FOLDLEVELBASE  + 1:
+                        currentLineFoldLevel = STC_FOLDLEVELBASE  + 2
+                    elif currentLineFoldLevel == STC_FOLDLEVELBASE:
+                        currentLineFoldLevel = 0
+                        if prevFoldLevel == STC_FOLDLEVELHEADERFLAG | STC_FOLDLEVELBASE:
+                            self.SetFoldLevel(startLine - 1, 0)
+                    nextLineFoldLevel = 0
+            if currentLineFoldLevel == STC_FOLDLEVELBASE:
+                currentLineFoldLevel |= STC_FOLDLEVELHEADERFLAG
+            if (currentLineFoldLevel == STC_FOLDLEVELHEADERFLAG | STC_FOLDLEVELBASE and
+                currentLineFoldLevel == prevFoldLevel):
+                self.SetFoldLevel(startLine - 1, 0)
+            prevFoldLevel = currentLineFoldLevel
+            self.SetFoldLevel(startLine, currentLineFoldLevel)
+            startLine += 1
+
+    def SetFoldLevel(self, line, level):
+        """
+        Every SetFoldLevel makes scintilla update fold state and margin, so unchanged levels are not written.
+        """
+        if self.stc.GetFoldLevel(line) != level:
+            self.stc.SetFoldLevel(line, level)
 
@@ -24,11 +24,30 @@ class ProgressTaskManagerDialog(wx.EvtHandler):
         self.progressTimer.Start(250)
         self.Bind(wx.EVT_TIMER, self.OnProgressTimer, self.progressTimer)
         self.tasks = set()
+        self.tasksProgress = {}
         self.lastTaskTime = time.time()
 
     def AddTask(self, task):
         self.tasks.add(task)
 
+    def SetTaskProgress(self, task, done, total = None, eta = None):
+        if done is None:
+            if task in self.tasksProgress:
+                del self.tasksProgress[task]
+        else:
+            self.tasksProgress[task] = (done, total, eta)
+
+    def TaskProgress(self, task):
+        return self.tasksProgress.get(task)
+
+    def ProgressDescription(self):
+        description = "Tasks left: {}".format(len(self.tasks))
+        for task, (done, total, eta) in self.tasksProgress.items():
+            description += ". {}: {}/{}".format(task, done, total)
+            if eta is not None:
+                description += " (~{} sec left)".format(int(eta))
+        return description
+
     def UpdatePulse(self, description):
         if self.progressDialog:
             self.progressDialog.UpdatePulse(description)
@@ -55,7 +74,7 @@ class ProgressTaskManagerDialog(wx.EvtHandler):
 
     def OnProgressTimer(self, event):
         if self.progressDialog:
-            self.UpdatePulse("Tasks left: {}".format(len(self.tasks)))
+            self.UpdatePulse(self.ProgressDescription())
             if (time.time() - self.lastTaskTime > 20 and len(self.tasks) > 0):
                 core.Log("tasks left:", self.tasks)
                 self.DestroyDialog()
@@ -96,6 +115,8 @@ class Project(ProgressTaskManagerDialog):
         self.projectData = projectData
         self.oldProjectData = None
         self.openedFilesChecker = None
+        self.searchIndex = None
+        self.referenceIndex = None
 
         if not os.path.isdir(core.UserDataDir()):
             os.makedirs(core.UserDataDir())
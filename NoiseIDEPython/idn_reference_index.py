@@ -0,0 +1,236 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import os
+import Queue
+from array import array
+from threading import Thread, Lock
+from idn_highlight import ErlangHighlighter, ErlangHighlightType
+import core
+
+FUNCTION, RECORD, MACROS, MODULE, ATOM = "function", "record", "macros", "module", "atom"
+UNKNOWN = -1
+
+OPEN_BRACKETS = {"(", "[", "{", "<<"}
+CLOSE_BRACKETS = {")", "]", "}", ">>"}
+BLOCK_START = {"begin", "case", "if", "receive", "try"}
+
+def ModuleOfFile(filePath):
+    name = os.path.basename(filePath)
+    return name[:-4] if name.endswith(".erl") else None
+
+def Arity(tokens, i):
+    """
+    Arity of function token: 'name/N' or count of arguments of call closed on the same line, UNKNOWN otherwise.
+    """
+    count = len(tokens)
+    if i + 2 < count and tokens[i + 1].value == "/" and tokens[i + 2].value.isdigit():
+        return int(tokens[i + 2].value)
+    if i + 1 >= count or tokens[i + 1].value != "(":
+        return UNKNOWN
+    depth = 0
+    arity = 0
+    for j in xrange(i + 1, count):
+        value = tokens[j].value
+        if value in CLOSE_BRACKETS or value == "end":
+            depth -= 1
+            if depth == 0:
+                return arity
+            continue
+        if depth == 1:
+            if arity == 0:
+                arity = 1
+            if value == ",":
+                arity += 1
+        if value in OPEN_BRACKETS or value in BLOCK_START or (value == "fun" and j + 1 < count and
+                                                              tokens[j + 1].value == "("):
+            depth += 1
+    return UNKNOWN
+
+class Reference:
+    def __init__(self, file, line, start, end, type, arity, module):
+        self.file = file
+        self.line = line
+        self.start = start
+        self.end = end
+        self.type = type
+        self.arity = arity
+        self.module = module
+
+class ReferenceIndex:
+    """
+    Cross reference index of project erlang sources: (kind, name) -> file -> flat array of
+    (line, start, end, highlight type, arity, module id) records. Built by highlighter on worker thread,
+    changed files are rescanned one by one. Functions are keyed by name only, their module
+    (remote call prefix or module of file) and arity are kept in records.
+    """
+    EXTENSIONS = (".erl", ".hrl", ".src")
+    FIELDS = 6
+
+    def __init__(self):
+        self.lock = Lock()
+        self.queue = Queue.Queue()
+        self.files = {}
+        self.refs = {}
+        self.moduleIds = {}
+        self.moduleNames = []
+        self.stale = {}
+        self.ready = False
+        self.stopped = False
+        self.worker = None
+        self.highlighter = ErlangHighlighter()
+
+    def IsIndexed(self, path):
+        return path.endswith(self.EXTENSIONS)
+
+    def IsReady(self):
+        """
+        True when initial scan is done and no changed files wait for rescan.
+        """
+        return self.ready and not self.stale
+
+    def FilesCount(self):
+        return len(self.files)
+
+    def Start(self, filePaths):
+        self.Update(filePaths)
+        self.queue.put(self._SetReady)
+        self.worker = Thread(target = self._Work)
+        self.worker.setDaemon(True)
+        self.worker.start()
+
+    def Stop(self):
+        self.stopped = True
+        self.queue.put(None)
+
+    def Update(self, paths):
+        paths = [os.path.normpath(path) for path in paths if self.IsIndexed(path)]
+        with self.lock:
+            for path in paths:
+                self.stale[path] = self.stale.get(path, 0) + 1
+        for path in paths:
+            self.queue.put(path)
+
+    def Remove(self, paths):
+        with self.lock:
+            for path in paths:
+                self._Remove(os.path.normpath(path))
+
+    def References(self, kind, name, overrides = None):
+        """
+        Returns list of Reference for (kind, name). overrides maps file path to text which is scanned
+        instead of indexed content, e.g. opened editors with unsaved changes.
+        """
+        overrides = dict((os.path.normpath(path), text) for (path, text) in (overrides or {}).items())
+        key = (kind, name)
+        result = []
+        with self.lock:
+            for path in self.refs.get(key, ()):
+                if path not in overrides:
+                    result += self._Records(path, self.files[path][key])
+        for path, text in overrides.items():
+            if not self.IsIndexed(path): continue
+            refs = self.Scan(path, text, self.highlighter)
+            if key in refs:
+                with self.lock:
+                    result += self._Records(path, refs[key])
+        return result
+
+    def Scan(self, filePath, text, highlighter):
+        """
+        Returns references of file text: key -> array of records.
+        """
+        refs = {}
+        fileModule = ModuleOfFile(filePath)
+        fileModuleId = self._ModuleId(fileModule)
+        for lineNumber, lineText in enumerate(text.split("\n")):
+            tokens = highlighter.GetHighlightingTokens(lineText)
+            for i, token in enumerate(tokens):
+                type = token.type
+                arity = UNKNOWN
+                moduleId = UNKNOWN
+                if type in (ErlangHighlightType.FUNCTION, ErlangHighlightType.FUNDEC):
+                    key = (FUNCTION, token.value)
+                    moduleId = fileModuleId
+                    if i >= 2 and tokens[i - 1].value == ":":
+                        prefix = tokens[i - 2]
+                        if prefix.type == ErlangHighlightType.MODULE:
+                            moduleId = self._ModuleId(prefix.value)
+                        elif prefix.value != "?MODULE":
+                            moduleId = UNKNOWN
+                    arity = Arity(tokens, i)
+                elif type in (ErlangHighlightType.RECORD, ErlangHighlightType.RECORDDEF):
+                    key = (RECORD, token.value.lstrip("#"))
+                elif type == ErlangHighlightType.MACROS:
+                    key = (MACROS, token.value.lstrip("?"))
+                elif type == ErlangHighlightType.MODULE:
+                    key = (MODULE, token.value)
+                elif type == ErlangHighlightType.ATOM:
+                    key = (ATOM, token.value)
+                else:
+                    continue
+                records = refs.get(key)
+                if records is None:
+                    records = refs[key] = array('i')
+                records.extend((lineNumber, token.start, token.end, type, arity, moduleId))
+        return refs
+
+    def _Records(self, path, records):
+        result = []
+        for i in xrange(0, len(records), self.FIELDS):
+            (line, start, end, type, arity, moduleId) = records[i:i + self.FIELDS]
+            module = self.moduleNames[moduleId] if moduleId != UNKNOWN else None
+            result.append(Reference(path, line, start, end, type, arity, module))
+        return result
+
+    def _ModuleId(self, module):
+        if module is None:
+            return UNKNOWN
+        with self.lock:
+            id = self.moduleIds.get(module)
+            if id is None:
+                id = self.moduleIds[module] = len(self.moduleNames)
+                self.moduleNames.append(module)
+            return id
+
+    def _Remove(self, path):
+        if path not in self.files: return
+        for key in self.files[path]:
+            paths = self.refs[key]
+            paths.discard(path)
+            if not paths:
+                del self.refs[key]
+        del self.files[path]
+
+    def _SetReady(self):
+        self.ready = True
+
+    def _Work(self):
+        highlighter = ErlangHighlighter()
+        while True:
+            path = self.queue.get()
+            if path is None or self.stopped:
+                break
+            if callable(path):
+                path()
+                continue
+            refs = None
+            try:
+                if os.path.isfile(path):
+                    with open(path, "r") as f:
+                        refs = self.Scan(path, f.read(), highlighter)
+            except Exception, e:
+                core.Log("reference index error", path, e)
+            with self.lock:
+                count = self.stale.get(path, 0) - 1
+                if count > 0:
+                    self.stale[path] = count
+                elif path in self.stale:
+                    del self.stale[path]
+                self._Remove(path)
+                if refs is not None:
+                    self.files[path] = refs
+                    for key in refs:
+                        paths = self.refs.get(key)
+                        if paths is None:
+                            paths = self.refs[key] = set()
+                        paths.add(path)
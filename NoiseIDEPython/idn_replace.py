@@ -0,0 +1,132 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import os
+import codecs
+import difflib
+import sre_parse
+from idn_search import SearchEngine
+import core
+
+TMP_SUFFIX = ".replace.tmp"
+BACKUP_SUFFIX = ".replace.bak"
+
+class FileEdit:
+    """
+    Replacement in one file: new text and spans (start, end, replacement) in old text, so editors
+    can apply them in place. mtime is None for texts of opened editors.
+    """
+    def __init__(self, file, oldText, newText, spans, mtime = None):
+        self.file = file
+        self.oldText = oldText
+        self.newText = newText
+        self.spans = spans
+        self.mtime = mtime
+
+    def __len__(self):
+        return len(self.spans)
+
+    def Diff(self, context = 2):
+        return list(difflib.unified_diff(self.oldText.splitlines(), self.newText.splitlines(),
+            self.file, self.file, n = context, lineterm = ""))
+
+def ReadText(filePath):
+    with codecs.open(filePath, "r", "utf-8") as f:
+        return f.read()
+
+def ComputeEdit(filePath, text, regexp, replacement, mtime = None):
+    """
+    Single pass over text: matches are expanded as regexp.sub does, None if nothing matches.
+    Like sub, empty match right after previous match is skipped.
+    """
+    template = sre_parse.parse_template(replacement, regexp)
+    literal = None if template[0] else "".join([part for part in template[1] if part is not None])
+    spans = []
+    parts = []
+    last = 0
+    for m in regexp.finditer(text):
+        if m.start() == m.end() and spans and m.start() == last:
+            continue
+        value = literal if literal is not None else sre_parse.expand_template(template, m)
+        spans.append((m.start(), m.end(), value))
+        parts.append(text[last:m.start()])
+        parts.append(value)
+        last = m.end()
+    if not spans:
+        return None
+    parts.append(text[last:])
+    return FileEdit(filePath, text, "".join(parts), spans, mtime)
+
+class ReplaceEngine(SearchEngine):
+    """
+    Computes FileEdit for every file on worker threads, nothing is written.
+    """
+    def __init__(self, regexp, replacement, filePaths, openedTexts = None, token = None):
+        SearchEngine.__init__(self, regexp, filePaths, openedTexts, token)
+        self.replacement = replacement
+
+    def Scan(self, filePath):
+        if filePath in self.openedTexts:
+            return ComputeEdit(filePath, self.openedTexts[filePath], self.regexp, self.replacement)
+        mtime = os.stat(filePath).st_mtime
+        return ComputeEdit(filePath, ReadText(filePath), self.regexp, self.replacement, mtime)
+
+    def Edits(self):
+        self.Start()
+        self.Wait()
+        return sorted([edit for (_filePath, edit) in self.PopDone()], key = lambda edit: edit.file)
+
+def _RemoveFile(path):
+    try:
+        if os.path.isfile(path):
+            os.remove(path)
+    except Exception, e:
+        core.Log("replace cleanup error", path, e)
+
+def WriteFiles(edits):
+    """
+    Writes new texts of edits all or nothing. Texts go to temp files next to originals first, originals
+    are swapped only when every temp file is written and no file changed on disk since edits were computed;
+    if a swap fails, already swapped files are restored from backups. Returns list of (path, error),
+    files that could not be restored follow the error that stopped the write.
+    """
+    staged = []
+    try:
+        for edit in edits:
+            if edit.mtime is not None and os.stat(edit.file).st_mtime != edit.mtime:
+                raise Exception("file was modified after replace was prepared")
+            tmpPath = edit.file + TMP_SUFFIX
+            staged.append((edit.file, tmpPath))
+            with codecs.open(tmpPath, "w", "utf-8") as f:
+                f.write(edit.newText)
+    except Exception, e:
+        for (_path, tmpPath) in staged:
+            _RemoveFile(tmpPath)
+        return [(edit.file, e)]
+
+    swapped = []
+    try:
+        for (path, tmpPath) in staged:
+            backupPath = path + BACKUP_SUFFIX
+            os.rename(path, backupPath)
+            try:
+                os.rename(tmpPath, path)
+            except Exception:
+                os.rename(backupPath, path)
+                raise
+            swapped.append((path, backupPath))
+    except Exception, e:
+        errors = [(path, e)]
+        for (swappedPath, backupPath) in reversed(swapped):
+            try:
+                os.remove(swappedPath)
+                os.rename(backupPath, swappedPath)
+            except Exception, restoreError:
+                core.Log("replace rollback error", swappedPath, restoreError)
+                errors.append((swappedPath, restoreError))
+        for (_path, tmpPath) in staged:
+            _RemoveFile(tmpPath)
+        return errors
+
+    for (_path, backupPath) in swapped:
+        _RemoveFile(backupPath)
+    return []
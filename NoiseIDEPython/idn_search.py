@@ -0,0 +1,174 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import os
+import re
+import mmap
+import Queue
+from bisect import bisect_right
+from threading import Thread, Lock, Event
+
+class SearchResult:
+    def __init__(self, file, lineNumber, lineText, start, end):
+        self.file = file
+        self.lineNumber = lineNumber
+        self.lineText = lineText
+        self.start = start
+        self.end = end
+
+NEWLINE_RE = re.compile("\n")
+
+def LineStarts(text):
+    """
+    Offsets of line starts in text (str, unicode or mmap).
+    """
+    return [0] + [m.end() for m in NEWLINE_RE.finditer(text)]
+
+def SearchInText(filePath, text, regexp):
+    """
+    Searches regexp in whole text, so patterns may span lines. Line of result is the line
+    where match starts, result start and end are offsets from that line start.
+    """
+    result = []
+    lineStarts = None
+    for m in regexp.finditer(text):
+        if lineStarts is None:
+            lineStarts = LineStarts(text)
+        start = m.start()
+        lineNumber = bisect_right(lineStarts, start) - 1
+        lineStart = lineStarts[lineNumber]
+        lineEnd = lineStarts[lineNumber + 1] - 1 if lineNumber + 1 < len(lineStarts) else len(text)
+        result.append(SearchResult(filePath, lineNumber, text[lineStart:lineEnd], start - lineStart, m.end() - lineStart))
+    return result
+
+def SearchInMappedFile(filePath, regexp):
+    """
+    Searches file on disk through mmap, file is not read into memory as a whole.
+    """
+    with open(filePath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            return SearchInText(filePath, buffer, regexp)
+        finally:
+            buffer.close()
+
+class CancelToken:
+    def __init__(self):
+        self.event = Event()
+
+    def Cancel(self):
+        self.event.set()
+
+    def IsCancelled(self):
+        return self.event.is_set()
+
+class SearchEngine:
+    """
+    Scans files on worker threads. File paths may be a generator (e.g. IterFilesInDir), it is consumed
+    on separate thread, so scanning starts before search dir is walked. Matches are collected in done list
+    and should be taken from GUI thread with PopDone. Texts of opened editors are passed in openedTexts,
+    so unsaved state is searched instead of file on disk.
+    """
+    WORKERS_COUNT = 4
+
+    def __init__(self, regexp, filePaths, openedTexts = None, token = None):
+        self.regexp = regexp
+        self.filePaths = filePaths
+        self.openedTexts = openedTexts or {}
+        self.token = token or CancelToken()
+        self.lock = Lock()
+        self.queue = Queue.Queue()
+        self.done = []
+        self.errors = []
+        self.total = 0
+        self.scanned = 0
+        self.matches = 0
+        self.walking = False
+        self.workers = []
+
+    def Start(self):
+        self.walking = True
+        walker = Thread(target = self._Walk)
+        walker.setDaemon(True)
+        walker.start()
+        for i in range(self.WORKERS_COUNT):
+            worker = Thread(target = self._Work)
+            worker.setDaemon(True)
+            worker.start()
+            self.workers.append(worker)
+
+    def Cancel(self):
+        self.token.Cancel()
+
+    def IsCancelled(self):
+        return self.token.IsCancelled()
+
+    def IsActive(self):
+        with self.lock:
+            return not self.token.IsCancelled() and (self.walking or self.scanned < self.total)
+
+    def HasDone(self):
+        return len(self.done) > 0
+
+    def PopDone(self):
+        with self.lock:
+            result = self.done
+            self.done = []
+        return result
+
+    def PopErrors(self):
+        with self.lock:
+            result = self.errors
+            self.errors = []
+        return result
+
+    def Progress(self):
+        """
+        Returns (files scanned, files found, matches); files found grows while search dir is being walked.
+        """
+        with self.lock:
+            return (self.scanned, self.total, self.matches)
+
+    def Wait(self, timeout = None):
+        for worker in self.workers:
+            worker.join(timeout)
+
+    def Scan(self, filePath):
+        """
+        Result for one file, called on worker thread; its len() is counted as matches.
+        """
+        if filePath in self.openedTexts:
+            return SearchInText(filePath, self.openedTexts[filePath], self.regexp)
+        return SearchInMappedFile(filePath, self.regexp)
+
+    def _Walk(self):
+        try:
+            for filePath in self.filePaths:
+                if self.token.IsCancelled():
+                    break
+                with self.lock:
+                    self.total += 1
+                self.queue.put(filePath)
+        finally:
+            with self.lock:
+                self.walking = False
+            for worker in range(self.WORKERS_COUNT):
+                self.queue.put(None)
+
+    def _Work(self):
+        while True:
+            filePath = self.queue.get()
+            if filePath is None or self.token.IsCancelled():
+                break
+            result = None
+            try:
+                result = self.Scan(filePath)
+            except Exception, e:
+                with self.lock:
+                    self.errors.append((filePath, e))
+            with self.lock:
+                self.scanned += 1
+                if result:
+                    self.matches += len(result)
+                    self.done.append((filePath, result))
@@ -0,0 +1,307 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import os
+import marshal
+import struct
+import Queue
+import sre_parse
+import sre_constants
+from array import array
+from stat import ST_MTIME
+from threading import Thread, Lock
+import core
+
+def Trigrams(text):
+    text = text.lower()
+    return set(text[i:i + 3] for i in xrange(len(text) - 2))
+
+def _Literals(items):
+    """
+    Returns alternatives of parsed pattern, each is list of literal strings every match of it contains.
+    """
+    items = list(items)
+    if len(items) == 1:
+        (op, av) = items[0]
+        if op == sre_constants.BRANCH:
+            result = []
+            for branch in av[1]:
+                result += _Literals(branch)
+            return result
+        if op == sre_constants.SUBPATTERN:
+            return _Literals(av[1])
+    literals = []
+    current = []
+    for (op, av) in items:
+        if op == sre_constants.LITERAL and av < 128:
+            current.append(chr(av))
+            continue
+        if op == sre_constants.AT:
+            continue
+        if current:
+            literals.append("".join(current))
+            current = []
+        inner = None
+        if op == sre_constants.SUBPATTERN:
+            inner = _Literals(av[1])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            inner = _Literals(av[2])
+        if inner and len(inner) == 1:
+            literals += inner[0]
+    if current:
+        literals.append("".join(current))
+    return [literals]
+
+def RequiredTrigrams(regexp):
+    """
+    Returns list of trigram sets, one per pattern alternative, a file can match only if it
+    has all trigrams of some alternative. None if some alternative has no trigrams, so index
+    can't narrow files for this pattern.
+    """
+    try:
+        alternatives = _Literals(sre_parse.parse(regexp.pattern, regexp.flags))
+    except Exception, e:
+        core.Log("search index error", regexp.pattern, e)
+        return None
+    result = []
+    for literals in alternatives:
+        trigrams = set()
+        for literal in literals:
+            trigrams |= Trigrams(literal)
+        if not trigrams:
+            return None
+        result.append(trigrams)
+    return result
+
+class SearchIndex:
+    """
+    Trigram index of project files used to narrow files for find and replace in project.
+    Posting lists are arrays of file ids, reindexed file gets new id and old one is dropped
+    from postings on flush. Files that are queued for reindex or unknown to index are always
+    candidates, so results are the same as for full scan.
+    Layout: header (magic, version), marshalled (files table, next id, postings).
+    """
+    FILE_NAME = "search.index"
+    MAGIC = "NSIX"
+    VERSION = 1
+    HEADER = struct.Struct("<4sI")
+    EXTENSIONS = (".erl", ".hrl", ".src", ".app", ".config", ".igor")
+    MAX_FILE_SIZE = 4 * 1024 * 1024
+    FLUSH_CHANGES = 500
+
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        self.path = os.path.join(cacheDir, self.FILE_NAME)
+        self.lock = Lock()
+        self.queue = Queue.Queue()
+        self.files = {}
+        self.ids = {}
+        self.postings = {}
+        self.nextId = 0
+        self.dead = 0
+        self.stale = {}
+        self.changes = 0
+        self.loaded = False
+        self.stopped = False
+        self.worker = None
+
+    def IsIndexed(self, path):
+        return path.endswith(self.EXTENSIONS)
+
+    def CanNarrow(self, regexp, fileExts):
+        """
+        True if search of regexp in files with given extensions can be narrowed by index.
+        """
+        return (self.loaded and fileExts and all([self.IsIndexed(fm) for fm in fileExts]) and
+                RequiredTrigrams(regexp) is not None)
+
+    def Start(self, fileMtimes):
+        """
+        Loads index and reindexes files which mtime differs from fileMtimes (path -> mtime) on worker thread.
+        """
+        self.worker = Thread(target = self._Work, args = (dict(fileMtimes),))
+        self.worker.setDaemon(True)
+        self.worker.start()
+
+    def Stop(self):
+        """
+        Files left in queue are not indexed, they are picked up by mtime on next start.
+        """
+        self.stopped = True
+        self.queue.put(None)
+        if self.worker:
+            self.worker.join(30)
+
+    def IsLoaded(self):
+        return self.loaded
+
+    def Update(self, paths):
+        paths = [os.path.normpath(path) for path in paths if self.IsIndexed(path)]
+        with self.lock:
+            self._MarkStale(paths)
+        for path in paths:
+            self.queue.put(path)
+
+    def Remove(self, paths):
+        with self.lock:
+            for path in paths:
+                self._Remove(os.path.normpath(path))
+
+    def _MarkStale(self, paths):
+        for path in paths:
+            self.stale[path] = self.stale.get(path, 0) + 1
+
+    def Filter(self, regexp, filePaths):
+        """
+        Returns files of filePaths that may have matches of regexp.
+        """
+        if not self.loaded:
+            return filePaths
+        alternatives = RequiredTrigrams(regexp)
+        if alternatives is None:
+            return filePaths
+        with self.lock:
+            ids = set()
+            for trigrams in alternatives:
+                ids |= self._Match(trigrams)
+            result = []
+            for path in filePaths:
+                if (not self.IsIndexed(path) or path in self.stale or
+                    path not in self.files or self.files[path][1] in ids):
+                    result.append(path)
+        return result
+
+    def _Match(self, trigrams):
+        postings = []
+        for trigram in trigrams:
+            posting = self.postings.get(trigram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key = len)
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            ids.intersection_update(posting)
+            if not ids: break
+        return ids
+
+    def _Remove(self, path):
+        if path in self.files:
+            (_mtime, id) = self.files[path]
+            del self.files[path]
+            del self.ids[id]
+            self.dead += 1
+            self.changes += 1
+
+    def _Add(self, path, mtime, trigrams):
+        self._Remove(path)
+        id = self.nextId
+        self.nextId += 1
+        self.files[path] = (mtime, id)
+        self.ids[id] = path
+        for trigram in trigrams:
+            posting = self.postings.get(trigram)
+            if posting is None:
+                posting = self.postings[trigram] = array('i')
+            posting.append(id)
+        self.changes += 1
+
+    def _Work(self, fileMtimes):
+        self._Open()
+        with self.lock:
+            for path in self.files.keys():
+                if path not in fileMtimes:
+                    self._Remove(path)
+            toUpdate = [path for path, mtime in fileMtimes.iteritems()
+                        if self.IsIndexed(path) and (path not in self.files or self.files[path][0] != mtime)]
+            self._MarkStale(toUpdate)
+            self.loaded = True
+        for path in toUpdate:
+            self.queue.put(path)
+        while True:
+            path = self.queue.get()
+            if path is None or self.stopped:
+                break
+            self._Index(path)
+            if self.queue.empty() and self.changes >= self.FLUSH_CHANGES:
+                self.Flush()
+        self.Flush()
+
+    def _Index(self, path):
+        try:
+            trigrams = None
+            mtime = None
+            if os.path.isfile(path) and os.path.getsize(path) <= self.MAX_FILE_SIZE:
+                mtime = os.stat(path)[ST_MTIME]
+                with open(path, "rb") as f:
+                    trigrams = Trigrams(f.read())
+        except Exception, e:
+            core.Log("search index error", path, e)
+            trigrams = None
+        with self.lock:
+            count = self.stale.get(path, 0) - 1
+            if count > 0:
+                self.stale[path] = count
+            elif path in self.stale:
+                del self.stale[path]
+            if trigrams is None:
+                self._Remove(path)
+            else:
+                self._Add(path, mtime, trigrams)
+
+    def _Open(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            (magic, version) = self.HEADER.unpack(data[:self.HEADER.size])
+            if magic != self.MAGIC or version != self.VERSION:
+                return
+            (files, nextId, postings) = marshal.loads(data[self.HEADER.size:])
+            ids = dict((id, path) for path, (_mtime, id) in files.iteritems())
+            with self.lock:
+                self.files = files
+                self.ids = ids
+                self.nextId = nextId
+                self.postings = {}
+                for trigram, blob in postings.iteritems():
+                    posting = array('i')
+                    posting.fromstring(blob)
+                    self.postings[trigram] = posting
+        except Exception, e:
+            core.Log("open search index error", self.path, e)
+            with self.lock:
+                self.files = {}
+                self.ids = {}
+                self.postings = {}
+                self.nextId = 0
+
+    def Flush(self):
+        with self.lock:
+            if not self.changes:
+                return
+            if self.dead:
+                for trigram, posting in self.postings.items():
+                    posting = array('i', [id for id in posting if id in self.ids])
+                    if posting:
+                        self.postings[trigram] = posting
+                    else:
+                        del self.postings[trigram]
+                self.dead = 0
+            self.changes = 0
+            data = marshal.dumps((self.files, self.nextId,
+                dict((trigram, posting.tostring()) for trigram, posting in self.postings.iteritems())))
+        if not os.path.isdir(self.cacheDir):
+            return
+        tmpPath = self.path + ".tmp"
+        try:
+            with open(tmpPath, "wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+                f.write(data)
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+            os.rename(tmpPath, self.path)
+        except Exception, e:
+            core.Log("write search index error", self.path, e)
+            if os.path.isfile(tmpPath):
+                os.remove(tmpPath)
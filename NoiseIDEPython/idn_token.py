@@ -2,7 +2,9 @@ __author__ = 'Yaroslav Nikityshev aka IDNoise'
 
 import re
 
-class Token:
+class Token(object):
+    __slots__ = ("type", "value", "start", "end")
+
     def __init__(self, type, value, start, end):
         self.type = type
         self.value = value
@@ -44,7 +46,7 @@ class ErlangTokenizer:
             |(?P<fundec>^(?!fun\()[a-z][a-zA-Z_0-9]*(?=\())
             |(?P<var>[A-Z_][a-zA-Z_0-9]*)
             |(?P<moduleattr>^-[a-z][a-z_]*)
-            |(?P<number>[0-9]{1,2}\#[0-9a-z]*|[0-9]*\.?[0-9]+)
+            |(?P<number>[0-9]{1,2}\#[0-9a-z]*|[0-9]*\.?[0-9]+|\$\\?.)
             |(?P<record>\#[a-z][a-z0-9A-Z_]*)
             |(?P<macros>\?[a-zA-Z][a-zA-Z_0-9]*)
             |(?P<atom>'.+?'|[a-z][a-zA-Z_0-9@]*)
@@ -57,17 +59,18 @@ class ErlangTokenizer:
             """,
             re.VERBOSE | re.MULTILINE)
 
-    def GetTokens(self, text):
-        tokens = []
-        pos = 0
-        while True:
-            m = self.tokenRegexp.search(text, pos)
-            if not m: break
-            type = m.lastgroup
-            value = m.group(type)
-            pos = m.end()
-            tokens.append(Token(type, value, m.start(), m.end()))
-        return tokens
+    def Scan(self, text, pos = 0, skipSpace = False):
+        """
+        Returns list of (type, start, end) tuples, values can be taken from text when needed.
+        """
+        if skipSpace:
+            space = ErlangTokenType.SPACE
+            return [(m.lastgroup, m.start(), m.end()) for m in self.tokenRegexp.finditer(text, pos)
+                    if m.lastgroup != space]
+        return [(m.lastgroup, m.start(), m.end()) for m in self.tokenRegexp.finditer(text, pos)]
+
+    def GetTokens(self, text, pos = 0, skipSpace = False):
+        return [Token(type, text[start:end], start, end) for (type, start, end) in self.Scan(text, pos, skipSpace)]
 
 class IgorTokenType:
     STRING = "string"
@@ -93,18 +96,11 @@ class IgorTokenizer:
             """,
             re.VERBOSE | re.MULTILINE)
 
+    def Scan(self, text):
+        """
+        Returns list of (type, start, end) tuples, type is name of matched group.
+        """
+        return [(m.lastgroup, m.start(), m.end()) for m in self.tokenRegexp.finditer(text)]
+
     def GetTokens(self, text):
-        tokens = []
-        pos = 0
-        while True:
-            m = self.tokenRegexp.search(text, pos)
-            if not m: break
-            d = m.groupdict()
-            for g in d:
-                if d[g] != None:
-                    value = d[g]
-                    start = m.start(g)
-                    end = m.end(g)
-                    tokens.append(Token(g, value, start, end))
-            pos = m.end()
-        return tokens
+        return [Token(type, text[start:end], start, end) for (type, start, end) in self.Scan(text)]
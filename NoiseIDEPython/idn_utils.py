@@ -44,15 +44,16 @@ def pystr(erlstr):
     erlstr = os.path.normpath(erlstr)
     return erlstr.replace("/", os.sep)
 
-def GetAllFilesInDir(path, fileExts = None):
-    files = []
+def IterFilesInDir(path, fileExts = None):
     for root, _, fileNames in os.walk(path):
         for fileName in fileNames:
             fp = os.path.join(root, fileName)
             if fileExts and not any([fp.endswith(fm) for fm in fileExts]):
                 continue
-            files.append(fp)
-    return files
+            yield fp
+
+def GetAllFilesInDir(path, fileExts = None):
+    return list(IterFilesInDir(path, fileExts))
 
 class Timer(Thread):
     def __init__(self, interval, function):
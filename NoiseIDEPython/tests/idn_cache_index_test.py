@@ -0,0 +1,60 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import idn_cache_index
+from idn_cache_index import ErlangCacheIndex
+
+class TestErlangCacheIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def put(self, index, name):
+        index.Put(os.path.join("app", name + ".cache"), name, "app", 1.0, "/src/" + name + ".erl", [], False, [],
+                  {"name": name})
+
+    def test_failed_flush_keeps_changes(self):
+        index = ErlangCacheIndex(self.dir)
+        index.Open()
+        self.put(index, "mod_a")
+        self.put(index, "mod_c")
+        index.Flush()
+        self.put(index, "mod_b")
+        index.Remove(os.path.join("app", "mod_c.cache"))
+        rename = os.rename
+        def failingRename(source, target):
+            if source.endswith(".tmp"):
+                raise OSError("rename failed")
+            rename(source, target)
+        idn_cache_index.os.rename = failingRename
+        try:
+            index.Flush()
+        finally:
+            idn_cache_index.os.rename = rename
+        self.assertTrue(index.IsDirty())
+        self.assertEqual({"name": "mod_a"}, index.ReadData(os.path.join("app", "mod_a.cache")))
+        self.assertEqual({"name": "mod_b"}, index.ReadData(os.path.join("app", "mod_b.cache")))
+        self.assertEqual(None, index.Entry(os.path.join("app", "mod_c.cache")))
+        self.assertEqual(["symbols.index"], os.listdir(self.dir))
+
+        index.Flush()
+        self.assertFalse(index.IsDirty())
+        self.assertEqual(["symbols.index"], os.listdir(self.dir))
+        reopened = ErlangCacheIndex(self.dir)
+        reopened.Open()
+        self.assertEqual([os.path.join("app", "mod_a.cache"), os.path.join("app", "mod_b.cache")],
+                         sorted(reopened.Entries().keys()))
+        self.assertEqual({"name": "mod_a"}, reopened.ReadData(os.path.join("app", "mod_a.cache")))
+        self.assertEqual({"name": "mod_b"}, reopened.ReadData(os.path.join("app", "mod_b.cache")))
+
+if __name__ == '__main__':
+    unittest.main()
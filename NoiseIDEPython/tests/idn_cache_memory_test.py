@@ -0,0 +1,238 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import sys
+import gc
+import json
+import types
+import shutil
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import idn_cache
+from idn_cache import *
+from idn_cache_index import ErlangCacheIndex
+from idn_cache_loader import CacheLoader
+
+MODULES_COUNT = 5000
+
+class LegacyFunction:
+    def __init__(self, moduleData, module, name, arity, line, params, types, result, docref, exported, bif, comment):
+        self.moduleData = moduleData
+        self.module = module
+        self.name = name
+        self.arity = arity
+        self.params = params
+        self.line = line
+        self.types = types
+        self.result = result
+        self.docref = docref
+        self.exported = exported
+        self.bif = bif
+        self.comment = comment
+        self.file = moduleData.file
+
+class LegacyRecord:
+    def __init__(self, moduleData, module, name, fields, types, line):
+        self.moduleData = moduleData
+        self.module = module
+        self.name = name
+        self.fields = fields
+        self.types = types
+        self.line = line
+        self.file = moduleData.file
+        self.fieldTypes = {}
+        for i in range(len(self.fields)):
+            self.fieldTypes[self.fields[i]] = self.types[i]
+
+class LegacyMacros:
+    def __init__(self, moduleData, module, name, value, line):
+        self.moduleData = moduleData
+        self.module = module
+        self.name = name
+        self.value = value
+        self.line = line
+        self.file = moduleData.file
+
+class LegacyExportedType:
+    def __init__(self, moduleData, module, name, types, line):
+        self.moduleData = moduleData
+        self.module = module
+        self.name = name
+        self.types = types
+        self.line = line
+        self.file = moduleData.file
+
+class LegacyModuleData:
+    def __init__(self, module, data, srcFile, app):
+        self.srcFile = srcFile
+        self.file = data[FILE]
+        self.module = module
+        self.app = app
+        self.data = data
+        self.functions = []
+        for funData in data[FUNS]:
+            self.functions.append(LegacyFunction(self, module, funData[NAME], funData[ARITY],
+                funData[LINE], funData[PARAMS], funData[TYPES], funData[RESULT],
+                None, funData[EXPORTED], False, ""))
+        self.records = []
+        for record in data[RECORDS_DATA]:
+            recordData = data[RECORDS_DATA][record]
+            self.records.append(LegacyRecord(self, module, record, recordData[FIELDS], recordData[TYPES], recordData[LINE]))
+        self.macroses = []
+        for macros in data[MACROS]:
+            macData = data[MACROS][macros]
+            self.macroses.append(LegacyMacros(self, module, macros, macData[VALUE], macData[LINE]))
+        self.includes = set([(i[0], i[1]) for i in data[INCLUDES]])
+        self.exportedTypes = []
+        for expType in data[EXPORTED_TYPES]:
+            expData = data[EXPORTED_TYPES][expType]
+            self.exportedTypes.append(LegacyExportedType(self, module, expType, expData[TYPES], expData[LINE]))
+
+def SyntheticModule(i):
+    funs = []
+    for f in range(30):
+        clauses = 1 + f % 2
+        funs.append({NAME: "fun_{}".format(f), ARITY: 2, LINE: f * 10,
+                     PARAMS: [["State", "Options"]] * clauses, TYPES: [["state()", "list()"]] * clauses,
+                     RESULT: ["ok"] * clauses, EXPORTED: f % 3 == 0})
+    records = {}
+    for r in range(3):
+        records["record_{}".format(r)] = {FIELDS: ["id", "name", "value", "state", "options"],
+                                          TYPES: ["integer()", "string()", "term()", "atom()", "list()"],
+                                          LINE: r}
+    macroses = {}
+    for m in range(5):
+        macroses["MACROS_{}".format(m)] = {VALUE: "value_{}".format(m), LINE: m}
+    exportedTypes = {"state": {TYPES: "#state{}", LINE: 1}, "options": {TYPES: "[option()]", LINE: 2}}
+    data = {FILE: "/project/apps/app_{}/src/module_{}.erl".format(i % 50, i), FUNS: funs,
+            RECORDS_DATA: records, MACROS: macroses, INCLUDES: [["app", "records.hrl"]],
+            EXPORTED_TYPES: exportedTypes}
+    return json.loads(json.dumps(data))
+
+def DeepSize(root):
+    seen = set()
+    size = 0
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen: continue
+        seen.add(id(obj))
+        if isinstance(obj, (type, types.ClassType, types.ModuleType, types.FunctionType)): continue
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return size
+
+class TestCacheMemory(unittest.TestCase):
+
+    def test_memory(self):
+        legacy = [LegacyModuleData("module_{}".format(i), SyntheticModule(i), "module_{}.cache".format(i), "app")
+                  for i in range(MODULES_COUNT)]
+        legacySize = DeepSize(legacy)
+        del legacy
+        idn_cache.STRINGS.clear()
+        compact = [ModuleData("module_{}".format(i), SyntheticModule(i), "module_{}.cache".format(i), "app")
+                   for i in range(MODULES_COUNT)]
+        for module in compact:
+            (module.functions, module.records, module.macroses, module.exportedTypes)
+        compactSize = DeepSize([compact, idn_cache.STRINGS])
+        print "modules: {}, legacy: {:.1f} MB, compact: {:.1f} MB, {:.0f}%".format(MODULES_COUNT,
+            legacySize / 1048576.0, compactSize / 1048576.0, 100.0 * compactSize / legacySize)
+        self.assertTrue(compactSize < legacySize)
+
+class TestLazyRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.keys = []
+
+    def tearDown(self):
+        for key in self.keys:
+            dict.__delitem__(ErlangCache.includes, key)
+            ErlangCache.InvalidateIndexes(key)
+        ErlangCache.sweepItems.clear()
+        ErlangCache.sweepQueue.clear()
+        shutil.rmtree(self.dir)
+
+    def test_all_records_decode_only_requested_include(self):
+        index = ErlangCacheIndex(self.dir)
+        for i in range(20):
+            name = "include_{}.hrl".format(i)
+            srcFile = os.path.join(self.dir, name)
+            open(srcFile, "w").close()
+            records = {"record_{}".format(i): {FIELDS: ["id"], TYPES: ["integer()"], LINE: 1}}
+            data = {FILE: srcFile, FUNS: [], RECORDS_DATA: records, MACROS: {}, INCLUDES: [], EXPORTED_TYPES: {}}
+            index.Put(os.path.join("app", name + ".cache"), name, "app", 1.0, srcFile, [], False,
+                      records.keys(), data)
+        index.Flush()
+        for path, entry in index.Entries().items():
+            ErlangCache.AddLazy(index, entry, os.path.join(self.dir, path))
+            self.keys.append((entry.app, entry.name))
+        materialized = ErlangCache.MaterializedModulesCount()
+        self.assertEqual(20, len(ErlangCache.AllRecordsIndex()))
+        self.assertEqual(["record_7"], [rec.name for rec in ErlangCache.AllRecords("record_7")])
+        self.assertEqual(["id"], [field for (field, _type) in ErlangCache.AllRecordFields("record_7")])
+        self.assertEqual(None, ErlangCache.AllRecordsData("no_such_record"))
+        self.assertEqual(materialized + 1, ErlangCache.MaterializedModulesCount())
+        self.assertEqual(1, len([key for key in self.keys if ErlangCache.includes.IsMaterialized(key)]))
+        index.Close()
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        index = ErlangCache.indexes.pop(os.path.normcase(os.path.normpath(self.dir)))
+        index.Close()
+        ErlangCache.sweepItems.clear()
+        ErlangCache.sweepQueue.clear()
+        shutil.rmtree(self.dir)
+
+    def test_missing_cache_file_is_forgotten(self):
+        index = ErlangCache.GetIndex(self.dir)
+        os.mkdir(os.path.join(self.dir, "app"))
+        srcFile = os.path.join(self.dir, "src.erl")
+        open(srcFile, "w").close()
+        data = {FILE: srcFile, FUNS: [], RECORDS_DATA: {}, MACROS: {}, INCLUDES: [], EXPORTED_TYPES: {}}
+        lazyFile = os.path.join(self.dir, "app", "lazy_mod.cache")
+        index.Put(index.RelPath(lazyFile), "lazy_mod", "app", 1.0, srcFile, [], False, [], data)
+        index.Flush()
+        ErlangCache.AddLazy(index, index.Entry(index.RelPath(lazyFile)), lazyFile)
+        loadedFile = os.path.join(self.dir, "app", "loaded_mod.cache")
+        ErlangCache.AddModuleData(loadedFile, (1.0, data))
+        for f in [lazyFile, loadedFile]:
+            ErlangCache.RegisterCacheFile(f)
+
+        ErlangCache.SweepStep()
+        ErlangCache.OnFileCheckTimer(None)
+        for name in ["lazy_mod", "loaded_mod"]:
+            self.assertFalse(name in ErlangCache.modules)
+            self.assertFalse(name + ".cache" in ErlangCache.cacheFiles)
+        self.assertEqual({}, index.Entries())
+
+    def test_lazy_module_with_deleted_source(self):
+        index = ErlangCache.GetIndex(self.dir)
+        srcFile = os.path.join(self.dir, "gone.erl")
+        open(srcFile, "w").close()
+        funs = [{NAME: "f", ARITY: 0, LINE: 1, PARAMS: [[]], TYPES: [[]], RESULT: ["ok"], EXPORTED: True}]
+        data = {FILE: srcFile, FUNS: funs, RECORDS_DATA: {}, MACROS: {}, INCLUDES: [], EXPORTED_TYPES: {}}
+        cacheFile = os.path.join(self.dir, "app", "gone.cache")
+        index.Put(index.RelPath(cacheFile), "gone", "app", 1.0, srcFile, [], False, [], data)
+        index.Flush()
+        ErlangCache.AddLazy(index, index.Entry(index.RelPath(cacheFile)), cacheFile)
+        os.remove(srcFile)
+        ErlangCache.missingCacheFiles["gone.cache"] = time.time()
+        ErlangCache.loader = CacheLoader(ErlangCache.ReadCacheFile)
+        try:
+            self.assertEqual([], ErlangCache.ModuleFunctions("gone"))
+            self.assertEqual(None, ErlangCache.ModuleFunction("gone", "f", 0))
+            self.assertFalse("gone" in ErlangCache.modules)
+        finally:
+            ErlangCache.loader.Stop()
+            del ErlangCache.missingCacheFiles["gone.cache"]
+
+if __name__ == '__main__':
+    unittest.main()
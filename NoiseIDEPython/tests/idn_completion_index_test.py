@@ -0,0 +1,89 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_completion_index import CompletionIndex, CompletionName
+
+NAMES_COUNT = 30000
+LIMIT = 100
+PREFIXES = ["", "g", "ge", "get_", "get_va", "gtv", "handle_call", "mod_1", "zzz"]
+
+def Names():
+    words = ["get", "set", "handle", "init", "mod", "value", "state", "call", "cast", "info", "list", "to"]
+    names = []
+    for i in range(NAMES_COUNT):
+        names.append("{}_{}_{}".format(words[i % len(words)], words[(i / len(words)) % len(words)], i))
+    return names
+
+def LegacyQuery(names, prefix, limit):
+    return sorted([name for name in set(names) if name.startswith(prefix)])[:limit]
+
+class TestCompletionIndex(unittest.TestCase):
+
+    def setUp(self):
+        locality = {"get_value": 1, "get_state": 2, "get_var": 3, "gather_text_values": 0}
+        self.index = CompletionIndex(["get_var", "get_state", "get_value", "gather_text_values", "go", "set_value",
+                                      ("get_value", "tuple item")], lambda item: locality.get(CompletionName(item), 4))
+
+    def query(self, prefix, limit = 10):
+        return [CompletionName(item) for item in self.index.Query(prefix, limit)]
+
+    def test_range(self):
+        (lo, hi) = self.index.Range("get_")
+        self.assertEqual(["get_state", "get_value", "get_value", "get_var"], self.index.keys[lo:hi])
+        (lo, hi) = self.index.Range("x")
+        self.assertEqual(lo, hi)
+
+    def test_prefix_before_subsequence(self):
+        self.assertEqual(["get_value", "get_value", "get_state", "get_var", "gather_text_values"], self.query("ge"))
+        self.assertEqual(["gather_text_values", "get_value", "get_value", "get_var"], self.query("gtv"))
+        self.assertEqual(["gather_text_values"], self.query("gtx"))
+        self.assertEqual([], self.query("etv"))
+        self.assertEqual(["go"], self.query("g", 10)[-1:])
+
+    def test_locality(self):
+        self.assertEqual(["get_value", "get_value", "get_state", "get_var"], self.query("get_", 4))
+        self.assertEqual(["get", "get_value"], [CompletionName(item) for item in
+                                               CompletionIndex(["get_value", "get"]).Query("ge", 10)])
+
+    def test_limit(self):
+        self.assertEqual(["get_value", "get_value"], self.query("get", 2))
+        self.assertEqual(["get_value", "get_value", "get_state", "get_var"], self.query("ge", 4))
+        self.assertEqual([], self.query("get", 0))
+
+    def test_empty_prefix(self):
+        self.assertEqual(self.index.byRank, self.index.Query("", 100))
+        self.assertEqual(self.index.byRank[:3], self.index.Query("", 3))
+        self.assertEqual("gather_text_values", CompletionName(self.index.byRank[0]))
+        self.assertEqual(["go", "set_value"], [CompletionName(item) for item in self.index.byRank[-2:]])
+
+    def test_time(self):
+        names = Names()
+        start = time.time()
+        index = CompletionIndex(names)
+        buildTime = (time.time() - start) * 1000
+        for prefix in PREFIXES:
+            if prefix:
+                self.assertEqual(LegacyQuery(names, prefix, NAMES_COUNT),
+                                 sorted([name for name in index.Query(prefix, NAMES_COUNT) if name.startswith(prefix)]))
+        print "names: {}, index build {:.1f} ms".format(NAMES_COUNT, buildTime)
+        worst = 0
+        for prefix in PREFIXES:
+            start = time.time()
+            LegacyQuery(names, prefix, LIMIT)
+            legacyTime = (time.time() - start) * 1000
+            queryTimes = []
+            for i in range(3):
+                start = time.time()
+                index.Query(prefix, LIMIT)
+                queryTimes.append((time.time() - start) * 1000)
+            worst = max(worst, min(queryTimes))
+            print "{:<14} filter + sort {:>6.1f} ms, index {:>6.2f} ms".format(repr(prefix), legacyTime, min(queryTimes))
+        self.assertTrue(worst < 5)
+
+if __name__ == '__main__':
+    unittest.main()
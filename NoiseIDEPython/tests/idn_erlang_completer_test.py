@@ -0,0 +1,83 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import sys
+import json
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_cache import *
+from idn_erlang_completer import ErlangCompleter
+
+MODULE_FILE = "/project/apps/app/src/mod_a.erl"
+INCLUDE_FILE = "/project/apps/app/include/records.hrl"
+
+def CacheData(file, funs = None, records = None, macroses = None, includes = None, types = None):
+    return json.loads(json.dumps({FILE: file, FUNS: funs or [], RECORDS_DATA: records or {},
+                                  MACROS: macroses or {}, INCLUDES: includes or [], EXPORTED_TYPES: types or {}}))
+
+class CompleterNavigation(object):
+    """
+    Navigation and help part of ErlangCompleter without wx frame.
+    """
+    module = "mod_a"
+    arity = 1
+
+    GetFunctionNavAndHelp = ErlangCompleter.GetFunctionNavAndHelp.im_func
+    GetRecordNavAndHelp = ErlangCompleter.GetRecordNavAndHelp.im_func
+    GetMacrosNavAndHelp = ErlangCompleter.GetMacrosNavAndHelp.im_func
+    MacrosValue = ErlangCompleter.MacrosValue.im_func
+    _FunctionHelp = ErlangCompleter._FunctionHelp.im_func
+    _RecordHelp = ErlangCompleter._RecordHelp.im_func
+    _MacrosHelp = ErlangCompleter._MacrosHelp.im_func
+    _ExportedTypeHelp = ErlangCompleter._ExportedTypeHelp.im_func
+
+    def GetFunArity(self, pos):
+        return self.arity
+
+class TestErlangCompleterNavigation(unittest.TestCase):
+
+    def setUp(self):
+        include = ModuleData("records.hrl", CacheData(INCLUDE_FILE,
+            records = {"state": {FIELDS: ["id"], TYPES: ["integer()"], LINE: 3}},
+            macroses = {"LOG(X)": {VALUE: "io:format(X)", LINE: 5}}), "records.hrl.cache", "app")
+        module = ModuleData("mod_a", CacheData(MODULE_FILE,
+            funs = [{NAME: "start", ARITY: 1, LINE: 10, PARAMS: [["Args"]], TYPES: [["list()"]],
+                     RESULT: ["ok"], EXPORTED: True}],
+            includes = [["app", "records.hrl"]],
+            types = {"options": {TYPES: "[option()]", LINE: 7}}), "mod_a.cache", "app")
+        dict.__setitem__(ErlangCache.includes, include.Key(), include)
+        ErlangCache.InvalidateIndexes(include.Key(), include.includes)
+        dict.__setitem__(ErlangCache.modules, "mod_a", module)
+        ErlangCache.InvalidateIndexes("mod_a", module.includes)
+        self.completer = CompleterNavigation()
+
+    def tearDown(self):
+        for (data, key) in [(ErlangCache.modules, "mod_a"), (ErlangCache.includes, ("app", "records.hrl"))]:
+            dict.__delitem__(data, key)
+            ErlangCache.InvalidateIndexes(key)
+
+    def test_function(self):
+        ((file, line), help) = self.completer.GetFunctionNavAndHelp("start", "mod_a:", 0)
+        self.assertEqual((MODULE_FILE, 10), (file, line))
+        self.assertTrue("start(Args)" in help)
+
+    def test_exported_type(self):
+        ((file, line), help) = self.completer.GetFunctionNavAndHelp("options", "mod_a:", 0)
+        self.assertEqual((MODULE_FILE, 7), (file, line))
+        ((file, line), help) = self.completer.GetFunctionNavAndHelp("boolean", "mod_a:", 0)
+        self.assertEqual(None, file)
+        self.assertTrue("'false' | 'true'" in help)
+
+    def test_record(self):
+        ((file, line), help) = self.completer.GetRecordNavAndHelp("#state")
+        self.assertEqual((INCLUDE_FILE, 3), (file, line))
+        self.assertTrue("#state" in help)
+
+    def test_macros(self):
+        ((file, line), help) = self.completer.GetMacrosNavAndHelp("?LOG")
+        self.assertEqual((INCLUDE_FILE, 5), (file, line))
+        self.assertTrue("io:format(X)" in help)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_erlang_lexer import ErlangLexer
+from idn_headless_stc import HeadlessSTC
+from idn_highlight import ErlangHighlightType
+from idn_erlang_context import (ErlangWordAtPosition, NavigationContextAt, PrefixModule, IncludePath,
+                                ExportedFunctionLine, IsInExports, Vars, FunArity)
+
+MODULE = """-module(mod_a).
+-export([start/1]).
+-include("records.hrl").
+-include_lib("kernel/include/file.hrl").
+
+start(Args) ->
+    State = #state{id = 1, name = Args},
+    mod_b:call(State, {Args, 1}, [x]),
+    ?MOD:run(),
+    lists:map(fun start/1, []).
+"""
+
+class TestErlangContext(unittest.TestCase):
+
+    def setUp(self):
+        self.stc = HeadlessSTC(MODULE)
+        self.stc.lexer = ErlangLexer(self.stc)
+        self.stc.Colourise()
+
+    def pos(self, text, offset = 0):
+        return MODULE.index(text) + offset
+
+    def test_word_and_navigation_context(self):
+        self.assertEqual((self.pos("call"), self.pos("call") + 4, "call"), ErlangWordAtPosition(self.stc, self.pos("call", 1)))
+        context = NavigationContextAt(self.stc, self.pos("call", 1))
+        self.assertEqual((ErlangHighlightType.FUNCTION, "call", "    mod_b:"), (context.style, context.value, context.prefix))
+        self.assertEqual("(State, {Args, 1}, [x]),", context.postfix)
+        self.assertEqual(None, NavigationContextAt(self.stc, self.pos("State =")))
+
+    def test_prefix_module(self):
+        macros = {"MOD": "mod_c"}.get
+        self.assertEqual("mod_b", PrefixModule("    mod_b:", "mod_a", macros))
+        self.assertEqual("mod_c", PrefixModule("    ?MOD:", "mod_a", macros))
+        self.assertEqual("mod_a", PrefixModule("    ?MODULE:", "mod_a", macros))
+        self.assertEqual("mod_a", PrefixModule("    ", "mod_a", macros))
+        self.assertEqual("mod_a", PrefixModule(":", "mod_a"))
+        self.assertEqual("mod_a", PrefixModule("f(X):", "mod_a"))
+
+    def test_include_path(self):
+        for (text, path) in [("records", ("records.hrl", False)), ("include(", ("records.hrl", False)),
+                             ("kernel", ("kernel/include/file.hrl", True)),
+                             ("include_lib", ("kernel/include/file.hrl", True)), ("call", (None, False))]:
+            self.assertEqual(path, IncludePath(NavigationContextAt(self.stc, self.pos(text, 1))))
+
+    def test_exports(self):
+        self.assertEqual(2, ExportedFunctionLine(self.stc, "start"))
+        self.assertEqual(None, ExportedFunctionLine(self.stc, "stop"))
+        self.stc.GotoPos(self.pos("start/1"))
+        self.assertTrue(IsInExports(self.stc))
+        self.stc.GotoPos(self.pos("mod_b"))
+        self.assertFalse(IsInExports(self.stc))
+
+    def test_vars_and_arity(self):
+        self.stc.GotoPos(self.pos("mod_b"))
+        self.assertEqual(["Args", "State"], sorted(Vars(self.stc)))
+        self.assertEqual(["Args"], Vars(self.stc, "State"))
+        self.assertEqual(3, FunArity(self.stc, self.pos("call", 4)))
+        self.assertEqual(1, FunArity(self.stc, self.pos("start/1", 5)))
+        self.assertEqual(0, FunArity(self.stc, self.pos("run", 3)))
+
+    def test_record_field_under_cursor(self):
+        self.stc.GotoPos(self.pos("name =", 2))
+        self.assertEqual((True, "state", "na"), self.stc.lexer.RecordFieldUnderCursor())
+        self.stc.GotoPos(self.pos("mod_b"))
+        self.assertFalse(self.stc.lexer.RecordFieldUnderCursor()[0])
+
+if __name__ == '__main__':
+    unittest.main()
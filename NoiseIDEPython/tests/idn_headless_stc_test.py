@@ -0,0 +1,138 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import sys
+import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_lexer import STC_FOLDLEVELHEADERFLAG, STC_FOLDLEVELBASE
+from idn_erlang_lexer import ErlangLexer
+from idn_headless_stc import HeadlessSTC
+from idn_highlight import ErlangHighlightType
+
+MODULE = """-module(test).
+-export([first/1, second/0]).
+
+-record(state, {id, name}).
+
+-spec first(integer()) -> ok.
+first(Id) ->
+    State = #state{id = Id},
+    io:format("~p~n", [State]),
+    ok.
+
+second() ->
+    first(1).
+"""
+
+class CountingLexer(ErlangLexer):
+    lexed = 0
+
+    def _LexLine(self, line, state):
+        self.lexed += 1
+        return ErlangLexer._LexLine(self, line, state)
+
+class BlockingLexer(ErlangLexer):
+    """
+    Worker thread waits for gate before lexing, so edits can be made while background lexing runs.
+    """
+    def __init__(self, stc):
+        ErlangLexer.__init__(self, stc)
+        self.gate = threading.Event()
+
+    def _LineData(self, *args):
+        if threading.current_thread().name != "MainThread":
+            self.gate.wait()
+        return ErlangLexer._LineData(self, *args)
+
+class TestHeadlessSTC(unittest.TestCase):
+
+    def setUp(self):
+        self.stc = HeadlessSTC(MODULE)
+        self.stc.lexer = ErlangLexer(self.stc)
+        self.stc.Colourise()
+
+    def test_lines(self):
+        self.assertEqual(14, self.stc.GetLineCount())
+        self.assertEqual("first(Id) ->\n", self.stc.GetLine(6))
+        self.assertEqual(6, self.stc.LineFromPosition(self.stc.PositionFromLine(6) + 3))
+        self.assertEqual(self.stc.PositionFromLine(7) - 1, self.stc.GetLineEndPosition(6))
+
+    def test_styles_and_folds(self):
+        self.assertEqual(len(MODULE), self.stc.GetEndStyled())
+        self.assertEqual(ErlangHighlightType.FUNDEC, self.stc.GetStyleAt(MODULE.index("first(Id)")))
+        self.assertEqual(ErlangHighlightType.STRING, self.stc.GetStyleAt(MODULE.index('"~p~n"')))
+        self.assertEqual(STC_FOLDLEVELBASE | STC_FOLDLEVELHEADERFLAG, self.stc.GetFoldLevel(6))
+        self.assertEqual(STC_FOLDLEVELBASE + 2, self.stc.GetFoldLevel(9))
+
+    def test_queries(self):
+        lexer = self.stc.lexer
+        self.stc.GotoPos(MODULE.index("io:format"))
+        self.assertTrue(lexer.IsInFunction())
+        self.assertEqual("first", lexer.GetCurrentFunction()[0])
+        self.stc.GotoPos(MODULE.index("integer()"))
+        self.assertTrue(lexer.IsInTypeBlock())
+        (exports, start, _end, _insertPosition) = lexer.GetAllExports()
+        self.assertEqual("first/1, second/0", exports)
+        self.assertEqual(MODULE.index("first/1"), start)
+
+    def test_edit(self):
+        self.stc.InsertText(self.stc.PositionFromLine(2), "third() ->\n    ok.\n")
+        self.stc.Colourise()
+        self.assertEqual(16, self.stc.GetLineCount())
+        self.assertEqual(ErlangHighlightType.FUNDEC, self.stc.GetStyleAt(self.stc.PositionFromLine(2)))
+        self.assertEqual(ErlangHighlightType.FUNDEC, self.stc.GetStyleAt(self.stc.PositionFromLine(8)))
+        self.stc.GotoPos(self.stc.PositionFromLine(14))
+        self.assertEqual("second", self.stc.lexer.GetCurrentFunction()[0])
+
+    def test_styles_only_requested_lines(self):
+        text = MODULE + "".join(["fun_{0}(X) ->\n    X.\n".format(i) for i in range(1000)])
+        stc = HeadlessSTC(text)
+        stc.lexer = ErlangLexer(stc)
+        stc.Colourise(0, stc.PositionFromLine(50))
+        styled = [line for (line, lineData) in enumerate(stc.lexer.linesData) if lineData and lineData.styled]
+        self.assertEqual(range(51), styled)
+        self.assertEqual(stc.PositionFromLine(51), stc.GetEndStyled())
+        stc.Colourise(0, stc.PositionFromLine(100))
+        self.assertEqual(101, len([lineData for lineData in stc.lexer.linesData if lineData and lineData.styled]))
+        self.assertEqual(ErlangHighlightType.FUNDEC, stc.GetStyleAt(stc.PositionFromLine(99)))
+
+    def test_structure_update_stops_after_edit(self):
+        text = MODULE + "".join(["fun_{0}(X) ->\n    X.\n".format(i) for i in range(1000)])
+        stc = HeadlessSTC(text)
+        stc.lexer = CountingLexer(stc)
+        stc.Colourise()
+        stc.InsertText(stc.PositionFromLine(7) + 4, "Other = 1, ")
+        stc.InsertText(stc.PositionFromLine(1501), "extra() -> ok.\n")
+        stc.lexer.lexed = 0
+        stc.lexer.UpdateStructure()
+        stc.GotoPos(stc.PositionFromLine(1501) + 2)
+        self.assertEqual("extra", stc.lexer.GetCurrentFunction()[0])
+        self.assertTrue(stc.lexer.lexed < 1500)
+        stc.InsertText(stc.PositionFromLine(7) + 4, "More = 2, ")
+        stc.lexer.lexed = 0
+        stc.lexer.UpdateStructure()
+        stc.GotoPos(stc.PositionFromLine(7))
+        self.assertEqual("first", stc.lexer.GetCurrentFunction()[0])
+        self.assertEqual(1, stc.lexer.lexed)
+
+    def test_edit_during_background_lexing(self):
+        text = MODULE + "".join(["fun_{0}(X) ->\n    X.\n".format(i) for i in range(1000)])
+        stc = HeadlessSTC(text)
+        stc.lexer = BlockingLexer(stc)
+        lexed = threading.Event()
+        stc.lexer.SetMode(ErlangLexer.MODE_LARGE, lexed.set)
+        stc.InsertText(stc.PositionFromLine(2), "extra() ->\n    ok.\n")
+        stc.lexer.gate.set()
+        self.assertTrue(lexed.wait(10))
+        stc.lexer.InstallLexedLines()
+        for line, lineData in enumerate(stc.lexer.linesData):
+            self.assertEqual(hash(stc.GetLine(line)), lineData.textHash)
+        stc.GotoPos(stc.PositionFromLine(3))
+        self.assertEqual("extra", stc.lexer.GetCurrentFunction()[0])
+        stc.GotoPos(stc.PositionFromLine(9))
+        self.assertEqual("first", stc.lexer.GetCurrentFunction()[0])
+
+if __name__ == '__main__':
+    unittest.main()
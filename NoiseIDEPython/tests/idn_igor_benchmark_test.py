@@ -0,0 +1,127 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_token import Token, IgorTokenizer, IgorTokenType
+from idn_highlight import IgorHighlighter, IgorHighlightType
+
+LINES_COUNT = 20000
+
+def Schema():
+    lines = ["[csharp namespace=\"Network\"]", "[:json enabled=true]", "module Protocol", "{"]
+    i = 0
+    while len(lines) < LINES_COUNT:
+        lines += ["    enum Kind{0}".format(i),
+                  "    {",
+                  "        first_{0};".format(i),
+                  "        second_{0} = 2;".format(i),
+                  "    }",
+                  "    // record number {0}".format(i),
+                  "    record Data.Data{0}[first_{0}]".format(i),
+                  "    {",
+                  "        [tag]",
+                  "        Kind{0} kind;".format(i),
+                  "        int count = 10;",
+                  "        ?string name;",
+                  "        list[CdbKey] keys;",
+                  "    }",
+                  "    [erlang-server dispatcher=\"player_igor\"]",
+                  "    service Service{0}".format(i),
+                  "    {",
+                  "        s->c Notify(Data{0} data, dict<atom, int> values);".format(i),
+                  "        c->s Request(int id) returns (bool result);",
+                  "    }"]
+        i += 1
+    return [line + "\n" for line in lines[:LINES_COUNT]]
+
+def LegacyGetTokens(tokenizer, text):
+    tokens = []
+    pos = 0
+    while True:
+        m = tokenizer.tokenRegexp.search(text, pos)
+        if not m: break
+        d = m.groupdict()
+        for g in d:
+            if d[g] != None:
+                tokens.append(Token(g, d[g], m.start(g), m.end(g)))
+        pos = m.end()
+    return tokens
+
+def LegacyGetHighlightingTokens(highlighter, text):
+    result = []
+    tokens = LegacyGetTokens(highlighter.tokenizer, text)
+    if not tokens: return result
+    firstToken = tokens[0]
+    for i in range(len(tokens)):
+        token = tokens[:][i]
+        tokenType = IgorHighlightType.DEFAULT
+        if token.value in highlighter.keywords:
+            tokenType = IgorHighlightType.KEYWORD
+        elif token.type in highlighter.RULES:
+            tokenType = highlighter.RULES[token.type]
+        elif token.value in ["?"]:
+            tokenType = IgorHighlightType.SPECIAL_SYMBOL
+        elif firstToken.value == "[" and i == 1:
+            tokenType = IgorHighlightType.ATTRIBUTE_TARGET
+        elif firstToken.value == "[" and token.type == IgorTokenType.LOWER and tokens[i - 1].value != "=":
+            tokenType = IgorHighlightType.ATTRIBUTE
+        elif token.type == IgorTokenType.UPPER:
+            if firstToken.type == IgorTokenType.SPECIAL and i == 1:
+                tokenType = IgorHighlightType.FUNCTION
+            else:
+                tokenType = IgorHighlightType.CUSTOM_TYPE
+        elif token.type == IgorTokenType.LOWER:
+            if len(tokens) == 2 and tokens[1].value == ";":
+                tokenType = IgorHighlightType.ENUM_FIELD
+            elif len(tokens) == 4 and tokens[3].value == ";" and tokens[1].value == "=" and tokens[2].value.isdigit():
+                tokenType = IgorHighlightType.ENUM_FIELD
+            elif firstToken.value == "record" and tokens[i - 1].value == "[":
+                tokenType = IgorHighlightType.ENUM_FIELD
+            elif token.value in ["bool", "sbyte", "byte", "short", "ushort", "int", "uint", "long", "ulong", "float",
+                                 "double", "string", "binary", "atom", "dict", "list"]:
+                tokenType = IgorHighlightType.BASE_TYPE
+            elif len(tokens) > i + 1 and tokens[i + 1].value in ["=", ";", ",", ")"]:
+                tokenType = IgorHighlightType.FIELD
+        result.append(Token(tokenType, token.value, token.start, token.end))
+    return result
+
+def Dump(tokens):
+    return [(t.type, t.value, t.start, t.end) for t in tokens]
+
+class TestIgorBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = Schema()
+        self.highlighter = IgorHighlighter()
+
+    def measure(self, fun):
+        start = time.time()
+        count = 0
+        for line in self.lines:
+            count += len(fun(line))
+        return ((time.time() - start) * 1000, count)
+
+    def test_same_tokens(self):
+        tokenizer = IgorTokenizer()
+        for line in self.lines[:200]:
+            self.assertEqual(Dump(LegacyGetTokens(tokenizer, line)), Dump(tokenizer.GetTokens(line)))
+            self.assertEqual(Dump(LegacyGetHighlightingTokens(self.highlighter, line)),
+                             Dump(self.highlighter.GetHighlightingTokens(line)))
+
+    def test_time(self):
+        tokenizer = IgorTokenizer()
+        (legacyTokensTime, legacyCount) = self.measure(lambda line: LegacyGetTokens(tokenizer, line))
+        (scanTime, scanCount) = self.measure(lambda line: tokenizer.Scan(line))
+        (legacyTime, _count) = self.measure(lambda line: LegacyGetHighlightingTokens(self.highlighter, line))
+        (highlightTime, _count) = self.measure(lambda line: self.highlighter.GetHighlightingTokens(line))
+        print "lines: {}, tokens: {}".format(len(self.lines), legacyCount)
+        print "tokens: groupdict loop {:.1f} ms, scan {:.1f} ms".format(legacyTokensTime, scanTime)
+        print "highlighting: legacy {:.1f} ms, lastgroup {:.1f} ms".format(legacyTime, highlightTime)
+        self.assertEqual(legacyCount, scanCount)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import sys
+import gc
+import json
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_token import ErlangTokenizer, IgorTokenizer
+from idn_highlight import ErlangHighlighter, IgorHighlighter
+from idn_erlang_lexer import ErlangLexer
+from idn_headless_stc import HeadlessSTC
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# set to OTP lib dir (e.g. /usr/lib/erlang/lib) to include OTP sources into corpus
+OTP_DIR_ENV = "NOISE_BENCH_OTP_DIR"
+# baseline file, written on first run or when NOISE_BENCH_UPDATE is set
+BASELINE_ENV = "NOISE_BENCH_BASELINE"
+UPDATE_ENV = "NOISE_BENCH_UPDATE"
+# allowed throughput drop against baseline, percents
+MAX_REGRESSION_ENV = "NOISE_BENCH_MAX_REGRESSION"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_MAX_REGRESSION = 25
+MAX_FILES = 300
+# small corpora are repeated up to this count of lines, so measurements are not dominated by noise
+MIN_LINES = 20000
+REPEATS = 5
+
+def Corpus(extensions):
+    dirs = [os.path.join(ROOT, "data", "erlang")]
+    if os.environ.get(OTP_DIR_ENV):
+        dirs.append(os.environ[OTP_DIR_ENV])
+    files = []
+    for d in dirs:
+        for root, dirnames, filenames in os.walk(d):
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1] in extensions:
+                    files.append(os.path.join(root, filename))
+    texts = []
+    for f in files[:MAX_FILES]:
+        with open(f) as fd:
+            texts.append(fd.read())
+    return texts
+
+def Lines(texts):
+    lines = [line for text in texts for line in text.splitlines(True)]
+    if not lines: return lines
+    return lines * (1 + (MIN_LINES - 1) // len(lines))
+
+def Measure(fun, items, countFun = len):
+    """
+    Returns (seconds, tokens, gc tracked objects allocated and kept by results), best of REPEATS runs.
+    """
+    best = None
+    for i in range(REPEATS):
+        gc.collect()
+        gc.disable()
+        try:
+            objects = len(gc.get_objects())
+            start = time.time()
+            results = [fun(item) for item in items]
+            seconds = time.time() - start
+            objects = len(gc.get_objects()) - objects
+        finally:
+            gc.enable()
+        tokens = sum(countFun(result) for result in results)
+        del results
+        if best is None or seconds < best[0]:
+            best = (seconds, tokens, objects)
+    return best
+
+class TestPerfBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.erlangTexts = Corpus({".erl", ".hrl"})
+        self.erlangLines = Lines(self.erlangTexts)
+        self.igorLines = Lines(Corpus({".igor"}))
+        self.results = {}
+
+    def report(self, name, lines, measurement):
+        (seconds, tokens, objects) = measurement
+        seconds = max(seconds, 1e-6)
+        self.results[name] = {"lines_per_sec": lines / seconds, "tokens_per_sec": tokens / seconds,
+                              "objects_per_line": float(objects) / max(lines, 1)}
+        print "{:<24} {:>12.0f} lines/s {:>12.0f} tokens/s {:>8.2f} objects/line".format(name,
+            lines / seconds, tokens / seconds, float(objects) / max(lines, 1))
+
+    def test_throughput(self):
+        erlangTokenizer = ErlangTokenizer()
+        erlangHighlighter = ErlangHighlighter()
+        igorTokenizer = IgorTokenizer()
+        igorHighlighter = IgorHighlighter()
+        self.report("erlang_tokenizer", len(self.erlangLines), Measure(erlangTokenizer.Scan, self.erlangLines))
+        self.report("erlang_highlighter", len(self.erlangLines),
+            Measure(erlangHighlighter.GetHighlightingTokens, self.erlangLines))
+        if self.igorLines:
+            self.report("igor_tokenizer", len(self.igorLines), Measure(igorTokenizer.Scan, self.igorLines))
+            self.report("igor_highlighter", len(self.igorLines),
+                Measure(igorHighlighter.GetHighlightingTokens, self.igorLines))
+        def styleText(stc):
+            lexer = ErlangLexer(stc)
+            lexer.StyleText(0, stc.GetLength())
+            return lexer
+        def tokensCount(lexer):
+            return sum(len(lineData.tokens) for lineData in lexer.linesData if lineData)
+        corpusLines = sum(len(text.splitlines(True)) for text in self.erlangTexts)
+        documents = [HeadlessSTC(text) for text in self.erlangTexts] * (1 + (MIN_LINES - 1) // max(1, corpusLines))
+        lines = sum(document.GetLineCount() for document in documents)
+        self.report("erlang_lexer_style_text", lines, Measure(styleText, documents, tokensCount))
+        self.compareWithBaseline()
+
+    def compareWithBaseline(self):
+        path = os.environ.get(BASELINE_ENV, DEFAULT_BASELINE)
+        maxRegression = float(os.environ.get(MAX_REGRESSION_ENV, DEFAULT_MAX_REGRESSION))
+        if os.environ.get(UPDATE_ENV) or not os.path.isfile(path):
+            with open(path, "w") as f:
+                json.dump(self.results, f, indent = 2, sort_keys = True)
+            print "baseline written to {}".format(path)
+            return
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, result in sorted(self.results.items()):
+            if name not in baseline: continue
+            for metric in ["lines_per_sec", "tokens_per_sec"]:
+                expected = baseline[name][metric]
+                change = 100.0 * (result[metric] - expected) / expected
+                if change < -maxRegression:
+                    regressions.append("{} {}: {:.0f} -> {:.0f} ({:.1f}%)".format(name, metric,
+                        expected, result[metric], change))
+        self.assertFalse(regressions, "throughput regressed more than {}%:\n{}".format(maxRegression,
+            "\n".join(regressions)))
+
+if __name__ == '__main__':
+    unittest.main()
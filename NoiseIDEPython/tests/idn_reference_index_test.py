@@ -0,0 +1,144 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import re
+import sys
+import shutil
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_reference_index import ReferenceIndex, Arity, FUNCTION, RECORD, MACROS, MODULE, ATOM, UNKNOWN
+from idn_highlight import ErlangHighlighter, ErlangHighlightType
+from idn_search import SearchInMappedFile
+
+FILES_COUNT = 300
+
+MOD_A = """-module(mod_a).
+-export([f/1]).
+-include("common.hrl").
+
+f(X) ->
+    R = #state{id = X},
+    ?LOG(R),
+    mod_b:g(X, [1, 2]),
+    lists:map(fun f/1, [X]),
+    f(ok).
+"""
+
+MOD_B = """-module(mod_b).
+-export([g/2]).
+
+g(X, Y) -> {X, Y, ok}.
+"""
+
+COMMON = """-record(state, {id}).
+-define(LOG(X), io:format("~p", [X])).
+"""
+
+def Write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+def Dump(references):
+    return sorted((os.path.basename(r.file), r.line, r.start, r.end, r.type, r.arity, r.module) for r in references)
+
+class TestReferenceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = [os.path.join(self.dir, name) for name in ["mod_a.erl", "mod_b.erl", "common.hrl"]]
+        for path, text in zip(self.files, [MOD_A, MOD_B, COMMON]):
+            Write(path, text)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def build(self, files):
+        index = ReferenceIndex()
+        index.Start(files)
+        while not index.IsReady():
+            time.sleep(0.01)
+        return index
+
+    def test_arity(self):
+        highlighter = ErlangHighlighter()
+        def arity(text, name):
+            tokens = highlighter.GetHighlightingTokens(text)
+            return Arity(tokens, [t.value for t in tokens].index(name))
+        self.assertEqual(0, arity("f() -> ok.", "f"))
+        self.assertEqual(2, arity("g(X, [1, 2]).", "g"))
+        self.assertEqual(1, arity("g([1, 2]).", "g"))
+        self.assertEqual(2, arity("lists:map(fun(X) -> X, Y end, L).", "map"))
+        self.assertEqual(3, arity("-export([h/3]).", "h"))
+        self.assertEqual(UNKNOWN, arity("g(X,", "g"))
+
+    def test_references(self):
+        index = self.build(self.files)
+        F = ErlangHighlightType.FUNCTION
+        self.assertEqual([("mod_a.erl", 7, 10, 11, F, 2, "mod_b"), ("mod_b.erl", 1, 9, 10, F, 2, "mod_b"),
+                          ("mod_b.erl", 3, 0, 1, ErlangHighlightType.FUNDEC, 2, "mod_b")],
+                         Dump(index.References(FUNCTION, "g")))
+        self.assertEqual(4, len(index.References(FUNCTION, "f")))
+        self.assertEqual(["common.hrl", "mod_a.erl"], sorted(set(Dump(index.References(RECORD, "state"))[i][0]
+                                                                 for i in range(2))))
+        self.assertEqual(2, len(index.References(MACROS, "LOG")))
+        self.assertEqual(["mod_a.erl", "mod_b.erl"], [r[0] for r in Dump(index.References(MODULE, "mod_b"))])
+        self.assertEqual(["mod_b.erl"], [r[0] for r in Dump(index.References(ATOM, "ok"))][1:])
+        index.Stop()
+
+    def test_update_and_overrides(self):
+        index = self.build(self.files)
+        Write(self.files[1], MOD_B + "\nh() -> g(1, 2).\n")
+        index.Update([self.files[1]])
+        while not index.IsReady():
+            time.sleep(0.01)
+        self.assertEqual(4, len(index.References(FUNCTION, "g")))
+        overrides = {self.files[0]: "-module(mod_a).\n"}
+        self.assertEqual(["mod_b.erl"] * 3, [r[0] for r in Dump(index.References(FUNCTION, "g", overrides))])
+        index.Remove([self.files[1]])
+        self.assertEqual(["mod_a.erl"], [r[0] for r in Dump(index.References(FUNCTION, "g"))])
+        index.Stop()
+
+    def test_time(self):
+        files = []
+        for i in range(FILES_COUNT):
+            path = os.path.join(self.dir, "gen_{}.erl".format(i))
+            lines = ["-module(gen_{}).".format(i), "-include(\"common.hrl\")."]
+            for j in range(100):
+                lines += ["fun_{0}(#state{{id = Id}} = State) ->".format(j),
+                          "    ?LOG(Id), mod_b:g(Id, State),",
+                          "    lists:map(fun(X) -> gen_{0}:fun_{1}(X) end, [Id]).".format((i + 1) % FILES_COUNT, j)]
+            Write(path, "\n".join(lines) + "\n")
+            files.append(path)
+        files += self.files
+        start = time.time()
+        index = self.build(files)
+        buildTime = (time.time() - start) * 1000
+
+        highlighter = ErlangHighlighter()
+        regexp = re.compile(r"\bmod_b:g\(|\smod_b:g/|^g\(", re.MULTILINE | re.DOTALL)
+        start = time.time()
+        legacy = []
+        for path in files:
+            for result in SearchInMappedFile(path, regexp) or []:
+                tokens = highlighter.GetHighlightingTokens(result.lineText)
+                if any([token.value == "g" and (token.type == ErlangHighlightType.FUNCTION or
+                        (token.type == ErlangHighlightType.FUNDEC and os.path.basename(result.file) == "mod_b.erl"))
+                        for token in tokens]):
+                    legacy.append(result)
+        legacyTime = (time.time() - start) * 1000
+        start = time.time()
+        references = [r for r in index.References(FUNCTION, "g") if r.module == "mod_b"]
+        lookupTime = (time.time() - start) * 1000
+        print "files: {}, index build {:.1f} ms".format(len(files), buildTime)
+        print "references of mod_b:g: regexp + filter {:.1f} ms ({}), index {:.2f} ms ({})".format(legacyTime,
+            len(legacy), lookupTime, len(references))
+        found = set((os.path.basename(r.file), r.line) for r in references)
+        self.assertEqual({("mod_b.erl", 1)}, found - set((os.path.basename(r.file), r.lineNumber) for r in legacy))
+        self.assertEqual(len(legacy) + 1, len(found))
+        index.Stop()
+
+if __name__ == '__main__':
+    unittest.main()
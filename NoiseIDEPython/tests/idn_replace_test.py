@@ -0,0 +1,149 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import re
+import sys
+import shutil
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import idn_replace
+from idn_replace import ReplaceEngine, ComputeEdit, ReadText, WriteFiles, TMP_SUFFIX, BACKUP_SUFFIX
+
+FILES_COUNT = 200
+
+def Regexp(pattern):
+    return re.compile(pattern, re.MULTILINE | re.DOTALL)
+
+def LegacyReplaceInFile(filePath, regexp, replacement):
+    fileText = ReadText(filePath)
+    if regexp.search(fileText):
+        fileText = regexp.sub(replacement, fileText)
+        with open(filePath, "w") as f:
+            f.write(fileText)
+
+class TestReplace(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = []
+        for i in range(FILES_COUNT):
+            path = os.path.join(self.dir, "mod_{}.erl".format(i))
+            with open(path, "w") as f:
+                f.write("-module(mod_{}).\n".format(i))
+                for j in range(100):
+                    f.write("fun_{0}(Id) -> mod_{1}:call(Id).\n".format(j, j % 10))
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def texts(self):
+        return [ReadText(path) for path in self.files]
+
+    def test_same_as_sub(self):
+        text = ReadText(self.files[0])
+        for (pattern, replacement) in [(r"\bmod_1:", "mod_one:"), (r"fun_(\d+)\(", r"f\1("),
+                                       (r"(?P<m>mod_\d+):call", r"\g<m>:cast"), (r"x*", "-"), (r"no_such", "")]:
+            regexp = Regexp(pattern)
+            edit = ComputeEdit(self.files[0], text, regexp, replacement)
+            if edit is None:
+                self.assertEqual(None, regexp.search(text))
+                continue
+            self.assertEqual(regexp.sub(replacement, text), edit.newText)
+            self.assertEqual(len(regexp.findall(text)), len(edit))
+        for (pattern, replacement) in [(r"x*", "-"), (r"x*|d", "-"), (r"(x?)", r"<\1>")]:
+            self.assertEqual(Regexp(pattern).sub(replacement, u"abxd"),
+                             ComputeEdit("a.erl", u"abxd", Regexp(pattern), replacement).newText)
+        edit = ComputeEdit("a.erl", "f() -> a.\ng() -> a.\n", Regexp(r"\ba\b"), "b")
+        self.assertEqual([(7, 8, "b"), (17, 18, "b")], edit.spans)
+        self.assertEqual(["-f() -> a.", "-g() -> a.", "+f() -> b.", "+g() -> b."], edit.Diff()[3:])
+
+    def test_engine_and_write(self):
+        regexp = Regexp(r"\bmod_1:")
+        opened = {self.files[1]: "unsaved() -> mod_1:call().\n"}
+        start = time.time()
+        engine = ReplaceEngine(regexp, "mod_one:", self.files, opened)
+        edits = engine.Edits()
+        computeTime = (time.time() - start) * 1000
+        self.assertEqual(sorted(self.files), [edit.file for edit in edits])
+        self.assertEqual(None, edits[self.files.index(self.files[1])].mtime)
+        start = time.time()
+        self.assertEqual([], WriteFiles(edits))
+        writeTime = (time.time() - start) * 1000
+        print "files: {}, compute {:.1f} ms, write {:.1f} ms".format(FILES_COUNT, computeTime, writeTime)
+        self.assertEqual("unsaved() -> mod_one:call().\n", ReadText(self.files[1]))
+        self.assertTrue(all(["mod_one:call" in text and "mod_1:" not in text for text in self.texts()]))
+        self.assertEqual(sorted(self.files), sorted(os.path.join(self.dir, name) for name in os.listdir(self.dir)))
+
+        legacyDir = os.path.join(self.dir, "legacy")
+        os.makedirs(legacyDir)
+        legacyFiles = []
+        for path in self.files:
+            legacyPath = os.path.join(legacyDir, os.path.basename(path))
+            shutil.copy(path, legacyPath)
+            legacyFiles.append(legacyPath)
+        start = time.time()
+        for path in legacyFiles:
+            LegacyReplaceInFile(path, Regexp(r"fun_(\d+)\("), r"f\1(")
+        legacyTime = (time.time() - start) * 1000
+        start = time.time()
+        self.assertEqual([], WriteFiles(ReplaceEngine(Regexp(r"fun_(\d+)\("), r"f\1(", self.files).Edits()))
+        batchTime = (time.time() - start) * 1000
+        print "search + sub + write per file {:.1f} ms, batch {:.1f} ms".format(legacyTime, batchTime)
+        self.assertEqual([ReadText(path) for path in legacyFiles], self.texts())
+
+    def test_modified_file_aborts(self):
+        before = self.texts()
+        edits = ReplaceEngine(Regexp(r"\bmod_1:"), "mod_one:", self.files).Edits()
+        os.utime(self.files[5], (0, 0))
+        errors = WriteFiles(edits)
+        self.assertEqual([self.files[5]], [filePath for (filePath, e) in errors])
+        self.assertEqual(before, self.texts())
+        self.assertEqual(FILES_COUNT, len(os.listdir(self.dir)))
+
+    def test_rollback(self):
+        before = self.texts()
+        edits = ReplaceEngine(Regexp(r"\bmod_1:"), "mod_one:", self.files).Edits()
+        rename = os.rename
+        calls = []
+        def failingRename(source, target):
+            if source.endswith(TMP_SUFFIX):
+                calls.append(source)
+                if len(calls) == 11:
+                    raise OSError("rename failed")
+            rename(source, target)
+        idn_replace.os.rename = failingRename
+        try:
+            errors = WriteFiles(edits)
+        finally:
+            idn_replace.os.rename = rename
+        self.assertEqual(1, len(errors))
+        self.assertEqual(before, self.texts())
+        self.assertFalse(any([name.endswith((TMP_SUFFIX, BACKUP_SUFFIX)) for name in os.listdir(self.dir)]))
+
+    def test_incomplete_rollback(self):
+        edits = ReplaceEngine(Regexp(r"\bmod_1:"), "mod_one:", self.files).Edits()
+        rename = os.rename
+        calls = []
+        def failingRename(source, target):
+            if source.endswith(TMP_SUFFIX):
+                calls.append(source)
+                if len(calls) == 3:
+                    raise OSError("rename failed")
+            elif source.endswith(BACKUP_SUFFIX) and source.startswith(edits[0].file):
+                raise OSError("restore failed")
+            rename(source, target)
+        idn_replace.os.rename = failingRename
+        try:
+            errors = WriteFiles(edits)
+        finally:
+            idn_replace.os.rename = rename
+        self.assertEqual([edits[2].file, edits[0].file], [filePath for (filePath, e) in errors])
+        self.assertTrue(os.path.isfile(edits[0].file + BACKUP_SUFFIX))
+        self.assertEqual(edits[1].oldText, ReadText(edits[1].file))
+
+if __name__ == '__main__':
+    unittest.main()
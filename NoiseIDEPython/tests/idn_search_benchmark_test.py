@@ -0,0 +1,95 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import re
+import sys
+import shutil
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_search import SearchResult, SearchInText, SearchInMappedFile
+
+FILES_COUNT = 50
+LINES_COUNT = 4000
+REPEATS = 3
+
+def LegacySearchInFile(filePath, regexp):
+    result = []
+    lineNumber = 0
+    f = open(filePath, "r")
+    fileText = f.readlines()
+    f.close()
+    for lineText in fileText:
+        end = 0
+        while True:
+            m = regexp.search(lineText, end)
+            if not m: break
+            start = m.start()
+            end = m.end()
+            result.append(SearchResult(filePath, lineNumber, lineText, start, end))
+        lineNumber += 1
+    return result
+
+def Regexp(pattern):
+    return re.compile(pattern, re.MULTILINE | re.DOTALL)
+
+def Dump(results):
+    return [(r.lineNumber, r.lineText.rstrip("\n"), r.start, r.end) for r in results]
+
+class TestSearchBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = []
+        self.size = 0
+        for i in range(FILES_COUNT):
+            path = os.path.join(self.dir, "mod_{}.erl".format(i))
+            with open(path, "w") as f:
+                f.write("-module(mod_{}).\n".format(i))
+                for j in range(LINES_COUNT / 4):
+                    f.write("fun_{0}(#state{{id = Id}} = State) ->\n".format(j))
+                    f.write("    Text = \"name: ~p\", % comment\n")
+                    f.write("    lists:map(fun(X) -> mod_{0}:call(X) end, [Id]),\n".format(j % 100))
+                    f.write("    ok.\n")
+            self.size += os.path.getsize(path)
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def measure(self, fun, regexp):
+        best = None
+        for i in range(REPEATS):
+            start = time.time()
+            count = sum(len(fun(path, regexp)) for path in self.files)
+            seconds = time.time() - start
+            if best is None or seconds < best:
+                best = seconds
+        return (self.size / 1024.0 / 1024.0 / max(best, 1e-6), count)
+
+    def test_same_results(self):
+        for pattern in [r"\bmod_1:", r"^fun_\d+\(", r"ok\.$", r"#state\b", r"no_such_text"]:
+            regexp = Regexp(pattern)
+            for path in self.files[:3]:
+                self.assertEqual(Dump(LegacySearchInFile(path, regexp)), Dump(SearchInMappedFile(path, regexp)))
+
+    def test_multiline(self):
+        text = "f() ->\n    ok.\ng() ->\n    ok.\n"
+        results = SearchInText("test.erl", text, Regexp(r"->\s+ok\."))
+        self.assertEqual([(0, "f() ->", 4, 14), (2, "g() ->", 4, 14)], Dump(results))
+        self.assertEqual("->\n    ok.", text[4:14])
+
+    def test_throughput(self):
+        print "files: {}, {:.1f} MB".format(FILES_COUNT, self.size / 1024.0 / 1024.0)
+        for pattern in [r"\bmod_1:", r"^fun_\d+\(", r"no_such_text"]:
+            regexp = Regexp(pattern)
+            (legacySpeed, legacyCount) = self.measure(LegacySearchInFile, regexp)
+            (speed, count) = self.measure(SearchInMappedFile, regexp)
+            print "{:<16} per line {:>8.1f} MB/s, whole buffer {:>8.1f} MB/s, {} matches".format(pattern,
+                legacySpeed, speed, count)
+            self.assertEqual(legacyCount, count)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import re
+import sys
+import shutil
+import tempfile
+import time
+from stat import ST_MTIME
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_search_index import SearchIndex, RequiredTrigrams
+from idn_search import SearchInMappedFile
+
+FILES_COUNT = 2000
+
+def Regexp(pattern, matchCase = True, useRegexp = True):
+    flags = re.MULTILINE | re.DOTALL
+    if not useRegexp:
+        pattern = re.escape(pattern)
+    if not matchCase:
+        flags |= re.IGNORECASE
+    return re.compile(pattern, flags)
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cacheDir = os.path.join(self.dir, "cache")
+        os.makedirs(self.cacheDir)
+        self.files = {}
+        for i in range(FILES_COUNT):
+            subDir = os.path.join(self.dir, "apps", "app_{}".format(i % 20), "src")
+            if not os.path.isdir(subDir):
+                os.makedirs(subDir)
+            path = os.path.join(subDir, "mod_{}.erl".format(i))
+            with open(path, "w") as f:
+                f.write("-module(mod_{}).\n-record(state_{}, {{id}}).\n".format(i, i % 50))
+                for j in range(30):
+                    f.write("fun_{0}(Id) -> mod_{1}:call_{2}(#state_{3}{{id = Id}}).\n".format(j, (i * 7) % FILES_COUNT,
+                        j, i % 50))
+            self.files[path] = os.stat(path)[ST_MTIME]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def build(self):
+        index = SearchIndex(self.cacheDir)
+        index.Start(self.files)
+        while not index.IsLoaded() or index.stale:
+            time.sleep(0.01)
+        return index
+
+    def scan(self, regexp, filePaths):
+        return sorted(fp for fp in filePaths if SearchInMappedFile(fp, regexp))
+
+    def test_required_trigrams(self):
+        self.assertEqual([{"foo", "oo_", "o_b", "_ba", "bar"}], RequiredTrigrams(Regexp("foo_bar", useRegexp = False)))
+        self.assertEqual([{"-re", "rec", "eco", "cor", "ord", "rd(", "d(a", "(ab", "abc"}, {"#ab", "abc"}],
+            RequiredTrigrams(Regexp(r"-record\(abc\b|#abc\b")))
+        self.assertEqual([{"abc"}], RequiredTrigrams(Regexp(r"\bABC\b", matchCase = False)))
+        self.assertEqual(None, RequiredTrigrams(Regexp(r"ab|abc")))
+        self.assertEqual(None, RequiredTrigrams(Regexp(r"a.b.c")))
+
+    def test_same_as_scan(self):
+        index = self.build()
+        filePaths = sorted(self.files)
+        for pattern in [r"\bmod_1:", r"-record\(state_7\b|#state_7\b", r"-module\(mod_15\)|\bmod_15:",
+                        r"call_3\(", r"no_such_text", r"fun_1"]:
+            regexp = Regexp(pattern)
+            start = time.time()
+            candidates = index.Filter(regexp, filePaths)
+            filterTime = (time.time() - start) * 1000
+            start = time.time()
+            expected = self.scan(regexp, filePaths)
+            scanTime = (time.time() - start) * 1000
+            found = self.scan(regexp, candidates)
+            print "{:<40} candidates {:>5}/{}, filter {:.1f} ms, full scan {:.1f} ms".format(pattern, len(candidates),
+                len(filePaths), filterTime, scanTime)
+            self.assertEqual(expected, found)
+        index.Stop()
+
+    def test_update_and_persist(self):
+        index = self.build()
+        filePaths = sorted(self.files)
+        path = filePaths[0]
+        regexp = Regexp("brand_new_text", useRegexp = False)
+        self.assertEqual([], index.Filter(regexp, filePaths))
+        with open(path, "a") as f:
+            f.write("brand_new_text() -> ok.\n")
+        index.Update([path])
+        self.assertEqual([path], index.Filter(regexp, filePaths))
+        while index.stale:
+            time.sleep(0.01)
+        self.assertEqual([path], index.Filter(regexp, filePaths))
+        index.Remove([filePaths[1]])
+        self.assertTrue(filePaths[1] in index.Filter(Regexp("mod_1", useRegexp = False), filePaths))
+        index.Stop()
+        self.assertTrue(os.path.isfile(os.path.join(self.cacheDir, SearchIndex.FILE_NAME)))
+
+        self.files[path] = os.stat(path)[ST_MTIME]
+        start = time.time()
+        index = self.build()
+        print "load {} files index: {:.1f} ms".format(FILES_COUNT, (time.time() - start) * 1000)
+        self.assertEqual([path], index.Filter(regexp, filePaths))
+        self.assertEqual(self.scan(Regexp("mod_1\\b"), filePaths), self.scan(Regexp("mod_1\\b"),
+            index.Filter(Regexp("mod_1\\b"), filePaths)))
+        index.Stop()
+
+if __name__ == '__main__':
+    unittest.main()
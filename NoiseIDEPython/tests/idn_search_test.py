@@ -0,0 +1,87 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import re
+import sys
+import shutil
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_search import SearchEngine, SearchInMappedFile
+
+FILES_COUNT = 200
+
+def WalkFiles(path):
+    for root, _, fileNames in os.walk(path):
+        for fileName in fileNames:
+            yield os.path.join(root, fileName)
+
+class TestSearchEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for i in range(FILES_COUNT):
+            subDir = os.path.join(self.dir, "app_{}".format(i % 10))
+            if not os.path.isdir(subDir):
+                os.makedirs(subDir)
+            with open(os.path.join(subDir, "mod_{}.erl".format(i)), "w") as f:
+                for j in range(100):
+                    f.write("fun_{0}(Id) -> io:format(\"~p\", [Id]), target_{1}.\n".format(j, i % 3))
+        self.regexp = re.compile(r"target_1")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_engine(self, engine):
+        engine.Start()
+        done = []
+        while engine.IsActive():
+            done += engine.PopDone()
+            time.sleep(0.001)
+        engine.Wait()
+        return dict(done + engine.PopDone())
+
+    def test_same_results(self):
+        start = time.time()
+        expected = {}
+        for filePath in WalkFiles(self.dir):
+            result = SearchInMappedFile(filePath, self.regexp)
+            if result:
+                expected[filePath] = result
+        serialTime = (time.time() - start) * 1000
+        start = time.time()
+        engine = SearchEngine(self.regexp, WalkFiles(self.dir))
+        results = self.run_engine(engine)
+        engineTime = (time.time() - start) * 1000
+        print "files: {}, serial {:.1f} ms, engine {:.1f} ms".format(FILES_COUNT, serialTime, engineTime)
+        self.assertEqual(sorted(expected), sorted(results))
+        for filePath in expected:
+            self.assertEqual([(r.lineNumber, r.start, r.end) for r in expected[filePath]],
+                             [(r.lineNumber, r.start, r.end) for r in results[filePath]])
+        self.assertEqual((FILES_COUNT, FILES_COUNT, sum(len(r) for r in expected.values())), engine.Progress())
+
+    def test_opened_texts(self):
+        filePath = os.path.join(self.dir, "app_0", "mod_0.erl")
+        engine = SearchEngine(self.regexp, [filePath], {filePath: "first() -> ok.\nsecond() -> target_1."})
+        results = self.run_engine(engine)
+        self.assertEqual([(1, 12, 20)], [(r.lineNumber, r.start, r.end) for r in results[filePath]])
+
+    def test_cancel(self):
+        engine = SearchEngine(self.regexp, WalkFiles(self.dir))
+        engine.Cancel()
+        engine.Start()
+        engine.Wait()
+        self.assertFalse(engine.IsActive())
+        (scanned, _total, _matches) = engine.Progress()
+        self.assertEqual(0, scanned)
+
+    def test_errors(self):
+        missing = os.path.join(self.dir, "missing.erl")
+        engine = SearchEngine(self.regexp, [missing])
+        self.assertEqual({}, self.run_engine(engine))
+        self.assertEqual([missing], [filePath for (filePath, e) in engine.PopErrors()])
+
+if __name__ == '__main__':
+    unittest.main()
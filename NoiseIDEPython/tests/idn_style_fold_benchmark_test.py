@@ -0,0 +1,117 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_lexer import STC_FOLDLEVELHEADERFLAG, STC_FOLDLEVELBASE
+from idn_erlang_lexer import ErlangLexer
+from idn_headless_stc import HeadlessSTC
+from idn_highlight import ErlangHighlightType
+
+LINES_COUNT = 10000
+
+class CountingSTC(HeadlessSTC):
+    def __init__(self, text):
+        self.foldWrites = 0
+        HeadlessSTC.__init__(self, text)
+
+    def SetFoldLevel(self, line, level):
+        self.foldWrites += 1
+        HeadlessSTC.SetFoldLevel(self, line, level)
+
+def Module():
+    lines = ["-module(bench).", "-export([fun_0/2]).", "", "-record(state, {id, name = \"\" :: string()}).", ""]
+    i = 0
+    while len(lines) < LINES_COUNT:
+        lines += ["-spec fun_{0}(integer(), #state{{}}) -> ok.".format(i),
+                  "fun_{0}(Id, State = #state{{name = Name}}) when Id > 0 ->".format(i),
+                  "    Text = \"name: ~p\", % comment",
+                  "    io:format(Text, [Name]),",
+                  "    fun_{0}(Id - 1, State#state{{id = Id}});".format(i),
+                  "fun_{0}(_, _) ->".format(i),
+                  "    ok.",
+                  ""]
+        i += 1
+    return "\n".join(lines[:LINES_COUNT])
+
+def LegacyDoFold(lexer, startPos, endPos):
+    stc = lexer.stc
+    startLine = stc.LineFromPosition(startPos) - 1
+    endLine = stc.LineFromPosition(endPos)
+    prevFoldLevel = 0
+    if startLine > 0:
+        prevFoldLevel = stc.GetFoldLevel(startLine - 1)
+    nextLineFoldLevel = prevFoldLevel
+    if prevFoldLevel ^ STC_FOLDLEVELHEADERFLAG == STC_FOLDLEVELBASE:
+        nextLineFoldLevel = STC_FOLDLEVELBASE + 1
+    elif prevFoldLevel == STC_FOLDLEVELBASE + 2:
+        nextLineFoldLevel = 0
+    while startLine <= endLine:
+        currentLineFoldLevel = nextLineFoldLevel
+        tokens = lexer.highlighter.GetHighlightingTokens(stc.GetLine(startLine))
+        for token in tokens:
+            if (token.type in {ErlangHighlightType.FUNDEC, ErlangHighlightType.RECORDDEF}
+                or token.value == "-spec"):
+                currentLineFoldLevel = STC_FOLDLEVELBASE
+                nextLineFoldLevel = STC_FOLDLEVELBASE  + 1
+            elif token.type == ErlangHighlightType.FULLSTOP:
+                if currentLineFoldLevel ==  STC_FOLDLEVELBASE  + 1:
+                    currentLineFoldLevel = STC_FOLDLEVELBASE  + 2
+                elif currentLineFoldLevel == STC_FOLDLEVELBASE:
+                    currentLineFoldLevel = 0
+                    if prevFoldLevel == STC_FOLDLEVELHEADERFLAG | STC_FOLDLEVELBASE:
+                        stc.SetFoldLevel(startLine - 1, 0)
+                nextLineFoldLevel = 0
+        if currentLineFoldLevel == STC_FOLDLEVELBASE:
+            currentLineFoldLevel |= STC_FOLDLEVELHEADERFLAG
+        if (currentLineFoldLevel == STC_FOLDLEVELHEADERFLAG | STC_FOLDLEVELBASE and
+            currentLineFoldLevel == prevFoldLevel):
+            stc.SetFoldLevel(startLine - 1, 0)
+        prevFoldLevel = currentLineFoldLevel
+        stc.SetFoldLevel(startLine, currentLineFoldLevel)
+        startLine += 1
+
+class TestStyleFoldBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.text = Module()
+
+    def measure(self, styleEvent):
+        """
+        Returns ms of first style event over whole module, ms of style event after typing and fold writes of the latter.
+        """
+        doc = CountingSTC(self.text)
+        lexer = ErlangLexer(doc)
+        doc.lexer = lexer
+        start = time.time()
+        styleEvent(lexer, 0, doc.GetLength())
+        fullTime = (time.time() - start) * 1000
+        line = LINES_COUNT / 2
+        pos = doc.PositionFromLine(line)
+        doc.InsertText(pos, "    ")
+        doc.foldWrites = 0
+        start = time.time()
+        styleEvent(lexer, pos, doc.GetLineEndPosition(line))
+        editTime = (time.time() - start) * 1000
+        return (fullTime, editTime, doc.foldWrites, [doc.GetFoldLevel(l) for l in xrange(doc.GetLineCount())])
+
+    def test_time(self):
+        def legacy(lexer, startPos, endPos):
+            lexer.StyleText(startPos, endPos)
+            LegacyDoFold(lexer, startPos, endPos)
+        def combined(lexer, startPos, endPos):
+            endLine = lexer.StyleText(startPos, endPos)
+            lexer.FoldLines(lexer.stc.LineFromPosition(startPos) - 1, endLine)
+        (legacyFull, legacyEdit, legacyWrites, legacyLevels) = self.measure(legacy)
+        (full, edit, writes, levels) = self.measure(combined)
+        print "lines: {}".format(LINES_COUNT)
+        print "style + fold: full {:.1f} ms, edit {:.2f} ms, {} fold writes".format(legacyFull, legacyEdit, legacyWrites)
+        print "combined pass: full {:.1f} ms, edit {:.2f} ms, {} fold writes".format(full, edit, writes)
+        self.assertEqual(legacyLevels, levels)
+        self.assertTrue(writes <= legacyWrites)
+
+if __name__ == '__main__':
+    unittest.main()
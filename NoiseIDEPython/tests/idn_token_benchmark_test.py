@@ -0,0 +1,95 @@
+__author__ = 'Yaroslav Nikityshev aka IDNoise'
+
+import unittest
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idn_token import Token, ErlangTokenizer
+from idn_highlight import ErlangHighlighter, LineTokenCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# set to OTP lib dir (e.g. /usr/lib/erlang/lib) to include OTP sources into corpus
+OTP_DIR_ENV = "NOISE_BENCH_OTP_DIR"
+MAX_FILES = 300
+
+def Corpus():
+    dirs = [os.path.join(ROOT, "data", "erlang")]
+    if os.environ.get(OTP_DIR_ENV):
+        dirs.append(os.environ[OTP_DIR_ENV])
+    files = []
+    for d in dirs:
+        for root, dirnames, filenames in os.walk(d):
+            for filename in filenames:
+                if filename.endswith(".erl") or filename.endswith(".hrl"):
+                    files.append(os.path.join(root, filename))
+    lines = []
+    for f in files[:MAX_FILES]:
+        with open(f) as fd:
+            lines += fd.read().splitlines(True)
+    return lines
+
+def LegacyGetTokens(tokenizer, text):
+    tokens = []
+    pos = 0
+    while True:
+        m = tokenizer.tokenRegexp.search(text, pos)
+        if not m: break
+        type = m.lastgroup
+        value = m.group(type)
+        pos = m.end()
+        tokens.append(Token(type, value, m.start(), m.end()))
+    return tokens
+
+class TestTokenizerBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = Corpus()
+        self.tokenizer = ErlangTokenizer()
+
+    def measure(self, fun):
+        start = time.time()
+        count = 0
+        for line in self.lines:
+            count += len(fun(line))
+        return ((time.time() - start) * 1000, count)
+
+    def test_same_tokens(self):
+        for line in self.lines:
+            legacy = [(t.type, t.start, t.end) for t in LegacyGetTokens(self.tokenizer, line)]
+            self.assertEqual(legacy, self.tokenizer.Scan(line))
+
+    def test_time(self):
+        (legacyTime, legacyCount) = self.measure(lambda line: LegacyGetTokens(self.tokenizer, line))
+        (scanTime, scanCount) = self.measure(lambda line: self.tokenizer.Scan(line))
+        (skipTime, skipCount) = self.measure(lambda line: self.tokenizer.Scan(line, skipSpace = True))
+        (tokensTime, _count) = self.measure(lambda line: self.tokenizer.GetTokens(line))
+        highlighter = ErlangHighlighter()
+        (highlightTime, _count) = self.measure(lambda line: highlighter.GetHighlightingTokens(line))
+        print "lines: {}, tokens: {} ({} without spaces)".format(len(self.lines), legacyCount, skipCount)
+        print "legacy search loop: {:.1f} ms".format(legacyTime)
+        print "scan: {:.1f} ms, scan without spaces: {:.1f} ms, tokens: {:.1f} ms, highlighting: {:.1f} ms".format(
+            scanTime, skipTime, tokensTime, highlightTime)
+        self.assertEqual(legacyCount, scanCount)
+
+    def test_line_token_cache(self):
+        cache = LineTokenCache(ErlangHighlighter())
+        cache.Invalidate(0)
+        hot = "f(X) -> X.\n"
+        cache.Tokens(hot)
+        for i in range(2 * LineTokenCache.EXTRA_ENTRIES):
+            cache.Tokens("f_{}(X) -> X.\n".format(i))
+            cache.Tokens(hot)
+        (hits, misses, size) = cache.Stats()
+        self.assertEqual((2 * LineTokenCache.EXTRA_ENTRIES, 2 * LineTokenCache.EXTRA_ENTRIES + 1,
+                          LineTokenCache.EXTRA_ENTRIES), (hits, misses, size))
+        self.assertTrue(hot in cache.entries)
+        self.assertFalse("f_0(X) -> X.\n" in cache.entries)
+        self.assertEqual(["f_{}(X) -> X.\n".format(2 * LineTokenCache.EXTRA_ENTRIES - 1), hot],
+                         cache.entries.keys()[-2:])
+        cache.Invalidate(100)
+        self.assertEqual(LineTokenCache.EXTRA_ENTRIES, len(cache.entries))
+
+if __name__ == '__main__':
+    unittest.main()